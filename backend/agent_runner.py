@@ -1,38 +1,267 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import functools
 import logging
 import os
-from typing import Any, Callable, Awaitable
+import weakref
+from typing import Any, Awaitable, Callable, Mapping, Sequence
 
 import anthropic
+import httpx
+import orjson
+
+from llm_cache import DEFAULT_TTL, CacheBackend, default_cache, make_cache_key
 
 logger = logging.getLogger(__name__)
 
-client = anthropic.Anthropic(max_retries=5)
+# AsyncAnthropic clients keyed by event loop — each Celery task runs its own
+# asyncio.run() loop and pooled connections cannot be shared across loops
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, anthropic.AsyncAnthropic] = weakref.WeakKeyDictionary()
 
 MODEL = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-6")
+COMPACTION_MODEL = "claude-haiku-4-5-20251001"
+
+COMPACTION_PROMPT = """\
+Summarize the earlier part of an AI agent's tool-use session below so the agent can continue without it.
+Keep every fact needed to carry on: actions taken and their outcomes, IDs, URLs, selectors, file paths,
+screens or items already covered, and any errors. Omit raw page dumps and repeated content.
+Return plain text only, at most 300 words."""
+
+
+# USD per million tokens: (input, output)
+_PRICING: dict[str, tuple[float, float]] = {
+    "claude-sonnet-4-6": (3.0, 15.0),
+    "claude-sonnet-4-5-20241022": (3.0, 15.0),
+    "claude-haiku-4-5-20251001": (0.80, 4.0),
+}
+
+
+@functools.lru_cache(maxsize=32)
+def calc_cost(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+) -> float:
+    """Calculate USD cost based on model pricing (per million tokens).
+
+    Prompt-cache reads bill at 0.1x the input rate and cache writes at 1.25x.
+    """
+    input_rate, output_rate = _PRICING.get(model, (3.0, 15.0))
+    input_cost = (input_tokens + cache_read_tokens * 0.1 + cache_write_tokens * 1.25) * input_rate
+    return (input_cost + output_tokens * output_rate) / 1_000_000
+
+
+def _dumps(obj: Any) -> str:
+    """Serialize obj to compact JSON via orjson (the API expects str, not bytes)."""
+    return orjson.dumps(obj).decode()
+
+
+def _dump_model(obj: Any) -> Any:
+    """orjson fallback for SDK content blocks stored in the message history."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError
+
+
+async def _compact_history(
+    messages: list[dict[str, Any]],
+    keep_last: int = 4,
+) -> tuple[list[dict[str, Any]], Any] | None:
+    """Replace the middle of a long history with a short summary.
+
+    The first three messages (task, first assistant turn, its tool results)
+    and the last keep_last are kept verbatim; everything between is
+    summarized by a Haiku call and appended as a text block to the third
+    message, so tool_use/tool_result pairing and role alternation stay valid.
+    Returns (compacted_messages, usage) or None if there is nothing to compact
+    or the summary call fails.
+    """
+    middle = messages[3:-keep_last]
+    if not middle:
+        return None
+    history = orjson.dumps(middle, default=_dump_model).decode()[:60_000]
+    try:
+        response = await _get_async_client().messages.create(
+            model=COMPACTION_MODEL,
+            max_tokens=1024,
+            temperature=0,
+            system=COMPACTION_PROMPT,
+            messages=[{"role": "user", "content": history}],
+        )
+    except anthropic.APIError:
+        logger.warning("History compaction failed, keeping full history", exc_info=True)
+        return None
+
+    summary = "".join(block.text for block in response.content if block.type == "text")
+    anchor = messages[2]
+    anchor_content = anchor["content"] if isinstance(anchor["content"], list) else [{"type": "text", "text": anchor["content"]}]
+    compacted = messages[:2] + [{
+        **anchor,
+        "content": anchor_content + [{"type": "text", "text": f"[Summary of {len(middle)} earlier messages]\n{summary}"}],
+    }] + messages[-keep_last:]
+    return compacted, response.usage
+
+
+def _truncated_json(obj: Any, limit: int | None) -> str:
+    """Serialize obj once and trim it to limit characters (no trim when None)."""
+    text = _dumps(obj)
+    return text if limit is None else text[:limit]
+
+
+def _cached_system(system_prompt: str) -> list[dict[str, Any]]:
+    """Wrap the system prompt as a text block with a prompt-cache breakpoint."""
+    return [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+
 
+def _cached_tools(tools: Sequence[Mapping[str, Any]]) -> list[dict[str, Any]]:
+    """Return plain-dict copies of tools with a prompt-cache breakpoint on the last one.
 
-def calc_cost(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calculate USD cost based on model pricing (per million tokens)."""
-    PRICING = {
-        "claude-sonnet-4-6": {"input": 3.0, "output": 15.0},
-        "claude-sonnet-4-5-20241022": {"input": 3.0, "output": 15.0},
-        "claude-haiku-4-5-20251001": {"input": 0.80, "output": 4.0},
+    Accepts frozen definitions (e.g. a tuple of MappingProxyType) shared by
+    concurrent runs; only the outer dicts are copied.
+    """
+    if not tools:
+        return []
+    return [dict(t) for t in tools[:-1]] + [{**tools[-1], "cache_control": {"type": "ephemeral"}}]
+
+
+# Static request prefix per (model, system prompt, tools object), built once per
+# process: agents pass module-level prompts and tool lists, so every run after
+# the first reuses the wrapped blocks and their cache-key digest. Entries keep
+# a reference to tools so its id() cannot be recycled by another object.
+_static_prefixes: dict[tuple[str, str, int], tuple[Any, list, list, str]] = {}
+
+
+def _static_prefix(
+    model: str, system_prompt: str, tools: Sequence[Mapping[str, Any]],
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]], str]:
+    """Return (cached_system, cached_tools, digest) for a run's fixed request prefix."""
+    key = (model, system_prompt, id(tools))
+    entry = _static_prefixes.get(key)
+    if entry is None:
+        if len(_static_prefixes) >= 64:  # callers building tools per run
+            _static_prefixes.clear()
+        cached_system = _cached_system(system_prompt)
+        cached_tools = _cached_tools(tools)
+        digest = make_cache_key({
+            "model": model, "max_tokens": 4096, "system": cached_system, "tools": cached_tools,
+        })
+        entry = _static_prefixes[key] = (tools, cached_system, cached_tools, digest)
+    return entry[1], entry[2], entry[3]
+
+
+def _with_cache_breakpoint(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Return messages with a cache breakpoint on the newest user turn.
+
+    Only the outgoing copy is marked, so the breakpoint rolls forward each turn
+    and the request never exceeds Anthropic's four-breakpoint limit.
+    """
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    else:
+        blocks = list(content)
+    if not blocks:
+        return messages
+    blocks[-1] = {**blocks[-1], "cache_control": {"type": "ephemeral"}}
+    return messages[:-1] + [{**last, "content": blocks}]
+
+
+def _build_request(
+    model: str,
+    system: list[dict[str, Any]],
+    tools: list[dict[str, Any]],
+    messages: list[dict[str, Any]],
+    tool_choice: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """Build the messages.create kwargs for one agent turn."""
+    request = {
+        "model": model,
+        "max_tokens": 4096,
+        "system": system,
+        "tools": tools,
+        "messages": _with_cache_breakpoint(messages),
     }
-    rates = PRICING.get(model, {"input": 3.0, "output": 15.0})
-    return (input_tokens * rates["input"] + output_tokens * rates["output"]) / 1_000_000
+    if tool_choice is not None:
+        request["tool_choice"] = tool_choice
+    return request
+
+
+def _get_async_client() -> anthropic.AsyncAnthropic:
+    """Return the AsyncAnthropic client bound to the running event loop.
+
+    Calls never block the loop, and keep-alive connections are reused across
+    turns and across concurrent agent loops in the same task.
+    """
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = _async_clients[loop] = anthropic.AsyncAnthropic(
+            max_retries=5,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            ),
+        )
+    return async_client
+
+
+async def _stream_turn(
+    request: dict[str, Any],
+    start_tool: Callable[[Any], asyncio.Task],
+) -> tuple[anthropic.types.Message, dict[str, asyncio.Task]]:
+    """Stream one model turn, starting each tool call as soon as its block completes.
+
+    Tools run while the rest of the turn is still generating, so a turn costs
+    roughly max(generation, tool time) instead of their sum. Returns the final
+    message and the started tool tasks keyed by tool_use id.
+    """
+    tasks: dict[str, asyncio.Task] = {}
+    try:
+        async with _get_async_client().messages.stream(**request) as stream:
+            async for event in stream:
+                if event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                    tasks[event.content_block.id] = start_tool(event.content_block)
+            response = await stream.get_final_message()
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return response, tasks
+
+
+def stalled_after(progress: Callable[[], Any], turns: int = 3) -> Callable[[], bool]:
+    """Build a stop_when predicate that fires once progress() is unchanged for `turns` tool turns."""
+    last = progress()
+    stale = 0
+
+    def _stalled() -> bool:
+        nonlocal last, stale
+        current = progress()
+        stale = 0 if current != last else stale + 1
+        last = current
+        return stale >= turns
+
+    return _stalled
 
 
 async def run_agent_loop(
     system_prompt: str,
-    tools: list[dict[str, Any]],
+    tools: Sequence[Mapping[str, Any]],
     tool_executor: Callable[[str, dict[str, Any]], Awaitable[Any]],
     user_message: str,
     max_turns: int = 15,
     model: str | None = None,
     verbose: bool = False,
+    max_parallel_tools: int = 5,
+    cache: CacheBackend | None = None,
+    first_response: anthropic.types.Message | None = None,
+    compaction_threshold: int | None = 20,
+    speculative_tools: frozenset[str] = frozenset(),
+    stop_when: Callable[[], bool] | None = None,
+    token_budget: int | None = None,
 ) -> dict[str, Any]:
     """Shared agentic loop: send messages -> check for tool_use -> execute -> feed back -> repeat.
 
@@ -44,6 +273,22 @@ async def run_agent_loop(
         max_turns: Safety limit to prevent infinite loops.
         model: Override model (defaults to CLAUDE_MODEL env var / claude-sonnet-4-6).
         verbose: If True, log full input prompt, agent text, and tool results without trimming.
+        max_parallel_tools: Max tool calls from a single turn that may run concurrently.
+        cache: Response cache for deterministic replay (defaults to LLM_CACHE_BACKEND).
+        first_response: Pre-fetched turn-1 response (from the Message Batches API);
+            the loop starts by acting on it instead of calling the model.
+        compaction_threshold: Once the history exceeds this many messages, its middle
+            is summarized to keep per-turn input linear (None disables).
+        speculative_tools: Idempotent, side-effect-free tool names that may be
+            re-run speculatively while the next turn generates. Any other tool
+            call discards the speculative results.
+        stop_when: Checked after each tool turn; once it returns True the next
+            turn is sent with tool_choice "none", so the model must answer in
+            text and the loop ends.
+        token_budget: Cumulative input tokens (uncached, cache reads and
+            cache writes) after which the run wraps up the same way as
+            stop_when. Each turn re-sends the whole history, so a stalled run
+            otherwise keeps paying for its transcript until max_turns.
 
     Returns:
         Dict with 'text' (final response) and 'usage' (token tracking).
@@ -52,6 +297,55 @@ async def run_agent_loop(
     messages: list[dict[str, Any]] = [{"role": "user", "content": user_message}]
     total_input_tokens = 0
     total_output_tokens = 0
+    total_cache_read_tokens = 0
+    total_cache_write_tokens = 0
+    # System prompt and tool schema are fixed: serialized and hashed once per
+    # process, so each turn's cache key only encodes the message history
+    cached_system, cached_tools, static_digest = _static_prefix(use_model, system_prompt, tools)
+    tool_semaphore = asyncio.Semaphore(max_parallel_tools)
+    cache = cache if cache is not None else default_cache()
+    # Off-model cost: negative for batch discounts, positive for compaction calls
+    cost_adjustment = 0.0
+    compactions = 0
+    wrap_up = False
+
+    # Pre-fired read-only tool calls keyed by (name, input), valid until a
+    # tool outside speculative_tools runs
+    speculative: dict[tuple, asyncio.Task] = {}
+
+    async def _run_tool(name: str, input: dict[str, Any]) -> Any:
+        async with tool_semaphore:
+            return await tool_executor(name, input)
+
+    def _discard_speculative() -> None:
+        for task in speculative.values():
+            task.cancel()
+        speculative.clear()
+
+    def _usage() -> dict[str, Any]:
+        return {
+            "model": use_model,
+            "input_tokens": total_input_tokens,
+            "output_tokens": total_output_tokens,
+            "cache_read_input_tokens": total_cache_read_tokens,
+            "cache_creation_input_tokens": total_cache_write_tokens,
+            "cost_usd": calc_cost(
+                use_model, total_input_tokens, total_output_tokens,
+                total_cache_read_tokens, total_cache_write_tokens,
+            ) + cost_adjustment,
+            "compactions": compactions,
+        }
+
+    def _start_tool(block: Any) -> asyncio.Task:
+        logger.info("  Tool call: %s(%s)", block.name, _truncated_json(block.input, None if verbose else 200))
+        if block.name not in speculative_tools:
+            _discard_speculative()
+        else:
+            task = speculative.pop((block.name, tuple(sorted(block.input.items()))), None)
+            if task is not None:
+                logger.info("  Tool %s served from speculative pre-execution", block.name)
+                return task
+        return asyncio.create_task(_run_tool(block.name, block.input))
 
     if verbose:
         logger.info("Agent start: model=%s, max_turns=%d, prompt=\n%s", use_model, max_turns, user_message)
@@ -59,73 +353,214 @@ async def run_agent_loop(
         logger.info("Agent start: model=%s, max_turns=%d, prompt=%s", use_model, max_turns, user_message[:300])
 
     for turn in range(max_turns):
-        response = client.messages.create(
-            model=use_model,
-            max_tokens=4096,
-            system=system_prompt,
-            tools=tools,
-            messages=messages,
+        request = _build_request(
+            use_model, cached_system, cached_tools, messages,
+            tool_choice={"type": "none"} if wrap_up else None,
         )
+        tool_tasks: dict[str, asyncio.Task] = {}
+        batched = turn == 0 and first_response is not None
+        # Tool results are part of the key, so a replayed turn only hits when
+        # every earlier tool call returned the same output as the recorded run
+        cache_key = (
+            make_cache_key({
+                "static": static_digest,
+                "messages": request["messages"],
+                "tool_choice": request.get("tool_choice"),
+            })
+            if cache is not None and not batched else None
+        )
+        cached = await cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            response = anthropic.types.Message.model_validate_json(cached)
+            logger.info("Agent turn %d: stop_reason=%s, LLM cache hit", turn + 1, response.stop_reason)
+        else:
+            if batched:
+                # Batch API results bill at half the standard rate
+                response = first_response
+                cost_adjustment -= 0.5 * calc_cost(
+                    use_model, response.usage.input_tokens, response.usage.output_tokens,
+                    response.usage.cache_read_input_tokens or 0, response.usage.cache_creation_input_tokens or 0,
+                )
+            else:
+                response, tool_tasks = await _stream_turn(request, _start_tool)
+            if cache_key:
+                await cache.set(cache_key, response.model_dump_json(), DEFAULT_TTL)
+            total_input_tokens += response.usage.input_tokens
+            total_output_tokens += response.usage.output_tokens
+            total_cache_read_tokens += response.usage.cache_read_input_tokens or 0
+            total_cache_write_tokens += response.usage.cache_creation_input_tokens or 0
+            logger.info(
+                "Agent turn %d: stop_reason=%s, tokens=%d/%d, cache_read=%d, cache_write=%d",
+                turn + 1, response.stop_reason, response.usage.input_tokens, response.usage.output_tokens,
+                response.usage.cache_read_input_tokens or 0, response.usage.cache_creation_input_tokens or 0,
+            )
 
-        total_input_tokens += response.usage.input_tokens
-        total_output_tokens += response.usage.output_tokens
-        logger.info("Agent turn %d: stop_reason=%s, tokens=%d/%d", turn + 1, response.stop_reason, response.usage.input_tokens, response.usage.output_tokens)
-
-        # Log any text the agent produced this turn (thinking/reasoning between tool calls)
+        # Single pass over the turn: log and collect text (thinking/reasoning
+        # between tool calls) and gather the tool_use blocks
+        text_parts: list[str] = []
+        tool_blocks: list[Any] = []
         for block in response.content:
-            if hasattr(block, "text") and block.text:
-                logger.info("  Agent text: %s", block.text if verbose else block.text[:300])
+            if block.type == "text":
+                text_parts.append(block.text)
+                if block.text:
+                    logger.info("  Agent text: %s", block.text if verbose else block.text[:300])
+            elif block.type == "tool_use":
+                tool_blocks.append(block)
 
         # If the model wants to use tools, execute them and continue
         if response.stop_reason == "tool_use":
             # Append the assistant's response (includes tool_use blocks)
             messages.append({"role": "assistant", "content": response.content})
 
-            # Execute each tool call and collect results
+            # Tool calls already started while streaming; start any others (e.g.
+            # on a cache hit), then collect results in the original block order
+            # so tool_use_id correlation is preserved
+            for block in tool_blocks:
+                if block.id not in tool_tasks:
+                    tool_tasks[block.id] = _start_tool(block)
+            raw_results = await asyncio.gather(
+                *(tool_tasks[block.id] for block in tool_blocks),
+                return_exceptions=True,
+            )
+
             tool_results = []
-            for block in response.content:
-                if block.type == "tool_use":
-                    logger.info("  Tool call: %s(%s)", block.name, json.dumps(block.input) if verbose else json.dumps(block.input)[:200])
-                    try:
-                        result = await tool_executor(block.name, block.input)
-                        result_str = json.dumps(result) if not isinstance(result, str) else result
-                        logger.info("  Tool result: %s -> %s", block.name, result_str if verbose else result_str[:300])
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": result_str,
-                        })
-                    except Exception as e:
-                        logger.exception("Tool %s failed", block.name)
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": json.dumps({"error": str(e)}),
-                            "is_error": True,
-                        })
+            for block, result in zip(tool_blocks, raw_results):
+                if isinstance(result, BaseException):
+                    if not isinstance(result, Exception):
+                        raise result
+                    logger.error("Tool %s failed", block.name, exc_info=result)
+                    tool_results.append({
+                        "type": "tool_result",
+                        "tool_use_id": block.id,
+                        "content": _dumps({"error": str(result)}),
+                        "is_error": True,
+                    })
+                    continue
+                result_str = result if isinstance(result, str) else _dumps(result)
+                logger.info("  Tool result: %s -> %s", block.name, result_str if verbose else result_str[:300])
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": block.id,
+                    "content": result_str,
+                })
 
             messages.append({"role": "user", "content": tool_results})
+
+            if compaction_threshold and len(messages) > compaction_threshold:
+                compacted = await _compact_history(messages)
+                if compacted is not None:
+                    before = len(messages)
+                    messages, compaction_usage = compacted
+                    compactions += 1
+                    cost_adjustment += calc_cost(
+                        COMPACTION_MODEL, compaction_usage.input_tokens, compaction_usage.output_tokens,
+                    )
+                    logger.info("  History compacted: %d -> %d messages", before, len(messages))
+
+            input_seen = total_input_tokens + total_cache_read_tokens + total_cache_write_tokens
+            if token_budget is not None and input_seen >= token_budget:
+                logger.info("  Token budget spent (%d/%d) — requesting final answer without tools", input_seen, token_budget)
+                wrap_up = True
+                _discard_speculative()
+                continue
+
+            if stop_when is not None and stop_when():
+                logger.info("  Stop condition met — requesting final answer without tools")
+                wrap_up = True
+                _discard_speculative()
+                continue
+
+            # Re-fire this turn's read-only calls so the likely repeat in the
+            # next turn overlaps with generation instead of following it
+            _discard_speculative()
+            for block in tool_blocks:
+                key = (block.name, tuple(sorted(block.input.items())))
+                if block.name in speculative_tools and key not in speculative:
+                    task = asyncio.create_task(_run_tool(block.name, block.input))
+                    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                    speculative[key] = task
             continue
 
+        # Turn ended without tool_use (e.g. max_tokens) — drop tools started mid-stream
+        for task in tool_tasks.values():
+            task.cancel()
+        _discard_speculative()
+
         # end_turn or max_tokens — extract final text and return
-        text_parts = [block.text for block in response.content if hasattr(block, "text")]
-        usage = {
-            "model": use_model,
-            "input_tokens": total_input_tokens,
-            "output_tokens": total_output_tokens,
-            "cost_usd": calc_cost(use_model, total_input_tokens, total_output_tokens),
-        }
+        usage = _usage()
         text = "\n".join(text_parts) if text_parts else ""
         logger.info("Agent done: turns=%d, tokens=%d/%d, response=%s", turn + 1, total_input_tokens, total_output_tokens, text if verbose else text[:200])
         return {"text": text, "usage": usage}
 
     # Safety: if we hit max_turns, return whatever we have
+    _discard_speculative()
     last_prompt = str(messages[-1].get("content", "")) if verbose else (str(messages[-1].get("content", ""))[:200] if messages else "")
     logger.warning("Agent hit max_turns (%d) safety limit, last_prompt=%s", max_turns, last_prompt)
-    usage = {
-        "model": use_model,
-        "input_tokens": total_input_tokens,
-        "output_tokens": total_output_tokens,
-        "cost_usd": calc_cost(use_model, total_input_tokens, total_output_tokens),
-    }
+    usage = _usage()
     return {"text": "Agent reached maximum number of turns without completing.", "usage": usage}
+
+
+async def run_agent_loops_batched(
+    system_prompt: str,
+    tools: Sequence[Mapping[str, Any]],
+    tool_executor: Callable[[str, dict[str, Any]], Awaitable[Any]],
+    user_messages: list[str],
+    max_turns: int = 15,
+    model: str | None = None,
+    max_concurrent_loops: int = 5,
+    poll_interval_s: float = 20.0,
+) -> list[dict[str, Any]]:
+    """Run many independent agent loops, sending turn 1 through the Message Batches API.
+
+    Batch requests cost half the standard rate but complete asynchronously
+    (minutes to hours), so this suits offline bulk work such as nightly
+    crawls — not interactive runs. Only the first turn can be batched: every
+    later turn depends on tool results, so each conversation then resumes
+    live via run_agent_loop, at most max_concurrent_loops at a time.
+
+    Returns one run_agent_loop result per user message, in input order.
+    """
+    use_model = model or MODEL
+    async_client = _get_async_client()
+    cached_system, cached_tools, _ = _static_prefix(use_model, system_prompt, tools)
+
+    batch = await async_client.messages.batches.create(
+        requests=[
+            {
+                "custom_id": f"loop-{i}",
+                "params": _build_request(
+                    use_model, cached_system, cached_tools, [{"role": "user", "content": message}],
+                ),
+            }
+            for i, message in enumerate(user_messages)
+        ],
+    )
+    logger.info("Batch %s submitted: %d first turns", batch.id, len(user_messages))
+
+    while batch.processing_status != "ended":
+        await asyncio.sleep(poll_interval_s)
+        batch = await async_client.messages.batches.retrieve(batch.id)
+        logger.info("Batch %s: status=%s, counts=%s", batch.id, batch.processing_status, batch.request_counts)
+
+    first_responses: dict[str, anthropic.types.Message] = {}
+    async for entry in await async_client.messages.batches.results(batch.id):
+        if entry.result.type == "succeeded":
+            first_responses[entry.custom_id] = entry.result.message
+        else:
+            logger.warning("Batch request %s %s — running its first turn live", entry.custom_id, entry.result.type)
+
+    loop_semaphore = asyncio.Semaphore(max_concurrent_loops)
+
+    async def _resume(i: int, message: str) -> dict[str, Any]:
+        async with loop_semaphore:
+            return await run_agent_loop(
+                system_prompt=system_prompt,
+                tools=tools,
+                tool_executor=tool_executor,
+                user_message=message,
+                max_turns=max_turns,
+                model=use_model,
+                first_response=first_responses.get(f"loop-{i}"),
+            )
+
+    return await asyncio.gather(*(_resume(i, message) for i, message in enumerate(user_messages)))
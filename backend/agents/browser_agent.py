@@ -1,24 +1,21 @@
 from __future__ import annotations
 
-from typing import Any
+import functools
+import sys
+from dataclasses import dataclass, field, fields
+from typing import Any, Final, Mapping
 
-from agent_runner import run_agent_loop
+from agent_runner import run_agent_loop, stalled_after
 from tools.browser_tools import (
-    click_by_text,
-    click_element,
-    get_page_content,
-    list_interactive_elements,
-    navigate_to_url,
-    press_key,
-    scroll_page,
-    start_recording,
+    CACHEABLE_TOOLS,
+    SCREENSHOT_TOOLS,
+    flush_screenshots,
+    run_session_tool,
     stop_recording,
-    take_screenshot,
-    type_text,
-    wait_seconds,
 )
+from tools.registry import dispatch_tool, tool_schemas
 
-SYSTEM_PROMPT = """You are an autonomous browser exploration agent. Your job is to systematically discover and document every functionality on a given web page by interacting with all UI elements and capturing screenshots of each distinct state.
+SYSTEM_PROMPT_TEMPLATE: Final[str] = """You are an autonomous browser exploration agent. Your job is to systematically discover and document every functionality on a given web page by interacting with all UI elements and capturing screenshots of each distinct state.
 
 ## Exploration Protocol
 
@@ -26,11 +23,10 @@ When given a URL, job_id, and optionally a target section to focus on:
 
 ### Phase 0: Navigation & Login (NO recording, NO screenshots)
 IMPORTANT: Complete ALL of Phase 0 before taking ANY screenshots or calling start_recording.
-Each step below must be its own separate turn — do NOT combine steps into parallel tool calls.
 
-1. Call navigate_to_url with the URL and job_id. Wait for the result before proceeding.
-2. ALWAYS wait 3 seconds after navigate_to_url for the app to render before interacting.
-3. If login credentials are provided, complete the ENTIRE login flow:
+1. Call login_and_navigate ONCE with the URL, job_id, the login credentials from the task (phone/email, otp/password, login_selectors, app_type — pass them through as given) and the target section if one is specified. It opens the page, waits for it to render, runs the whole login flow and clicks the target section.
+2. If it returns "logged_in": true, go straight to step 5 (start_recording).
+3. Only if login_and_navigate reports a failure, finish the login manually. Steps on the same screen may go in ONE turn — e.g. type the phone number and click "Get OTP" together; browser actions from one turn run in the order you issue them:
    - **If exact login selectors are provided in the task**, use them directly — do NOT call list_interactive_elements to discover selectors. This saves turns.
    - **If no exact selectors are provided**, use list_interactive_elements and get_page_content to understand the login page.
    - Follow the general pattern: enter phone/email → click submit → wait for next screen → enter OTP/password → click verify/submit
@@ -42,10 +38,11 @@ Each step below must be its own separate turn — do NOT combine steps into para
    Typical flow: click phone input → type phone → click "Get OTP" → wait 2-3s → type OTP → click "Verify" → wait for dashboard.
 
    **Standard HTML apps:** Use regular CSS selectors (IDs, classes) as found by list_interactive_elements.
-4. If a target section/page is specified, navigate to it (click on the matching navigation item, tab, or menu entry). Wait for it to load.
+4. If a target section/page is specified and you are not on it yet, navigate to it (click on the matching navigation item, tab, or menu entry). Wait for it to load.
 5. NOW call start_recording. This creates a clean video starting from the current page — login is excluded.
 
 ### Phase 1: Initial Survey (recording is now active)
+Steps 6-8 only read the page — issue all three tool calls together in ONE turn; they run in parallel.
 6. Take a screenshot of the current page state (the landing page or target section).
 7. Call list_interactive_elements to get a full inventory of all UI elements.
 8. Call get_page_content to understand the page context and data displayed.
@@ -65,7 +62,7 @@ BE EFFICIENT — aim for 1-2 screenshots per screen, ~15-20 turns total. Do NOT
 
 **Follow the Navigation Guide order from the task prompt.** Visit primary flow pages first, secondary pages only if turns remain.
 
-**After clicking an element and waiting, take the screenshot immediately.** Do NOT call both get_page_content AND list_interactive_elements on every page — only use them when you need to find a specific element you can't locate otherwise.
+**After clicking an element, take the screenshot immediately — no wait_seconds needed, take_screenshot waits for the page to settle.** Do NOT call both get_page_content AND list_interactive_elements on every page — only use them when you need to find a specific element you can't locate otherwise.
 
 **A. Navigate Each Main Screen/Tab**
 - For each navigation tab or sidebar link:
@@ -76,7 +73,7 @@ BE EFFICIENT — aim for 1-2 screenshots per screen, ~15-20 turns total. Do NOT
 **B. One Detail View Per Screen**
 - On each main screen, click ONE representative data item (first list item, card, or table row):
   1. Take ONE screenshot of the detail view
-  2. Navigate back to the list
+  2. Return to the list with go_back
 
 **C. One Action Button**
 - Click ONE primary action button (Add, Create, etc.) if present:
@@ -96,9 +93,9 @@ BE EFFICIENT — aim for 1-2 screenshots per screen, ~15-20 turns total. Do NOT
 
 ## Rules
 - STRICTLY ONE screenshot per distinct visual state. Before taking a screenshot, check if you already captured this same view. NEVER take two screenshots of the same page — if you navigated back to a page you already screenshotted, do NOT screenshot it again.
-- ALWAYS wait for content to load before taking a screenshot (use wait_seconds 2-3 seconds after clicks).
+- Do NOT call wait_seconds before screenshots — take_screenshot already waits for network idle. Only use wait_seconds for the login steps above or content that keeps animating in.
 - NEVER submit forms, create records, or delete data. Only OPEN forms to capture their UI, then cancel.
-- If clicking an element causes an error or unexpected navigation, use the browser back or navigate back to recover.
+- If clicking an element causes an error or unexpected navigation, use go_back to recover.
 - If an element is not found by CSS selector, try click_by_text with the element's visible text. For icon buttons, use their aria-label selector shown by list_interactive_elements.
 - Use scroll_page to reveal content hidden below the viewport.
 - Use press_key for keyboard interactions (Escape to dismiss modals, Enter to submit search, Tab to navigate).
@@ -109,253 +106,159 @@ BE EFFICIENT — aim for 1-2 screenshots per screen, ~15-20 turns total. Do NOT
 
 ## Turn Budget
 - Check how many turns you have used. The task prompt will specify budgets.
-- You MUST call stop_recording at least 3 turns before max_turns (i.e. by turn 47 out of 50).
+- You MUST call stop_recording at least 3 turns before max_turns (i.e. by turn {stop_by} out of {max_turns}).
 - If login exceeds its budget (8 turns), take a screenshot and move to exploration anyway.
 - After start_recording, prioritize feature pages listed first in the Navigation Guide.
 - Do NOT explore secondary pages until all primary pages are covered.
 - Combine actions efficiently: after a click, take screenshot directly — skip list_interactive_elements unless you need to find a specific element.
+- Read-only tools (take_screenshot, list_interactive_elements, get_page_content) never change the page: whenever you need more than one of them, call them together in ONE turn — they run in parallel. Never batch a read-only call with a click or navigation.
 
 ## Error Handling
 - If a tool returns "status": "error", do NOT retry the same action more than once.
-- If navigate_to_url fails, report the error and stop — the URL is unreachable.
+- If navigate_to_url or login_and_navigate cannot open the URL, report the error and stop — the URL is unreachable.
 - If a click fails, try click_by_text with the element's visible text as a fallback.
 - If a fallback also fails, skip that element and move on to the next section.
 - If login fails after credentials are entered, report the error with the page content so the pipeline knows why.
 - If login is not progressing after 10 turns (stuck on the same page, repeated failures, or no visible change), take a screenshot of the current state, call stop_recording if active, and report the issue with the screenshot. Do NOT keep retrying — the screenshot will help debug the problem.
 - Always include any errors encountered in your final summary."""
 
-TOOLS = [
-    {
-        "name": "navigate_to_url",
-        "description": "Open a URL in the browser. Creates a new session if needed. Returns page title and description.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "url": {"type": "string", "description": "The URL to navigate to"},
-                "job_id": {"type": "string", "description": "The job ID for session management"},
-            },
-            "required": ["url", "job_id"],
-        },
-    },
-    {
-        "name": "take_screenshot",
-        "description": "Capture one full-page screenshot of the current view. Only call after navigating to a new, distinct screen (e.g. new tab, detail page, or open popup). Do not call again until the view has changed — one screenshot per distinct view.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "type_text",
-        "description": "Type text into an input field identified by CSS selector. Use this to fill in forms, search boxes, login fields, etc.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "selector": {"type": "string", "description": "CSS selector for the input field"},
-                "text": {"type": "string", "description": "The text to type into the field"},
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["selector", "text", "job_id"],
-        },
-    },
-    {
-        "name": "click_element",
-        "description": "Click an element by CSS selector. Returns new page state after click.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "selector": {"type": "string", "description": "CSS selector or Playwright selector for the element to click"},
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["selector", "job_id"],
-        },
-    },
-    {
-        "name": "list_interactive_elements",
-        "description": "List all clickable elements on the current page with their selectors and text.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "wait_seconds",
-        "description": "Wait for a few seconds (e.g. 2–3) to let the page load. Use after clicking Continue/Next so the OTP screen appears before typing the code.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "seconds": {"type": "number", "description": "Seconds to wait (1–10)"},
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["seconds", "job_id"],
-        },
-    },
-    {
-        "name": "get_page_content",
-        "description": "Get the visible text content of the current page.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "start_recording",
-        "description": "Start video recording. Call this AFTER login and navigation to the target page. Creates a clean recording context — login screens are excluded from the video.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "stop_recording",
-        "description": "Stop recording and close the browser session. Returns the video file path.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "scroll_page",
-        "description": "Scroll the page up or down by a specified number of pixels. Use to reveal content below the fold or return to the top.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "direction": {
-                    "type": "string",
-                    "enum": ["up", "down"],
-                    "description": "Scroll direction: 'up' or 'down'",
-                },
-                "amount": {
-                    "type": "integer",
-                    "description": "Number of pixels to scroll (e.g. 500 for half a screen, 1000 for a full screen)",
-                },
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["direction", "amount", "job_id"],
-        },
-    },
-    {
-        "name": "press_key",
-        "description": "Press a keyboard key. Common keys: Enter, Escape, Tab, Backspace, ArrowDown, ArrowUp. Use Escape to dismiss modals/popups, Enter to submit search queries.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "key": {
-                    "type": "string",
-                    "description": "The key to press (e.g. 'Enter', 'Escape', 'Tab', 'ArrowDown')",
-                },
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["key", "job_id"],
-        },
-    },
-    {
-        "name": "click_by_text",
-        "description": "Click an element by its visible text. More reliable than CSS selectors for dynamic apps (especially Flutter). Falls back to role-based matching if text match fails.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "text": {
-                    "type": "string",
-                    "description": "The visible text of the element to click",
-                },
-                "exact": {
-                    "type": "boolean",
-                    "description": "If true, match the text exactly. If false (default), match substring.",
-                },
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["text", "job_id"],
-        },
-    },
-]
+TOOLS: Final[tuple[Mapping[str, Any], ...]] = tool_schemas([
+    "login_and_navigate",
+    "navigate_to_url",
+    "go_back",
+    "take_screenshot",
+    "take_full_page_screenshot",
+    "type_text",
+    "click_element",
+    "list_interactive_elements",
+    "wait_seconds",
+    "get_page_content",
+    "start_recording",
+    "stop_recording",
+    "scroll_page",
+    "press_key",
+    "click_by_text",
+])
+
+
+def _strip_empty(value: Any) -> Any:
+    """Recursively drop None/""/[]/{} fields so tool results cost fewer prompt tokens."""
+    if isinstance(value, dict):
+        stripped = {k: _strip_empty(v) for k, v in value.items()}
+        return {k: v for k, v in stripped.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [_strip_empty(v) for v in value]
+    return value
 
 
 async def _execute_tool(name: str, input: dict) -> str | dict | list:
-    if name == "navigate_to_url":
-        return await navigate_to_url(input["url"], input["job_id"])
-    elif name == "take_screenshot":
-        return await take_screenshot(input["job_id"])
-    elif name == "type_text":
-        return await type_text(input["selector"], input["text"], input["job_id"])
-    elif name == "click_element":
-        return await click_element(input["selector"], input["job_id"])
-    elif name == "list_interactive_elements":
-        return await list_interactive_elements(input["job_id"])
-    elif name == "wait_seconds":
-        return await wait_seconds(input["seconds"], input["job_id"])
-    elif name == "get_page_content":
-        return await get_page_content(input["job_id"])
-    elif name == "start_recording":
-        return await start_recording(input["job_id"])
-    elif name == "stop_recording":
-        return await stop_recording(input["job_id"])
-    elif name == "scroll_page":
-        return await scroll_page(input["direction"], input["amount"], input["job_id"])
-    elif name == "press_key":
-        return await press_key(input["key"], input["job_id"])
-    elif name == "click_by_text":
-        return await click_by_text(input["text"], input["job_id"], input.get("exact", False))
-    else:
-        return {"error": f"Unknown tool: {name}"}
+    """Run a tool under the shared session policy (see run_session_tool)."""
+    return await run_session_tool(name, input, dispatch_tool)
 
 
-async def run_browser_agent(task: str) -> dict[str, Any]:
-    """Run the browser agent. Returns {summary: str, data: dict} with collected structured data."""
-    collected: dict[str, Any] = {
-        "urls_visited": [],
-        "page_titles": [],
-        "screenshot_paths": [],
-        "video_path": None,
-        "page_content": "",
-        "interactive_elements": [],
-        "action_log": [],
-    }
+MAX_TURNS = 25
+MAX_SCREENSHOTS = 20  # enough for every main screen; past this the run wraps up
+STALL_TURNS = 3  # tool turns after start_recording with no new screenshot or URL before the run wraps up
+TOKEN_BUDGET = 200_000  # cumulative input tokens across turns
 
-    async def _collecting_executor(name: str, input: dict) -> str | dict | list:
-        result = await _execute_tool(name, input)
-        if name == "navigate_to_url" and isinstance(result, dict):
-            collected["urls_visited"].append({
+
+@functools.cache
+def _build_system_prompt(max_turns: int) -> str:
+    """Render the system prompt for a turn budget (once per budget, interned)."""
+    return sys.intern(SYSTEM_PROMPT_TEMPLATE.format(max_turns=max_turns, stop_by=max_turns - 3))
+
+
+@dataclass(slots=True)
+class CollectedState:
+    """Structured data gathered from tool results during a browser agent run."""
+
+    urls_visited: list[dict[str, str]] = field(default_factory=list)
+    page_titles: list[str] = field(default_factory=list)
+    screenshot_paths: list[str] = field(default_factory=list)
+    video_path: str | None = None
+    page_content: str = ""
+    interactive_elements: list[dict[str, str]] = field(default_factory=list)
+    action_log: list[dict[str, Any]] = field(default_factory=list)
+
+    def add_url_visit(self, visit: dict[str, str]) -> None:
+        """Record a visited URL unless it repeats the previous entry."""
+        if not self.urls_visited or self.urls_visited[-1] != visit:
+            self.urls_visited.append(visit)
+
+    def add_page_title(self, title: str) -> None:
+        """Record a page title unless it repeats the previous one."""
+        if not self.page_titles or self.page_titles[-1] != title:
+            self.page_titles.append(title)
+
+    def record(self, name: str, input: dict, result: Any) -> None:
+        """Fold one browser tool call's result into the collected state."""
+        if name in ("navigate_to_url", "login_and_navigate") and isinstance(result, dict):
+            self.add_url_visit({
                 "url": result.get("url", input.get("url", "")),
                 "title": result.get("title", ""),
                 "description": result.get("description", ""),
             })
-            collected["page_titles"].append(result.get("title", ""))
-        elif name == "take_screenshot" and isinstance(result, dict):
-            collected["screenshot_paths"].append(result.get("path", ""))
+            self.add_page_title(result.get("title", ""))
+        elif name in SCREENSHOT_TOOLS and isinstance(result, dict) and not result.get("cached"):
+            self.screenshot_paths.append(result.get("path", ""))
         elif name == "click_element" and isinstance(result, dict):
             if result.get("status") == "ok":
-                collected["page_titles"].append(result.get("title", ""))
+                self.add_page_title(result.get("title", ""))
         elif name == "get_page_content" and isinstance(result, dict):
-            collected["page_content"] = result.get("text", "")
+            self.page_content = result.get("text", "")
         elif name == "list_interactive_elements" and isinstance(result, list):
-            collected["interactive_elements"] = result
+            self.interactive_elements = result
         elif name == "stop_recording" and isinstance(result, dict):
-            collected["video_path"] = result.get("video_path")
-            collected["action_log"] = result.get("action_log", [])
-        return result
+            self.video_path = result.get("video_path")
+            self.action_log = result.get("action_log", [])
+
+    def to_dict(self) -> dict[str, Any]:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+async def run_browser_agent(task: str) -> dict[str, Any]:
+    """Run the browser agent. Returns {summary: str, data: dict} with collected structured data."""
+    collected = CollectedState()
+    job_ids: set[str] = set()
+    recording_started = False
+    recording_stopped = False
+
+    async def _collecting_executor(name: str, input: dict) -> str | dict | list:
+        nonlocal recording_started, recording_stopped
+        job_ids.add(input.get("job_id", ""))
+        result = await _execute_tool(name, input)
+        collected.record(name, input, result)
+        if name == "start_recording" and isinstance(result, dict):
+            recording_started = recording_started or result.get("status") == "recording"
+        elif name == "stop_recording" and isinstance(result, dict):
+            recording_stopped = result.get("status") == "stopped"
+        # collected keeps the full result; the model only needs populated fields
+        return _strip_empty(result)
+
+    stalled = stalled_after(lambda: (len(collected.urls_visited), len(collected.screenshot_paths)), STALL_TURNS)
 
     result = await run_agent_loop(
-        system_prompt=SYSTEM_PROMPT,
+        system_prompt=_build_system_prompt(MAX_TURNS),
         tools=TOOLS,
         tool_executor=_collecting_executor,
         user_message=task,
-        max_turns=50,
+        max_turns=MAX_TURNS,
         verbose=True,
+        speculative_tools=CACHEABLE_TOOLS,
+        # A manual login fallback takes several type/click turns with no
+        # screenshot or URL change, so stalls only count once recording runs;
+        # from then on stalled() tracks consecutive turns and runs every turn
+        stop_when=lambda: (recording_started and stalled()) or recording_stopped or len(collected.screenshot_paths) >= MAX_SCREENSHOTS,
+        token_budget=TOKEN_BUDGET,
     )
-    return {"summary": result["text"], "data": collected, "usage": result["usage"]}
+    # Wrapped up (or ran out of turns) before stop_recording: close the session
+    # so the video is finalized; stop_recording also flushes buffered screenshots
+    if not recording_stopped:
+        for job_id in job_ids:
+            stopped = await stop_recording(job_id)
+            if stopped.get("status") == "stopped":
+                collected.video_path = stopped.get("video_path")
+                collected.action_log = stopped.get("action_log", [])
+            else:
+                await flush_screenshots(job_id)
+    return {"summary": result["text"], "data": collected.to_dict(), "usage": result["usage"]}
@@ -10,35 +10,37 @@ Pattern follows score_evaluator_agent.py (multi-phase, no agent loop).
 """
 from __future__ import annotations
 
+import asyncio
 import base64
+import bisect
+import functools
+import hashlib
+import io
 import json
 import logging
+import math
+import mimetypes
 import os
 import re
+import shutil
 import subprocess
 import tempfile
-from typing import Any, Callable
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable
 
 import anthropic
 import numpy as np
-from moviepy.editor import (
-    AudioFileClip,
-    CompositeAudioClip,
-    CompositeVideoClip,
-    ImageClip,
-    VideoFileClip,
-    concatenate_videoclips,
-)
+from moviepy.editor import VideoFileClip
 from PIL import Image, ImageDraw, ImageFont
 
 import imageio_ffmpeg
 
-from agent_runner import calc_cost
+from agent_runner import _get_async_client, calc_cost
+from llm_cache import DEFAULT_TTL, default_cache, make_cache_key
 
 logger = logging.getLogger(__name__)
 
-client = anthropic.Anthropic(max_retries=5)
-
 # ─── Constants ──────────────────────────────────────────────────
 
 ACCENT_COLOR = (124, 58, 237)  # #7C3AED purple
@@ -48,6 +50,7 @@ FRAME_SAMPLE_FPS = 10
 STATIC_THRESHOLD = 4.0  # seconds of static before trimming
 STATIC_KEEP = 1.5  # seconds to keep from static segments
 FRAME_DIFF_THRESHOLD = 0.02  # fraction of pixels that must differ
+FRAME_DIFF_STRIDE = 4  # diff every 4th pixel per axis — an unbiased sample of the full-frame mean
 CURSOR_DURATION = 0.8  # cursor + ripple animation length
 PATH_DRAW_DURATION = 0.4  # max time for line-draw between clicks
 CLICK_LEAD_TIME = 0.15  # click animation starts this many seconds before the visual transition
@@ -56,6 +59,7 @@ TRANSITION_MIN_GAP = 0.8  # minimum seconds between detected transitions
 TRANSITION_STABILITY_DELAY = 0.3  # seconds to wait and re-check that change persisted
 ACTION_SUBTITLE_MAX_DURATION = 2.5  # max subtitle display time
 ACTION_SUBTITLE_MIN_GAP = 0.3  # gap between consecutive subtitles
+SUBTITLE_MERGE_GAP = 0.5  # repeated subtitles closer than this are shown as one
 
 
 # ─── Video loading helper ────────────────────────────────────────
@@ -66,6 +70,99 @@ def _get_ffmpeg_binary() -> str:
     return imageio_ffmpeg.get_ffmpeg_exe()
 
 
+# H.264 hardware encoders in preference order, with the input pixel format each
+# takes; the first one that can actually open a device wins
+_HW_ENCODERS: tuple[tuple[str, str], ...] = (
+    ("h264_nvenc", "yuv420p"),
+    ("h264_qsv", "nv12"),
+    ("h264_videotoolbox", "yuv420p"),
+    ("h264_amf", "yuv420p"),
+)
+
+# Output settings per hardware encoder: constant quality (comparable
+# to x264 CRF 23) where the encoder has a mode for it, else a target bitrate
+_HW_ENCODER_SETTINGS: dict[str, dict[str, Any]] = {
+    "h264_nvenc": {
+        "preset": "p4", "bitrate": None,
+        "ffmpeg_params": ["-tune", "hq", "-rc", "vbr", "-cq", "23", "-b:v", "0"],
+    },
+    "h264_qsv": {"preset": "medium", "bitrate": None, "ffmpeg_params": ["-global_quality", "23"]},
+}
+_HW_ENCODER_DEFAULT_SETTINGS: dict[str, Any] = {"preset": "medium", "bitrate": "2500k", "ffmpeg_params": []}
+
+
+@functools.cache
+def _video_encoder() -> tuple[str, list[str]]:
+    """Pick the H.264 encoder for the final export: (codec, extra ffmpeg params).
+
+    VIDEO_ENCODER forces a codec. Otherwise each hardware encoder is tried with
+    a tiny test encode — being compiled into ffmpeg does not mean a GPU is
+    present — and libx264 is the fallback. Probed once per process.
+    """
+    forced = os.getenv("VIDEO_ENCODER", "")
+    if forced:
+        pix_fmt = dict(_HW_ENCODERS).get(forced)
+        return forced, ["-pix_fmt", pix_fmt] if pix_fmt else []
+    ffmpeg = _get_ffmpeg_binary()
+    for codec, pix_fmt in _HW_ENCODERS:
+        try:
+            probe = subprocess.run(
+                [ffmpeg, "-hide_banner", "-loglevel", "error",
+                 "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1",
+                 "-pix_fmt", pix_fmt, "-c:v", codec, "-f", "null", "-"],
+                capture_output=True, timeout=15,
+            )
+        except subprocess.SubprocessError:
+            continue
+        if probe.returncode == 0:
+            logger.info("Using hardware video encoder %s", codec)
+            return codec, ["-pix_fmt", pix_fmt]
+    return "libx264", []
+
+
+@functools.cache
+def _has_subtitles_filter() -> bool:
+    """Whether the bundled ffmpeg has the libass `subtitles` filter. Probed once per process."""
+    try:
+        probe = subprocess.run(
+            [_get_ffmpeg_binary(), "-hide_banner", "-filters"],
+            capture_output=True, text=True, timeout=15,
+        )
+    except subprocess.SubprocessError:
+        return False
+    return any(line.split()[1:2] == ["subtitles"] for line in probe.stdout.splitlines())
+
+
+def _audio_mix_graph(
+    narrations: list[tuple[str, float]],
+    first_input: int,
+    source_ranges: list[tuple[float, float]] | None = None,
+) -> tuple[list[str], list[str]]:
+    """Return the ffmpeg inputs and filter chains that mix the audio into [aout].
+
+    narrations are (audio_path, start_s) placed on the output timeline; they
+    become inputs first_input, first_input + 1, ... When source_ranges is
+    given, input 0's audio (the source recording) is cut to those ranges
+    (the deduplicated timeline) and mixed in at 15% volume.
+    """
+    inputs: list[str] = []
+    filters: list[str] = []
+    mix: list[str] = []
+    if source_ranges is not None:
+        for k, (start, end) in enumerate(source_ranges):
+            filters.append(f"[0:a]atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS[s{k}]")
+        parts = "".join(f"[s{k}]" for k in range(len(source_ranges)))
+        filters.append(f"{parts}concat=n={len(source_ranges)}:v=0:a=1,volume=0.15[orig]")
+        mix.append("[orig]")
+    for k, (path, start_s) in enumerate(narrations):
+        inputs += ["-i", path]
+        filters.append(f"[{first_input + k}:a]adelay={round(start_s * 1000)}:all=1[n{k}]")
+        mix.append(f"[n{k}]")
+    # normalize=0 sums the inputs instead of scaling each one by 1/N
+    filters.append(f"{''.join(mix)}amix=inputs={len(mix)}:duration=longest:normalize=0[aout]")
+    return inputs, filters
+
+
 def _probe_video_duration(video_path: str) -> float | None:
     """Probe video duration using the bundled ffmpeg binary.
 
@@ -91,6 +188,20 @@ def _probe_video_duration(video_path: str) -> float | None:
     return None
 
 
+def _probe_video_format(video_path: str) -> tuple[str, str] | None:
+    """Return (codec, pixel format) of the first video stream, e.g. ("h264", "yuv420p")."""
+    try:
+        result = subprocess.run(
+            [_get_ffmpeg_binary(), "-hide_banner", "-i", video_path],
+            capture_output=True, text=True, timeout=30,
+        )
+    except subprocess.SubprocessError:
+        return None
+    # ffmpeg exits non-zero without an output file but still prints the stream summary
+    match = re.search(r"Stream #\S+: Video: (\w+)[^,]*, (\w+)", result.stderr)
+    return (match.group(1), match.group(2)) if match else None
+
+
 def _fix_video_metadata(video_path: str) -> str:
     """Remux a video to embed correct duration metadata.
 
@@ -184,41 +295,102 @@ Return ONLY valid JSON — no markdown fences, no extra text:
 }"""
 
 
-def _generate_narration_script(
+SCREENSHOT_MAX_WIDTH = 1024  # wider screenshots are downscaled before upload
+
+
+def _screenshot_block(path: str) -> dict | None:
+    """Read a screenshot as a base64 image block, downscaled to SCREENSHOT_MAX_WIDTH.
+
+    Returns None when the file is missing.
+    """
+    try:
+        with Image.open(path) as img:
+            if img.width <= SCREENSHOT_MAX_WIDTH:
+                # Within limits: send the file as-is rather than re-encoding it
+                with open(path, "rb") as f:
+                    data = f.read()
+            else:
+                fmt = img.format or "PNG"
+                size = (SCREENSHOT_MAX_WIDTH, round(img.height * SCREENSHOT_MAX_WIDTH / img.width))
+                buf = io.BytesIO()
+                img.resize(size, Image.LANCZOS).save(buf, format=fmt)  # keep format so media_type matches
+                data = buf.getvalue()
+    except FileNotFoundError:
+        return None
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": mimetypes.guess_type(path)[0] or "image/png",
+            "data": base64.b64encode(data).decode(),
+        },
+    }
+
+
+_SEGMENTS_ARRAY = re.compile(r'"segments"\s*:\s*\[')
+_json_decoder = json.JSONDecoder()
+
+
+def _complete_segments(text: str, pos: int) -> tuple[list[dict], int]:
+    """Decode the segment objects fully present in a partial narration reply.
+
+    pos is where the previous call stopped (0 before the segments array has
+    appeared); returns the newly completed segments and the position to
+    resume from.
+    """
+    if pos == 0:
+        m = _SEGMENTS_ARRAY.search(text)
+        if m is None:
+            return [], 0
+        pos = m.end()
+    found: list[dict] = []
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text) or text[pos] != "{":
+            return found, pos
+        try:
+            segment, pos = _json_decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            return found, pos  # object still streaming
+        found.append(segment)
+
+
+async def _generate_narration_script(
     action_log: list[dict],
     screenshot_paths: list[str] | None = None,
     feature_context: str = "",
     video_duration_s: float | None = None,
     transitions: list[float] | None = None,
     deduped_duration_s: float | None = None,
+    on_segment: Callable[[dict], Any] | None = None,
 ) -> tuple[list[dict], dict]:
     """Phase 1: Generate narration script from action log via Claude.
 
     When no action log is available, uses pre-scanned transition timestamps
-    so Claude can anchor narration to real visual changes.
+    so Claude can anchor narration to real visual changes. on_segment is
+    called with each segment as soon as it has streamed in (not on a cache
+    hit); the returned list, parsed from the full reply, is authoritative.
     """
     model = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-6")
 
     content: list[dict[str, Any]] = []
 
-    # Add screenshots (up to 10) for visual context
+    # Add screenshots (up to 10) for visual context, read and encoded in parallel
+    screenshot_names: list[str] = []
     if screenshot_paths:
-        for path in screenshot_paths[:10]:
-            if os.path.exists(path):
-                with open(path, "rb") as f:
-                    img_b64 = base64.b64encode(f.read()).decode()
-                content.append({
-                    "type": "image",
-                    "source": {"type": "base64", "media_type": "image/png", "data": img_b64},
-                })
-                content.append({
-                    "type": "text",
-                    "text": f"[Screenshot: {os.path.basename(path)}]",
-                })
+        paths = screenshot_paths[:10]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            blocks = list(pool.map(_screenshot_block, paths))
+        for path, block in zip(paths, blocks):
+            if block is not None:
+                content.append(block)
+                screenshot_names.append(os.path.basename(path))
 
     # Add action log / transitions and context
     if action_log:
-        text_parts = [f"Action log:\n{json.dumps(action_log, indent=2)}"]
+        # Compact separators: indentation costs tokens and tells Claude nothing
+        text_parts = [f"Action log:\n{json.dumps(action_log, separators=(',', ':'))}"]
     elif transitions:
         # No action log — use detected transitions instead
         transition_strs = [f"{t:.1f}s" for t in transitions]
@@ -267,28 +439,52 @@ def _generate_narration_script(
         )
     if feature_context:
         text_parts.append(f"\nFeature context: {feature_context}")
+    if screenshot_names:
+        text_parts.append(f"\nScreenshots (in order): {', '.join(screenshot_names)}")
     text_parts.append("\nWrite a narration script for this demo video.")
     content.append({"type": "text", "text": "\n".join(text_parts)})
 
-    response = client.messages.create(
-        model=model,
-        max_tokens=2000,
-        temperature=0,
-        system=NARRATION_PROMPT,
-        messages=[{"role": "user", "content": content}],
-    )
+    request = {
+        "model": model,
+        "max_tokens": 2000,
+        "temperature": 0,
+        "system": NARRATION_PROMPT,
+        "messages": [{"role": "user", "content": content}],
+    }
+    # Keyed on the full request (screenshots included), so a re-render of an
+    # unchanged recording replays the script instead of calling Claude
+    cache = default_cache()
+    cache_key = make_cache_key(request) if cache is not None else None
+    cached = await cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        response = anthropic.types.Message.model_validate_json(cached)
+        logger.info("Phase 1: Narration script served from LLM cache")
+        usage = {"model": model, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "api_calls": 0}
+    else:
+        async with _get_async_client().messages.stream(**request) as stream:
+            if on_segment is not None:
+                streamed = ""
+                pos = 0
+                async for delta in stream.text_stream:
+                    streamed += delta
+                    complete, pos = _complete_segments(streamed, pos)
+                    for seg in complete:
+                        on_segment(seg)
+            response = await stream.get_final_message()
+        usage = {
+            "model": model,
+            "input_tokens": response.usage.input_tokens,
+            "output_tokens": response.usage.output_tokens,
+            "cost_usd": calc_cost(model, response.usage.input_tokens, response.usage.output_tokens),
+            "api_calls": 1,
+        }
 
     text = response.content[0].text
     clean = text.replace("```json", "").replace("```", "").strip()
     parsed = json.loads(clean)
-
-    usage = {
-        "model": model,
-        "input_tokens": response.usage.input_tokens,
-        "output_tokens": response.usage.output_tokens,
-        "cost_usd": calc_cost(model, response.usage.input_tokens, response.usage.output_tokens),
-        "api_calls": 1,
-    }
+    if cache_key and cached is None:
+        # Stored only once the reply parses, so a malformed script is retried next run
+        await cache.set(cache_key, response.model_dump_json(), DEFAULT_TTL)
 
     segments = parsed.get("segments", [])
     logger.info("Phase 1: Generated %d narration segments", len(segments))
@@ -297,87 +493,202 @@ def _generate_narration_script(
 
 # ─── Phase 2: TTS Generation ────────────────────────────────────
 
-async def _generate_tts(
-    segments: list[dict],
-    work_dir: str,
-) -> list[dict]:
-    """Phase 2: Convert narration segments to speech audio via edge-tts.
+# Layer III bitrates (kbps) by MPEG-1 flag, and sample rates by version bits
+_MP3_BITRATES = {
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _mp3_duration_ms(data: bytes) -> int | None:
+    """Duration of an MP3 (Layer III) stream from its frame headers, or None if none are found.
 
-    Enriches each segment with audio_path and duration_ms.
+    Walks the frames in memory instead of opening the file with ffmpeg.
+    """
+    i = 0
+    if data[:3] == b"ID3" and len(data) >= 10:  # skip the ID3v2 tag (syncsafe size)
+        i = 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+    samples = 0
+    sample_rate = 0
+    while i + 4 <= len(data):
+        b1, b2 = data[i + 1], data[i + 2]
+        version = (b1 >> 3) & 3
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+        if (
+            data[i] != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or (b1 >> 1) & 3 != 1
+            or bitrate_index in (0, 15) or rate_index == 3
+        ):
+            i += 1  # not a Layer III frame header — resync
+            continue
+        mpeg1 = version == 3
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        bitrate = _MP3_BITRATES[mpeg1][bitrate_index] * 1000
+        i += (144 if mpeg1 else 72) * bitrate // sample_rate + ((b2 >> 1) & 1)
+        samples += 1152 if mpeg1 else 576
+    if not samples:
+        return None
+    return samples * 1000 // sample_rate
+
+
+def _tts_synthesizer(
+    work_dir: str,
+) -> tuple[Callable[[int, str], asyncio.Task], Callable[[], Awaitable[None]]]:
+    """Return (start, cancel_pending) for synthesizing narration via edge-tts.
+
+    start(i, text) returns a task resolving to {audio_path, duration_ms,
+    subtitle_words}, or None for blank text. At most TTS_CONCURRENCY
+    (default 4) run at once, and repeated calls for the same (i, text) share
+    one task, so segments started while the script is still streaming are
+    not synthesized twice. cancel_pending() cancels unfinished tasks and
+    waits for all of them; call it before removing work_dir.
     """
     import edge_tts
 
     voice = "en-US-AriaNeural"
-    enriched = []
+    semaphore = asyncio.Semaphore(int(os.getenv("TTS_CONCURRENCY", "4")))
+    cache_dir: str | None = os.getenv("TTS_CACHE_DIR", "outputs/.tts_cache")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        # The cache only saves edge-tts calls — narrate without it
+        logger.warning("TTS cache disabled, cannot create %s: %s", cache_dir, e)
+        cache_dir = None
+    started: dict[tuple[int, str], asyncio.Task] = {}
 
-    for i, seg in enumerate(segments):
-        text = seg.get("text", "")
+    async def _synthesize(i: int, text: str) -> dict | None:
         if not text.strip():
-            continue
+            return None
 
         audio_path = os.path.join(work_dir, f"narration_{i:03d}.mp3")
-        subtitle_data: list[dict] = []
+        key = hashlib.sha256(f"{voice}|{text}".encode()).hexdigest()
+        if cache_dir:
+            cached = await asyncio.to_thread(_load_cached_tts, cache_dir, key, audio_path)
+            if cached is not None:
+                return {"audio_path": audio_path, **cached}
 
-        communicate = edge_tts.Communicate(text, voice)
+        subtitle_data: list[dict] = []
 
         # Collect timestamps for subtitle sync (WordBoundary in v6, SentenceBoundary in v7)
         audio_chunks: list[bytes] = []
-        async for chunk in communicate.stream():
-            if chunk["type"] == "audio":
-                audio_chunks.append(chunk["data"])
-            elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
-                subtitle_data.append({
-                    "offset_ms": chunk["offset"] // 10_000,  # 100ns units to ms
-                    "duration_ms": chunk["duration"] // 10_000,
-                    "text": chunk["text"],
-                })
-
-        # Write audio file
-        with open(audio_path, "wb") as f:
-            for chunk in audio_chunks:
-                f.write(chunk)
-
-        # Get duration from the audio file
-        try:
-            clip = AudioFileClip(audio_path)
-            duration_ms = int(clip.duration * 1000)
-            clip.close()
-        except Exception:
+        async with semaphore:
+            communicate = edge_tts.Communicate(text, voice)
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    audio_chunks.append(chunk["data"])
+                elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
+                    subtitle_data.append({
+                        "offset_ms": chunk["offset"] // 10_000,  # 100ns units to ms
+                        "duration_ms": chunk["duration"] // 10_000,
+                        "text": chunk["text"],
+                    })
+
+        audio = b"".join(audio_chunks)
+        await asyncio.to_thread(_write_bytes, audio_path, audio)
+
+        duration_ms = _mp3_duration_ms(audio)
+        if duration_ms is None and subtitle_data:
+            # No parseable frames: the last boundary edge-tts reported ends the speech
+            duration_ms = subtitle_data[-1]["offset_ms"] + subtitle_data[-1]["duration_ms"]
+        if duration_ms is None:
             duration_ms = 3000  # fallback
+        elif cache_dir:
+            await asyncio.to_thread(
+                _store_cached_tts, cache_dir, key, audio,
+                {"duration_ms": duration_ms, "subtitle_words": subtitle_data},
+            )
 
-        enriched.append({
-            **seg,
+        return {
             "audio_path": audio_path,
             "duration_ms": duration_ms,
             "subtitle_words": subtitle_data,
-        })
+        }
+
+    def start(i: int, text: str) -> asyncio.Task:
+        task = started.get((i, text))
+        if task is None:
+            task = started[(i, text)] = asyncio.create_task(_synthesize(i, text))
+        return task
+
+    async def cancel_pending() -> None:
+        # Also covers segments streamed but dropped by the final parse, and
+        # retrieves their exceptions so none is logged as never retrieved
+        for task in started.values():
+            task.cancel()
+        await asyncio.gather(*started.values(), return_exceptions=True)
+
+    return start, cancel_pending
+
+
+async def _generate_tts(
+    segments: list[dict],
+    work_dir: str,
+    synthesize: Callable[[int, str], asyncio.Task] | None = None,
+) -> list[dict]:
+    """Phase 2: Convert narration segments to speech audio via edge-tts.
+
+    Enriches each segment with audio_path and duration_ms, in input order.
+    Pass the synthesizer that already started segments while the script
+    streamed (see _tts_synthesizer) to reuse that work.
+    """
+    if synthesize is None:
+        synthesize, _ = _tts_synthesizer(work_dir)
+    results = await asyncio.gather(*(synthesize(i, seg.get("text", "")) for i, seg in enumerate(segments)))
+    enriched = [{**seg, **audio} for seg, audio in zip(segments, results) if audio is not None]
 
     logger.info("Phase 2: Generated %d TTS audio files", len(enriched))
     return enriched
 
 
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _load_cached_tts(cache_dir: str, key: str, audio_path: str) -> dict | None:
+    """Place a cached narration clip at audio_path and return its timing, or None on a miss.
+
+    Entries are keyed by sha256(voice|text); the MP3 is hardlinked into the
+    work dir when both live on the same filesystem, copied otherwise.
+    """
+    cached_audio = os.path.join(cache_dir, f"{key}.mp3")
+    try:
+        with open(os.path.join(cache_dir, f"{key}.json")) as f:
+            meta = json.load(f)
+        try:
+            os.link(cached_audio, audio_path)
+        except OSError:
+            shutil.copyfile(cached_audio, audio_path)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return {"duration_ms": meta["duration_ms"], "subtitle_words": meta["subtitle_words"]}
+
+
+def _store_cached_tts(cache_dir: str, key: str, audio: bytes, meta: dict) -> None:
+    """Persist a synthesized clip; the JSON is written last so it marks a complete entry.
+
+    Failures (read-only or full disk) only lose the cache entry. Each write
+    goes through its own temp file, so concurrent stores of the same text
+    don't collide.
+    """
+    base = os.path.join(cache_dir, key)
+    try:
+        for suffix, data in ((".mp3", audio), (".json", json.dumps(meta).encode())):
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, base + suffix)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+    except OSError as e:
+        logger.warning("Failed to cache TTS clip %s: %s", key, e)
+
+
 # ─── Phase 3: Video Processing ───────────────────────────────────
 
-def _create_ripple_frame(width: int, height: int, cx: int, cy: int, radius: int) -> np.ndarray:
-    """Create a transparent frame with a purple ripple circle at (cx, cy)."""
-    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
-    # Outer ring
-    alpha = max(20, 180 - int(radius * 3.5))
-    r, g, b = ACCENT_COLOR
-    draw.ellipse(
-        [cx - radius, cy - radius, cx + radius, cy + radius],
-        outline=(r, g, b, alpha),
-        width=3,
-    )
-    # Inner filled circle (smaller, more transparent)
-    inner_r = max(4, radius // 3)
-    inner_alpha = max(10, 100 - int(radius * 2))
-    draw.ellipse(
-        [cx - inner_r, cy - inner_r, cx + inner_r, cy + inner_r],
-        fill=(r, g, b, inner_alpha),
-    )
-    return np.array(img)
+CURSOR_SIZE = 24
 
 
 def _draw_cursor(draw: ImageDraw.ImageDraw, cx: int, cy: int, size: int = 24, alpha: int = 230) -> None:
@@ -402,87 +713,148 @@ def _draw_cursor(draw: ImageDraw.ImageDraw, cx: int, cy: int, size: int = 24, al
     draw.polygon(polygon, outline=(0, 0, 0, alpha), fill=None)
 
 
-def _create_cursor_frame(
-    width: int, height: int, cx: int, cy: int,
-    cursor_alpha: int, ripple_radius: int | None = None,
-) -> np.ndarray:
-    """Render one RGBA frame with a cursor pointer and optional ripple."""
-    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
+@functools.cache
+def _cursor_sprite() -> np.ndarray:
+    """The pointer rasterized once as an RGBA sprite, tip at (0, 0), full alpha."""
+    img = Image.new("RGBA", (CURSOR_SIZE + 1, CURSOR_SIZE + 1), (0, 0, 0, 0))
+    _draw_cursor(ImageDraw.Draw(img), 0, 0, size=CURSOR_SIZE, alpha=255)
+    return np.array(img)
+
+
+@functools.cache
+def _ring_sprite(radius: int) -> np.ndarray:
+    """A 3px ripple ring of the given radius as a (2r+1, 2r+1) RGBA sprite."""
+    yy, xx = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+    dist = np.hypot(xx, yy)
+    sprite = np.zeros((2 * radius + 1, 2 * radius + 1, 4), dtype=np.uint8)
+    ring_alpha = max(20, 180 - int(radius * 3.5))
+    sprite[(dist <= radius + 0.5) & (dist > radius - 2.5)] = (*ACCENT_COLOR, ring_alpha)
+    return sprite
+
+
+def _paint(canvas: np.ndarray, sprite: np.ndarray, x: int, y: int, alpha: int | None = None) -> None:
+    """Overwrite canvas with the sprite's visible pixels, sprite top-left at (x, y).
+
+    Pixels are replaced rather than blended, as ImageDraw does on RGBA
+    images; alpha, when given, replaces the sprite's own alpha.
+    """
+    region = canvas[y:y + sprite.shape[0], x:x + sprite.shape[1]]
+    visible = sprite[:, :, 3] > 0
+    region[visible] = sprite[visible]
+    if alpha is not None:
+        region[visible, 3] = alpha
+
+
+# Click frames are rendered in a small box with the click point at
+# (CLICK_ORIGIN, CLICK_ORIGIN), so one rendering serves every click.
+CLICK_ORIGIN = RIPPLE_MAX_RADIUS
+CLICK_BOX = CLICK_ORIGIN + max(RIPPLE_MAX_RADIUS, CURSOR_SIZE) + 1
+
+
+def _create_cursor_frame(cursor_alpha: int, ripple_radius: int | None = None) -> np.ndarray:
+    """Render one CLICK_BOX-sized RGBA frame with a cursor pointer and optional ripple."""
+    frame = np.zeros((CLICK_BOX, CLICK_BOX, 4), dtype=np.uint8)
     # Draw cursor
     if cursor_alpha > 0:
-        _draw_cursor(draw, cx, cy, size=24, alpha=cursor_alpha)
+        _paint(frame, _cursor_sprite(), CLICK_ORIGIN, CLICK_ORIGIN, alpha=cursor_alpha)
     # Draw ripple ring if active
     if ripple_radius is not None and ripple_radius > 0:
-        r, g, b = ACCENT_COLOR
-        ring_alpha = max(20, 180 - int(ripple_radius * 3.5))
-        draw.ellipse(
-            [cx - ripple_radius, cy - ripple_radius, cx + ripple_radius, cy + ripple_radius],
-            outline=(r, g, b, ring_alpha),
-            width=3,
-        )
-    return np.array(img)
+        ring = _ring_sprite(min(ripple_radius, RIPPLE_MAX_RADIUS))
+        offset = CLICK_ORIGIN - ring.shape[0] // 2
+        _paint(frame, ring, offset, offset)
+    return frame
 
 
-def _create_path_frame(
-    width: int, height: int,
-    x1: int, y1: int, x2: int, y2: int,
-    progress: float,
-) -> np.ndarray:
-    """Render one RGBA frame with a dashed line drawn from (x1,y1) toward (x2,y2) and cursor at the tip."""
-    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
-    r, g, b = ACCENT_COLOR
-
-    # Current tip position
-    tip_x = int(x1 + (x2 - x1) * progress)
-    tip_y = int(y1 + (y2 - y1) * progress)
+@functools.cache
+def _ripple_frames(fps: int) -> tuple[np.ndarray, ...]:
+    """The CURSOR_DURATION cursor + ripple animation as CLICK_BOX-sized RGBA frames.
 
-    # Draw dashed line from start to current tip
+    The animation is the same at every click point, so it is rendered once
+    per process; callers must not modify the frames.
+    """
+    n_frames = int(CURSOR_DURATION * fps)
+    frames = []
+    for fi in range(n_frames):
+        progress = fi / max(1, n_frames - 1)
+        if progress < 0.2:
+            cursor_alpha = int(230 * (progress / 0.2))
+            ripple_r = None
+        elif progress < 0.7:
+            cursor_alpha = 230
+            ripple_progress = (progress - 0.2) / 0.5
+            ripple_r = max(1, int(ripple_progress * RIPPLE_MAX_RADIUS))
+        else:
+            fade = 1.0 - (progress - 0.7) / 0.3
+            cursor_alpha = int(230 * fade)
+            ripple_r = max(1, int(RIPPLE_MAX_RADIUS * fade))
+        frames.append(_create_cursor_frame(cursor_alpha, ripple_r))
+    return tuple(frames)
+
+
+def _path_frame_renderer(
+    x1: int, y1: int, x2: int, y2: int, n_frames: int,
+) -> tuple[Callable[[int], np.ndarray], tuple[int, int]]:
+    """Prepare a dashed line drawn from (x1,y1) toward (x2,y2) with the cursor at the tip.
+
+    Returns render(index) for frames 0..n_frames-1 and the top-left corner
+    of their box in video coordinates; frames cover only the line's bounding
+    box. The full line is drawn once and each frame reveals the part whose
+    projection onto the line is within its progress.
+    """
+    r, g, b = ACCENT_COLOR
+    dot_r = 5
+    left, top = min(x1, x2) - dot_r, min(y1, y2) - dot_r
+    width = max(x1, x2) + max(dot_r, CURSOR_SIZE) + 1 - left
+    height = max(y1, y2) + max(dot_r, CURSOR_SIZE) + 1 - top
+    ax, ay, bx, by = x1 - left, y1 - top, x2 - left, y2 - top
+
+    # Dashed line at full progress
+    line_img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(line_img)
     total_dist = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
-    drawn_dist = total_dist * progress
-    if drawn_dist > 2 and total_dist > 0:
+    if total_dist > 0:
         dash_on, dash_off = 10, 6
         d = 0.0
-        while d < drawn_dist:
+        while d < total_dist:
             seg_s = d / total_dist
-            seg_e = min((d + dash_on) / total_dist, progress)
-            sx = int(x1 + (x2 - x1) * seg_s)
-            sy = int(y1 + (y2 - y1) * seg_s)
-            ex = int(x1 + (x2 - x1) * seg_e)
-            ey = int(y1 + (y2 - y1) * seg_e)
+            seg_e = min((d + dash_on) / total_dist, 1.0)
+            sx = int(ax + (bx - ax) * seg_s)
+            sy = int(ay + (by - ay) * seg_s)
+            ex = int(ax + (bx - ax) * seg_e)
+            ey = int(ay + (by - ay) * seg_e)
             draw.line([(sx, sy), (ex, ey)], fill=(r, g, b, 160), width=2)
             d += dash_on + dash_off
+    line = np.array(line_img)
+    yy, xx = np.ogrid[:height, :width]
+    along = ((xx - ax) * (bx - ax) + (yy - ay) * (by - ay)).astype(np.float32) / max(total_dist ** 2, 1.0)
 
     # Small origin dot
-    dot_r = 5
-    draw.ellipse(
-        [x1 - dot_r, y1 - dot_r, x1 + dot_r, y1 + dot_r],
-        fill=(r, g, b, 140),
-    )
-
-    # Cursor at tip
-    _draw_cursor(draw, tip_x, tip_y, size=24, alpha=220)
-
-    return np.array(img)
-
-
-def _build_animated_ripple(frames: list[np.ndarray], duration: float, fps: int) -> CompositeVideoClip:
-    """Build an animated ripple from pre-rendered RGBA frames."""
-    clips = []
-    frame_dur = 1.0 / fps
+    dot_img = Image.new("RGBA", (2 * dot_r + 1, 2 * dot_r + 1), (0, 0, 0, 0))
+    ImageDraw.Draw(dot_img).ellipse([0, 0, 2 * dot_r, 2 * dot_r], fill=(r, g, b, 140))
+    dot = np.array(dot_img)
+
+    def render(index: int) -> np.ndarray:
+        progress = index / max(1, n_frames - 1)
+        frame = np.zeros_like(line)
+        if total_dist * progress > 2:
+            np.copyto(frame, line, where=(along <= progress)[:, :, None])
+        _paint(frame, dot, ax - dot_r, ay - dot_r)
+        # Cursor at tip
+        tip_x = int(ax + (bx - ax) * progress)
+        tip_y = int(ay + (by - ay) * progress)
+        _paint(frame, _cursor_sprite(), tip_x, tip_y, alpha=220)
+        return frame
+
+    return render, (left, top)
+
+
+def _write_frames(frames_dir: str, name: str, frames: Iterable[np.ndarray]) -> str:
+    """Save RGBA frames as a PNG sequence; returns the ffmpeg image2 input pattern."""
+    pattern = os.path.join(frames_dir, f"{name}_%04d.png")
     for i, frame in enumerate(frames):
-        # Split RGBA into RGB + mask
-        rgb = frame[:, :, :3]
-        alpha = frame[:, :, 3].astype(float) / 255.0
-        clip = (
-            ImageClip(rgb, duration=frame_dur)
-            .set_start(i * frame_dur)
-            .set_mask(ImageClip(alpha, ismask=True, duration=frame_dur))
-        )
-        clips.append(clip)
-
-    return CompositeVideoClip(clips, use_bgclip=False).set_duration(duration)
+        # Mostly transparent boxes: fast compression is nearly as small
+        Image.fromarray(frame).save(pattern % i, compress_level=1)
+    return pattern
 
 
 def _has_nearby_action(action_log: list[dict], start_s: float, end_s: float, margin_s: float = 1.0) -> bool:
@@ -494,153 +866,210 @@ def _has_nearby_action(action_log: list[dict], start_s: float, end_s: float, mar
     return False
 
 
-def _detect_transitions(video_clip: VideoFileClip) -> list[float]:
-    """Detect visual transitions (screen changes from clicks/navigation) in the video.
+def _frame_diff(a: np.ndarray, b: np.ndarray, scratch: np.ndarray) -> float:
+    """Mean absolute difference of two uint8 frames, in [0, 1].
 
-    Samples frames and returns timestamps (seconds) where consecutive frames
-    differ significantly — indicating a user interaction changed the screen.
+    max - min gives |a - b| without leaving uint8, so no float64 copies of
+    the frames are made; scratch is a reusable (2, *frame.shape) uint8 buffer.
     """
-    duration = video_clip.duration
-    sample_fps = 8  # 8 fps sampling for transition detection
-    n_samples = int(duration * sample_fps)
-
-    if n_samples < 2:
-        return []
+    hi, lo = scratch
+    np.maximum(a, b, out=hi)
+    np.minimum(a, b, out=lo)
+    np.subtract(hi, lo, out=hi)
+    return float(hi.mean()) / 255.0
 
-    transitions: list[float] = []
-    prev_frame = None
-    last_t = -TRANSITION_MIN_GAP
 
-    for i in range(n_samples):
-        t = min(i / sample_fps, duration - 0.01)
-        frame = video_clip.get_frame(t)
+def _diff_scratch(frame: np.ndarray, scratch: np.ndarray | None) -> np.ndarray:
+    """Return scratch if it fits frame, else a new buffer for _frame_diff."""
+    if scratch is None or scratch.shape[1:] != frame.shape:
+        scratch = np.empty((2, *frame.shape), dtype=np.uint8)
+    return scratch
 
-        if prev_frame is not None:
-            diff = np.mean(np.abs(frame.astype(float) - prev_frame.astype(float))) / 255.0
-            if diff > TRANSITION_DIFF_THRESHOLD and (t - last_t) >= TRANSITION_MIN_GAP:
-                # Stability check: verify the change persists (not a transient overlay/spinner)
-                check_t = min(t + TRANSITION_STABILITY_DELAY, duration - 0.01)
-                if check_t > t + 0.05:
-                    stable_frame = video_clip.get_frame(check_t)
-                    revert_diff = np.mean(np.abs(stable_frame.astype(float) - prev_frame.astype(float))) / 255.0
-                    if revert_diff < TRANSITION_DIFF_THRESHOLD:
-                        # Change reverted — transient animation, skip
-                        prev_frame = frame
-                        continue
-                transitions.append(t)
-                last_t = t
 
-        prev_frame = frame
+def _sample_diffs(video: VideoFileClip, stability: bool = True) -> tuple[np.ndarray, dict[int, float]]:
+    """Decode samples at FRAME_SAMPLE_FPS once and return their diffs.
 
-    logger.info("Detected %d visual transitions in %.1fs video", len(transitions), duration)
-    return transitions
+    diffs[i] is the diff between samples i-1 and i (diffs[0] is 0). When
+    stability is set, stable[i] is the diff between sample i-1 and the sample
+    TRANSITION_STABILITY_DELAY after i, for every i whose diff exceeds
+    TRANSITION_DIFF_THRESHOLD (absent when the video ends first). Only a
+    rolling window of decimated frames is kept in memory.
 
+    Without stability (keep segments only), decoding stops as soon as the
+    rest of the video is too short for a static stretch to exceed
+    STATIC_THRESHOLD; the diffs then cover only the samples decoded.
+    """
+    lookahead = max(1, math.ceil(TRANSITION_STABILITY_DELAY * FRAME_SAMPLE_FPS))
+    sample_interval = 1.0 / FRAME_SAMPLE_FPS
+    static_start: float | None = None
+    window: deque[np.ndarray] = deque(maxlen=lookahead + 2)  # samples i-1 .. i+lookahead
+    diffs: list[float] = []
+    stable: dict[int, float] = {}
+    scratch: np.ndarray | None = None
+
+    for j, full_frame in enumerate(video.iter_frames(fps=FRAME_SAMPLE_FPS, dtype="uint8")):
+        # Decimate rather than average: thin changes (text, cursors) keep their
+        # per-pixel magnitude, so the thresholds stay valid at 1/16 the bytes
+        frame = np.ascontiguousarray(full_frame[::FRAME_DIFF_STRIDE, ::FRAME_DIFF_STRIDE])
+        diff = 0.0
+        if window:
+            scratch = _diff_scratch(frame, scratch)
+            diff = _frame_diff(frame, window[-1], scratch)
+        window.append(frame)
+        diffs.append(diff)
+
+        i = j - lookahead
+        if stability:
+            if len(window) == window.maxlen and diffs[i] > TRANSITION_DIFF_THRESHOLD:
+                stable[i] = _frame_diff(frame, window[0], scratch)
+            continue
+        # A stretch trimmed by _find_keep_segments must start no earlier than
+        # the current static run (or this sample, outside one)
+        if j and diff < FRAME_DIFF_THRESHOLD:
+            if static_start is None:
+                static_start = j * sample_interval - sample_interval
+        else:
+            static_start = None
+        earliest = static_start if static_start is not None else j * sample_interval
+        if video.duration - earliest <= STATIC_THRESHOLD:
+            break
 
-def _deduplicate_frames(
-    video: VideoFileClip, action_log: list[dict] | None = None,
-) -> tuple[VideoFileClip, list[tuple[float, float]]]:
-    """Remove long static segments from the video.
+    return np.asarray(diffs), stable
 
-    Compares frames sampled at FRAME_SAMPLE_FPS. If consecutive frames are
-    identical for longer than STATIC_THRESHOLD, trims the static segment
-    down to STATIC_KEEP seconds. Skips trimming if user actions occur nearby
-    (intentional viewing pauses).
 
-    Returns (deduped_clip, keep_segments) where keep_segments maps original
-    timeline ranges that were kept.
+def _find_transitions(diffs: np.ndarray, stable: dict[int, float]) -> list[float]:
+    """Timestamps where consecutive samples differ significantly and the change persists."""
+    sample_interval = 1.0 / FRAME_SAMPLE_FPS
+    found: list[float] = []
+    last_t = -TRANSITION_MIN_GAP
+    for i in np.flatnonzero(diffs > TRANSITION_DIFF_THRESHOLD).tolist():
+        t = i * sample_interval
+        if (t - last_t) < TRANSITION_MIN_GAP:
+            continue
+        # Stability check: verify the change persists (not a transient overlay/spinner);
+        # samples too close to the end have no stability frame and are accepted
+        if stable.get(i, 1.0) < TRANSITION_DIFF_THRESHOLD:
+            continue  # change reverted — transient animation, skip
+        found.append(t)
+        last_t = t
+    return found
+
+
+def _find_keep_segments(
+    diffs: np.ndarray, duration: float, action_log: list[dict] | None,
+) -> list[tuple[float, float]]:
+    """Original-timeline (start, end) ranges left after trimming long static stretches."""
+    sample_interval = 1.0 / FRAME_SAMPLE_FPS
+    # Runs of static samples: [first, end) sample indices, found without a Python loop
+    is_static = (diffs[1:] < FRAME_DIFF_THRESHOLD).astype(np.int8)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], is_static, [0])))) + 1
+    keep_segments: list[tuple[float, float]] = []  # (start, end) pairs
+    last_end = 0.0
+    for first, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+        static_start = first * sample_interval - sample_interval
+        static_end = end * sample_interval if end < len(diffs) else duration
+        if static_end - static_start <= STATIC_THRESHOLD:
+            continue
+        # Skip trim if user actions occur near this static segment
+        if action_log and _has_nearby_action(action_log, static_start, static_end):
+            continue  # intentional viewing pause — keep it
+        keep_segments.append((last_end, static_start + STATIC_KEEP))
+        last_end = static_end
+    if last_end < duration:
+        keep_segments.append((last_end, duration))
+    return keep_segments
+
+
+def _scan_video(
+    video: VideoFileClip,
+    action_log: list[dict] | None = None,
+    *,
+    transitions: bool = True,
+    static: bool = True,
+) -> tuple[list[float], list[tuple[float, float]]]:
+    """Find visual transitions and static segments in one sequential decode.
+
+    Samples frames at FRAME_SAMPLE_FPS into a 1-D diff array, then scans it
+    for both analyses (either can be switched off):
+
+    - transitions: timestamps (seconds) where consecutive samples differ
+      significantly and the change persists TRANSITION_STABILITY_DELAY later
+      — indicating a user interaction changed the screen.
+    - keep segments: original-timeline (start, end) ranges left after
+      trimming static stretches longer than STATIC_THRESHOLD down to
+      STATIC_KEEP, unless user actions occur nearby (intentional pauses).
     """
     duration = video.duration
-    sample_interval = 1.0 / FRAME_SAMPLE_FPS
-    n_samples = int(duration * FRAME_SAMPLE_FPS)
+    if int(duration * FRAME_SAMPLE_FPS) < 2 or (not transitions and duration <= STATIC_THRESHOLD):
+        return [], [(0.0, duration)]
 
-    if n_samples < 2:
-        return video, [(0.0, duration)]
+    diffs, stable = _sample_diffs(video, stability=transitions)
+    found: list[float] = []
+    if transitions:
+        found = _find_transitions(diffs, stable)
+        logger.info("Detected %d visual transitions in %.1fs video", len(found), duration)
+    keep_segments = _find_keep_segments(diffs, duration, action_log) if static else [(0.0, duration)]
+    return found, keep_segments
 
-    # Sample frames and find static segments
-    prev_frame = None
-    static_start = None
-    keep_segments: list[tuple[float, float]] = []  # (start, end) pairs
-    last_end = 0.0
 
-    for i in range(n_samples):
-        t = i * sample_interval
-        frame = video.get_frame(min(t, duration - 0.01))
-
-        if prev_frame is not None:
-            # Compare frames: fraction of pixels that differ
-            diff = np.mean(np.abs(frame.astype(float) - prev_frame.astype(float))) / 255.0
-            is_static = diff < FRAME_DIFF_THRESHOLD
-
-            if is_static and static_start is None:
-                static_start = t - sample_interval
-            elif not is_static and static_start is not None:
-                static_end = t
-                static_dur = static_end - static_start
-                if static_dur > STATIC_THRESHOLD:
-                    # Skip trim if user actions occur near this static segment
-                    if action_log and _has_nearby_action(action_log, static_start, static_end):
-                        pass  # intentional viewing pause — keep it
-                    else:
-                        keep_segments.append((last_end, static_start + STATIC_KEEP))
-                        last_end = static_end
-                static_start = None
-
-        prev_frame = frame
-
-    # Handle trailing static
-    if static_start is not None:
-        static_dur = duration - static_start
-        if static_dur > STATIC_THRESHOLD and not (action_log and _has_nearby_action(action_log, static_start, duration)):
-            keep_segments.append((last_end, static_start + STATIC_KEEP))
-            last_end = duration
-        else:
-            keep_segments.append((last_end, duration))
-    else:
-        keep_segments.append((last_end, duration))
+def _detect_transitions(video_clip: VideoFileClip) -> list[float]:
+    """Detect visual transitions (screen changes from clicks/navigation) in the video."""
+    return _scan_video(video_clip, static=False)[0]
 
-    if not keep_segments:
-        return video, [(0.0, duration)]
 
-    # If no trimming needed, return original
+def _kept_subclip_ranges(keep_segments: list[tuple[float, float]], duration: float) -> list[tuple[float, float]]:
+    """Ranges of keep_segments long enough to become subclips, clamped to the video."""
+    return [(start, min(end, duration)) for start, end in keep_segments if end > start + 0.05]  # minimum clip length
+
+
+def _deduplicated_duration(keep_segments: list[tuple[float, float]], duration: float) -> float:
+    """Duration of the output once _deduplicate_frames trims the video to keep_segments."""
+    total_kept = sum(end - start for start, end in keep_segments)
+    ranges = _kept_subclip_ranges(keep_segments, duration)
+    if abs(total_kept - duration) < 0.1 or not ranges:
+        return duration
+    return sum(end - start for start, end in ranges)
+
+
+def _deduplicate_frames(
+    video: VideoFileClip, action_log: list[dict] | None = None,
+) -> tuple[list[tuple[float, float]] | None, list[tuple[float, float]]]:
+    """Find the long static segments to remove from the video (see _scan_video).
+
+    Returns (ranges, keep_segments): ranges are the source subclips to
+    concatenate, or None when nothing is trimmed; keep_segments maps original
+    timeline ranges that were kept.
+    """
+    duration = video.duration
+    _, keep_segments = _scan_video(video, action_log, transitions=False)
+
+    # If no trimming needed, keep the original
     total_kept = sum(end - start for start, end in keep_segments)
     if abs(total_kept - duration) < 0.1:
-        return video, keep_segments
+        return None, keep_segments
 
     logger.info(
         "Frame dedup: %.1fs → %.1fs (removed %.1fs of static)",
         duration, total_kept, duration - total_kept,
     )
 
-    # Build subclips
-    subclips = []
-    for start, end in keep_segments:
-        if end > start + 0.05:  # minimum clip length
-            subclips.append(video.subclip(start, min(end, duration)))
-
-    if not subclips:
-        return video, [(0.0, duration)]
+    ranges = _kept_subclip_ranges(keep_segments, duration)
+    if not ranges:
+        return None, [(0.0, duration)]
 
-    return concatenate_videoclips(subclips, method="compose"), keep_segments
+    return ranges, keep_segments
 
 
-def _pre_scan_video(video_path: str) -> dict:
+def _pre_scan_video(video: VideoFileClip) -> dict:
     """Quick pre-scan: detect transitions and estimate deduped duration.
 
     Runs BEFORE Phase 1 so Claude can anchor narration to real visual changes.
+    One decode pass serves both analyses, and the deduped duration is computed
+    from the keep segments rather than by building the trimmed clip.
     """
-    video = _load_video_clip(video_path)
     original_duration = video.duration
-    transitions = _detect_transitions(video)
-
-    # Run dedup to get keep_segments and deduped duration
-    deduped, keep_segments = _deduplicate_frames(video)
-    deduped_duration = deduped.duration
-
-    # Close clips (deduped may be the same object as video if no trimming)
-    if deduped is not video:
-        deduped.close()
-    video.close()
-
+    transitions, keep_segments = _scan_video(video)
+    deduped_duration = _deduplicated_duration(keep_segments, original_duration)
     logger.info(
         "Pre-scan: %d transitions, deduped %.1fs → %.1fs",
         len(transitions), original_duration, deduped_duration,
@@ -666,30 +1095,34 @@ def _build_time_remap(
 
     # Pre-compute cumulative start offsets in the deduped timeline
     cumulative: list[float] = []
+    ends: list[float] = []  # sorted, for bisecting to a timestamp's segment
     running = 0.0
     for start, end in keep_segments:
         cumulative.append(running)
+        ends.append(end)
         running += (end - start)
     total = running
 
     def remap(orig_t: float) -> float:
         if orig_t <= keep_segments[0][0]:
             return 0.0
-        if orig_t >= keep_segments[-1][1]:
+        if orig_t >= ends[-1]:
             return total
-        for i, (s, e) in enumerate(keep_segments):
-            if orig_t <= e:
-                if orig_t >= s:
-                    return cumulative[i] + (orig_t - s)
-                else:
-                    return cumulative[i]
-        return total
+        # First segment ending at or after orig_t; timestamps in a trimmed gap
+        # before it land on the segment's start
+        i = bisect.bisect_left(ends, orig_t)
+        return cumulative[i] + max(0.0, orig_t - keep_segments[i][0])
 
     return remap
 
 
+@functools.lru_cache(maxsize=8)
 def _get_font(size: int = 28) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
-    """Get a font for subtitle rendering, trying common system paths."""
+    """Get a font for subtitle rendering, trying common system paths.
+
+    Cached per size: fonts are only read after loading, so one instance
+    serves every subtitle.
+    """
     candidates = [
         "/System/Library/Fonts/Helvetica.ttc",
         "/System/Library/Fonts/SFNSText.ttf",
@@ -706,34 +1139,37 @@ def _get_font(size: int = 28) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
     return ImageFont.load_default()
 
 
-def _make_subtitle_clip(
-    text: str,
-    duration: float,
-    video_width: int,
-    video_height: int,
-) -> ImageClip:
-    """Create a subtitle overlay with semi-transparent background using Pillow."""
+@functools.lru_cache(maxsize=256)
+def _render_subtitle(text: str, video_width: int) -> Image.Image:
+    """Render a subtitle bar (semi-transparent background) as an RGBA image with Pillow.
+
+    Cached, so repeated subtitles share one bitmap; callers must not modify it.
+    """
     font = _get_font(28)
     max_text_width = video_width - 100
     padding = 10
 
-    # Word-wrap text to fit within max_text_width
-    words = text.split()
-    lines: list[str] = []
-    current_line = ""
-    for word in words:
-        test_line = f"{current_line} {word}".strip()
-        bbox = font.getbbox(test_line)
-        if bbox[2] - bbox[0] > max_text_width and current_line:
-            lines.append(current_line)
-            current_line = word
+    # Word-wrap text to fit within max_text_width, measuring each word once
+    # and summing advances instead of re-measuring the growing line
+    space_w = font.getlength(" ")
+    lines: list[tuple[str, float]] = []  # (line, width)
+    current_words: list[str] = []
+    current_w = 0.0
+    for word in text.split():
+        word_w = font.getlength(word)
+        test_w = current_w + space_w + word_w if current_words else word_w
+        if test_w > max_text_width and current_words:
+            lines.append((" ".join(current_words), current_w))
+            current_words, current_w = [word], word_w
         else:
-            current_line = test_line
-    if current_line:
-        lines.append(current_line)
+            current_words.append(word)
+            current_w = test_w
+    if current_words:
+        lines.append((" ".join(current_words), current_w))
 
     # Calculate text block height
-    line_height = font.getbbox("Ay")[3] - font.getbbox("Ay")[1] + 4
+    ay_bbox = font.getbbox("Ay")
+    line_height = ay_bbox[3] - ay_bbox[1] + 4
     text_height = line_height * len(lines)
     bar_height = text_height + padding * 2
 
@@ -741,22 +1177,77 @@ def _make_subtitle_clip(
     img = Image.new("RGBA", (video_width, bar_height), (0, 0, 0, 180))
     draw = ImageDraw.Draw(img)
     y = padding
-    for line in lines:
-        bbox = font.getbbox(line)
-        line_w = bbox[2] - bbox[0]
-        x = (video_width - line_w) // 2
+    for line, line_w in lines:
+        x = int(video_width - line_w) // 2
         draw.text((x, y), line, fill=(255, 255, 255, 255), font=font)
         y += line_height
 
-    arr = np.array(img)
-    rgb = arr[:, :, :3]
-    alpha = arr[:, :, 3].astype(float) / 255.0
+    return img
+
+
+# Raw action descriptions → subtitle text, tried in order
+_CLICK_DESCRIPTION_RES = (
+    re.compile(r"Clicked\s+(?:text|button|link|element)\s+'(.+?)'", re.IGNORECASE),  # "Clicked text 'Suppliers'"
+    re.compile(r"Clicked\s+'(.+?)'", re.IGNORECASE),
+    re.compile(r"Clicked\s+(.+)", re.IGNORECASE),
+)
+_TYPED_DESCRIPTION_RE = re.compile(r"Typed\s+'(.+?)'", re.IGNORECASE)
+_PRESSED_DESCRIPTION_RE = re.compile(r"Pressed\s+(.+)", re.IGNORECASE)
+
+
+def _ass_time(seconds: float) -> str:
+    """Format seconds as an ASS timestamp (H:MM:SS.cc)."""
+    cs = round(seconds * 100)
+    return f"{cs // 360000}:{cs // 6000 % 60:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
 
-    clip = ImageClip(rgb, duration=duration)
-    mask = ImageClip(alpha, ismask=True, duration=duration)
-    clip = clip.set_mask(mask)
-    clip = clip.set_position(("center", video_height - bar_height - 20))
-    return clip
+
+def _write_ass(subtitles: list[tuple[float, float, str]], path: str, video_width: int, video_height: int) -> None:
+    """Write (start_s, duration_s, text) subtitles as an ASS file for ffmpeg's subtitles filter.
+
+    The style mirrors _render_subtitle: 28px white text, centred 20px above
+    the bottom in a semi-transparent black box, wrapped to width - 100.
+    """
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {video_width}",
+        f"PlayResY: {video_height}",
+        "WrapStyle: 0",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BackColour, Bold, "
+        "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV",
+        # BorderStyle 3 draws an opaque box; alpha 4B ≈ the PIL bar's 180/255 opacity
+        "Style: Default,Arial,28,&H00FFFFFF,&H4B000000,&H4B000000,0,3,10,0,2,50,50,30",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Text",
+    ]
+    for start_s, dur, text in subtitles:
+        # Braces would start override blocks
+        clean = " ".join(text.split()).replace("{", "(").replace("}", ")")
+        lines.append(f"Dialogue: 0,{_ass_time(start_s)},{_ass_time(start_s + dur)},Default,{clean}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _merge_repeated_subtitles(
+    subtitles: list[tuple[float, float, str]],
+) -> list[tuple[float, float, str]]:
+    """Join consecutive (start_s, duration_s, text) subtitles that repeat the same text.
+
+    e.g. several clicks on the same button would otherwise flash the same
+    caption on and off; within SUBTITLE_MERGE_GAP they become one subtitle.
+    """
+    merged: list[tuple[float, float, str]] = []
+    for start_s, dur, text in subtitles:
+        if merged:
+            prev_start, prev_dur, prev_text = merged[-1]
+            if text == prev_text and start_s - (prev_start + prev_dur) <= SUBTITLE_MERGE_GAP:
+                merged[-1] = (prev_start, max(prev_dur, start_s + dur - prev_start), text)
+                continue
+        merged.append((start_s, dur, text))
+    return merged
 
 
 def _clean_action_description(description: str, action_type: str) -> str:
@@ -764,25 +1255,20 @@ def _clean_action_description(description: str, action_type: str) -> str:
     desc = description.strip()
     if action_type == "click":
         # "Clicked text 'Suppliers'" → "Click on Suppliers"
-        m = re.match(r"Clicked\s+(?:text|button|link|element)\s+'(.+?)'", desc, re.IGNORECASE)
-        if m:
-            return f"Click on {m.group(1)}"
-        m = re.match(r"Clicked\s+'(.+?)'", desc, re.IGNORECASE)
-        if m:
-            return f"Click on {m.group(1)}"
-        m = re.match(r"Clicked\s+(.+)", desc, re.IGNORECASE)
-        if m:
-            return f"Click on {m.group(1)}"
+        for pattern in _CLICK_DESCRIPTION_RES:
+            m = pattern.match(desc)
+            if m:
+                return f"Click on {m.group(1)}"
         return "Click"
     elif action_type == "type":
         # "Typed 'hello' into input" → "Type 'hello'"
-        m = re.match(r"Typed\s+'(.+?)'", desc, re.IGNORECASE)
+        m = _TYPED_DESCRIPTION_RE.match(desc)
         if m:
             return f"Type '{m.group(1)}'"
         return desc
     elif action_type == "key_press":
         # "Pressed Enter" → "Press Enter"
-        m = re.match(r"Pressed\s+(.+)", desc, re.IGNORECASE)
+        m = _PRESSED_DESCRIPTION_RE.match(desc)
         if m:
             return f"Press {m.group(1)}"
         return desc
@@ -828,27 +1314,132 @@ def _build_action_subtitles(action_log: list[dict], video_duration: float) -> li
     return subtitles
 
 
+def _assemble_video(
+    video_path: str,
+    output_path: str,
+    duration: float,
+    ranges: list[tuple[float, float]] | None,
+    sources: list[list[str]],
+    overlays: list[tuple[int, float, int, int]],
+    ass_path: str | None,
+    narrations: list[tuple[str, float]],
+    source_audio: bool,
+) -> None:
+    """Render the final video with a single ffmpeg filter graph.
+
+    ranges are the source subclips to keep (None keeps everything). sources
+    are extra ffmpeg input arguments (PNG sequences and stills); overlays are
+    (source index, start_s, x, y) placements on the output timeline, drawn in
+    order. ass_path, when given, is burnt in last.
+    """
+    inputs = ["-i", video_path]
+    for args in sources:
+        inputs += args
+
+    filters: list[str] = []
+    if ranges:
+        for k, (start, end) in enumerate(ranges):
+            filters.append(f"[0:v]trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS[c{k}]")
+        parts = "".join(f"[c{k}]" for k in range(len(ranges)))
+        filters.append(f"{parts}concat=n={len(ranges)}:v=1:a=0,fps=30[base]")
+    else:
+        filters.append("[0:v]fps=30[base]")
+
+    # An input used by several overlays (the ripple) is split, so it is decoded once
+    labels: dict[int, list[str]] = {}
+    for src, uses in Counter(src for src, _, _, _ in overlays).items():
+        if uses == 1:
+            labels[src] = [f"{src + 1}:v"]
+        else:
+            labels[src] = [f"r{src}_{j}" for j in range(uses)]
+            filters.append(f"[{src + 1}:v]split={uses}" + "".join(f"[{label}]" for label in labels[src]))
+    current = "base"
+    for k, (src, start_s, x, y) in enumerate(overlays):
+        filters.append(f"[{labels[src].pop()}]setpts=PTS-STARTPTS+{start_s:.3f}/TB[o{k}]")
+        filters.append(f"[{current}][o{k}]overlay=x={x}:y={y}:eof_action=pass[v{k}]")
+        current = f"v{k}"
+    if ass_path:
+        filter_path = ass_path.replace("\\", "/").replace(":", "\\:")
+        filters.append(f"[{current}]subtitles=filename={filter_path}[vsub]")
+        current = "vsub"
+
+    audio_filters: list[str] = []
+    audio_args: list[str] = []
+    if narrations or source_audio:
+        audio_inputs, audio_filters = _audio_mix_graph(
+            narrations, 1 + len(sources),
+            source_ranges=(ranges or [(0.0, duration)]) if source_audio else None,
+        )
+        inputs += audio_inputs
+        audio_args = ["-map", "[aout]", "-c:a", "aac"]
+
+    def run(video_filters: list[str], video_args: list[str]) -> subprocess.CompletedProcess:
+        graph = video_filters + audio_filters
+        return subprocess.run(
+            [_get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error", *inputs,
+             *(["-filter_complex", ";".join(graph)] if graph else []), *video_args, *audio_args,
+             # faststart moves the index to the front so the browser can play before download ends
+             "-t", f"{duration:.3f}", "-movflags", "+faststart", output_path],
+            capture_output=True, text=True,
+        )
+
+    def encode(codec: str, codec_params: list[str]) -> subprocess.CompletedProcess:
+        return run(filters, ["-map", f"[{current}]", "-c:v", codec, *codec_params])
+
+    # Nothing to cut or draw: a browser-playable H.264 source (e.g. a .mov) is copied as is
+    if not ranges and not overlays and not ass_path and _probe_video_format(video_path) == ("h264", "yuv420p"):
+        result = run([], ["-map", "0:v", "-c:v", "copy"])
+        if result.returncode == 0:
+            return
+        logger.warning("Copying the video stream failed, re-encoding: %s", result.stderr.strip()[-500:])
+
+    # libx264 encodes at constant quality (CRF) on a fast preset — screen
+    # recordings compress well — instead of a fixed bitrate
+    x264_params = ["-preset", os.getenv("VIDEO_PRESET", "veryfast"), "-crf", "23", "-pix_fmt", "yuv420p"]
+    codec, codec_params = _video_encoder()
+    if codec == "libx264":
+        result = encode(codec, x264_params)
+    else:
+        settings = _HW_ENCODER_SETTINGS.get(codec, _HW_ENCODER_DEFAULT_SETTINGS)
+        bitrate = ["-b:v", settings["bitrate"]] if settings["bitrate"] else []
+        result = encode(codec, codec_params + ["-preset", settings["preset"], *bitrate, *settings["ffmpeg_params"]])
+        if result.returncode != 0:
+            # e.g. the GPU's concurrent-session limit is reached — encode on the CPU
+            logger.warning(
+                "Hardware encoder %s failed, re-encoding with libx264: %s", codec, result.stderr.strip()[-500:],
+            )
+            result = encode("libx264", x264_params)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg export failed: {result.stderr.strip()[-500:]}")
+
+
 def _process_video(
     video_path: str,
     action_log: list[dict],
     narration_segments: list[dict],
     output_path: str,
     pre_scan: dict | None = None,
+    video_clip: VideoFileClip | None = None,
 ) -> dict[str, Any]:
     """Phase 3: Process video with dedup, click animations, subtitles, and audio.
 
     Args:
         pre_scan: Optional pre-scan data from _pre_scan_video() containing
             transitions, keep_segments, and deduped_duration_s.
+        video_clip: Optional already-open clip of video_path; the caller
+            keeps ownership and closes it.
     """
     original_action_log = bool(action_log)
-    video = _load_video_clip(video_path)
+    video = video_clip if video_clip is not None else _load_video_clip(video_path)
     original_duration = video.duration
     w, h = video.size
+    # Keep original audio at low volume if present
+    has_source_audio = video.audio is not None
 
-    # Step 1: Frame deduplication (action-aware)
-    video, keep_segments = _deduplicate_frames(video, action_log)
-    deduped_duration = video.duration
+    # Step 1: Frame deduplication (action-aware). The clip is only scanned;
+    # ffmpeg cuts the kept ranges while encoding
+    ranges, keep_segments = _deduplicate_frames(video, action_log)
+    deduped_duration = _deduplicated_duration(keep_segments, original_duration)
     remap = _build_time_remap(keep_segments)
 
     # Remap narration segment timestamps from original timeline to deduped timeline
@@ -862,31 +1453,31 @@ def _process_video(
         if pre_scan and pre_scan.get("transitions"):
             transitions = [remap(t) for t in pre_scan["transitions"]]
         else:
-            # Fallback: detect on the deduped video (already in deduped timeline)
-            transitions = _detect_transitions(video)
+            # Fallback: detect on the source video and remap to deduped
+            transitions = [remap(t) for t in _detect_transitions(video)]
 
         # Collect narration segments that have click position estimates
+        # isinstance already rejects missing (None) values
         click_segments = [
             seg for seg in narration_segments
-            if seg.get("click_x_pct") is not None
-            and seg.get("click_y_pct") is not None
-            and isinstance(seg.get("click_x_pct"), (int, float))
+            if isinstance(seg.get("click_x_pct"), (int, float))
             and isinstance(seg.get("click_y_pct"), (int, float))
         ]
 
-        # Pair each detected transition with a click position estimate (in order)
+        # Pair each detected transition with a click position estimate (in
+        # order, until either runs out); positions are scaled and clamped as arrays
+        paired = click_segments[:len(transitions)]
+        pcts = np.array([(seg["click_x_pct"], seg["click_y_pct"]) for seg in paired], dtype=float).reshape(-1, 2)
+        positions = np.clip(pcts / 100.0 * (w, h), 0, (w - 1, h - 1)).tolist()
         synthetic = []
-        for i, t_s in enumerate(transitions):
-            if i >= len(click_segments):
-                break  # no more position estimates
-            seg = click_segments[i]
+        for t_s, seg, (x, y) in zip(transitions, paired, positions):
             # Place click animation slightly before the transition (click precedes screen change)
             click_t = max(0, t_s - CLICK_LEAD_TIME)
             synthetic.append({
                 "action_type": "click",
                 "timestamp_ms": int(click_t * 1000),
-                "x": max(0, min(seg["click_x_pct"] / 100.0 * w, w - 1)),
-                "y": max(0, min(seg["click_y_pct"] / 100.0 * h, h - 1)),
+                "x": x,
+                "y": y,
                 "description": seg.get("action_context", seg.get("text", "")),
             })
         if synthetic:
@@ -896,13 +1487,20 @@ def _process_video(
                 len(synthetic), len(transitions), len(click_segments),
             )
 
-    # Step 2: Build overlay clips (click ripples + subtitles)
-    overlays = []
+    if video_clip is None:
+        video.close()
+
+    # Step 2: Build overlays (click ripples + subtitles). Each is a PNG
+    # sequence or still that ffmpeg composites while encoding
+    frames_dir = tempfile.mkdtemp(prefix="demo_overlays_")
+    sources: list[list[str]] = []  # ffmpeg input arguments, one entry per input
+    overlays: list[tuple[int, float, int, int]] = []  # (source index, start_s, x, y)
 
     # Click path + ripple animations
     # Sort clicks by time; draw a guiding line between consecutive clicks
     anim_fps = 30
-    n_ripple_frames = int(CURSOR_DURATION * anim_fps)
+    ripple_source: int | None = None
+    click_animations = 0  # reported in the stats
     click_actions = sorted(
         [a for a in action_log if a.get("action_type") == "click" and a.get("x") is not None],
         key=lambda a: a["timestamp_ms"],
@@ -929,41 +1527,29 @@ def _process_video(
                 path_dur = t - path_start
             if path_dur > 0.08:
                 n_path_frames = max(2, int(path_dur * anim_fps))
-                path_frames = []
-                for fi in range(n_path_frames):
-                    p = fi / max(1, n_path_frames - 1)
-                    path_frames.append(_create_path_frame(w, h, px, py, x, y, p))
-                path_clip = _build_animated_ripple(path_frames, path_dur, anim_fps).set_start(path_start)
-                overlays.append(path_clip)
+                render_path, (left, top) = _path_frame_renderer(px, py, x, y, n_path_frames)
+                pattern = _write_frames(frames_dir, f"path{i}", map(render_path, range(n_path_frames)))
+                sources.append(["-framerate", str(anim_fps), "-i", pattern])
+                overlays.append((len(sources) - 1, path_start, left, top))
 
         # --- Ripple + cursor at click point ---
-        ripple_frames = []
-        for fi in range(n_ripple_frames):
-            progress = fi / max(1, n_ripple_frames - 1)
-            if progress < 0.2:
-                cursor_alpha = int(230 * (progress / 0.2))
-                ripple_r = None
-            elif progress < 0.7:
-                cursor_alpha = 230
-                ripple_progress = (progress - 0.2) / 0.5
-                ripple_r = max(1, int(ripple_progress * RIPPLE_MAX_RADIUS))
-            else:
-                fade = 1.0 - (progress - 0.7) / 0.3
-                cursor_alpha = int(230 * fade)
-                ripple_r = max(1, int(RIPPLE_MAX_RADIUS * fade))
-            ripple_frames.append(_create_cursor_frame(w, h, x, y, cursor_alpha, ripple_r))
-        anim_clip = _build_animated_ripple(ripple_frames, CURSOR_DURATION, anim_fps).set_start(t)
-        overlays.append(anim_clip)
-
-    # Subtitle overlays: prefer action-derived subtitles, fall back to narration
+        # One ripple input serves every click, repositioned by the overlay
+        if ripple_source is None:
+            pattern = _write_frames(frames_dir, "ripple", _ripple_frames(anim_fps))
+            sources.append(["-framerate", str(anim_fps), "-i", pattern])
+            ripple_source = len(sources) - 1
+        overlays.append((ripple_source, t, x - CLICK_ORIGIN, y - CLICK_ORIGIN))
+        click_animations += 1
+
+    # Subtitles: prefer action-derived subtitles, fall back to narration
+    subtitles: list[tuple[float, float, str]] = []  # (start_s, duration_s, text)
     action_subs = _build_action_subtitles(action_log, deduped_duration) if action_log else []
     if action_subs:
         for asub in action_subs:
             start_s = asub["start_s"]
             dur = asub["duration_s"]
             if start_s < deduped_duration and dur > 0.1:
-                sub = _make_subtitle_clip(asub["text"], dur, w, h).set_start(start_s)
-                overlays.append(sub)
+                subtitles.append((start_s, dur, asub["text"]))
     else:
         for seg in narration_segments:
             text = seg.get("text", "")
@@ -974,69 +1560,60 @@ def _process_video(
             if start_s < deduped_duration:
                 dur = min(dur, deduped_duration - start_s)
                 if dur > 0.1:
-                    sub = _make_subtitle_clip(text, dur, w, h).set_start(start_s)
-                    overlays.append(sub)
+                    subtitles.append((start_s, dur, text))
 
-    # Compose video with overlays
-    if overlays:
-        final_video = CompositeVideoClip([video] + overlays, size=(w, h))
-    else:
-        final_video = video
+    subtitles = _merge_repeated_subtitles(subtitles)
 
-    # Step 3: Audio — merge narration audio tracks
-    audio_clips = []
-
-    # Keep original audio at low volume if present
-    if video.audio is not None:
-        audio_clips.append(video.audio.volumex(0.15))
-
-    # Add narration audio
+    # Burn subtitles in with ffmpeg's libass filter when it is available;
+    # otherwise overlay Pillow-rendered bars
+    ass_path: str | None = None
+    if subtitles and _has_subtitles_filter():
+        ass_path = os.path.join(frames_dir, "subtitles.ass")
+        _write_ass(subtitles, ass_path, w, h)
+    else:
+        subtitle_pngs: dict[str, str] = {}  # identical subtitles share one image
+        for start_s, dur, text in subtitles:
+            bar = _render_subtitle(text, w)
+            if text not in subtitle_pngs:
+                subtitle_pngs[text] = os.path.join(frames_dir, f"subtitle{len(subtitle_pngs)}.png")
+                bar.save(subtitle_pngs[text], compress_level=1)
+            sources.append([
+                "-loop", "1", "-framerate", str(anim_fps), "-t", f"{dur:.3f}", "-i", subtitle_pngs[text],
+            ])
+            overlays.append((len(sources) - 1, start_s, 0, h - bar.height - 20))
+
+    # Step 3: Audio — narration tracks mixed in by the same ffmpeg command
+    narrations: list[tuple[str, float]] = []
     for seg in narration_segments:
         audio_path = seg.get("audio_path")
         if not audio_path or not os.path.exists(audio_path):
             continue
         start_s = seg["start_ms"] / 1000.0
         if start_s < deduped_duration:
-            try:
-                narr_clip = AudioFileClip(audio_path).set_start(start_s)
-                audio_clips.append(narr_clip)
-            except Exception as e:
-                logger.warning("Failed to load narration audio %s: %s", audio_path, e)
-
-    if audio_clips:
-        final_audio = CompositeAudioClip(audio_clips)
-        final_video = final_video.set_audio(final_audio)
-
-    # Step 4: Export
-    final_video = final_video.set_duration(deduped_duration)
-    final_video.write_videofile(
-        output_path,
-        codec="libx264",
-        audio_codec="aac",
-        fps=30,
-        preset="medium",
-        bitrate="2500k",
-        logger=None,  # suppress moviepy progress bar
-    )
+            narrations.append((audio_path, start_s))
 
-    # Cleanup
-    video.close()
-    if final_video != video:
-        try:
-            final_video.close()
-        except Exception:
-            pass
+    # Step 4: Export. One ffmpeg command cuts the kept ranges, composites the
+    # overlays, burns in subtitles, mixes the audio and encodes, so no frame
+    # passes through Python
+    try:
+        _assemble_video(
+            video_path, output_path, deduped_duration,
+            ranges=ranges,
+            sources=sources,
+            overlays=overlays,
+            ass_path=ass_path,
+            narrations=narrations,
+            source_audio=has_source_audio,
+        )
+    finally:
+        shutil.rmtree(frames_dir, ignore_errors=True)
 
     stats = {
         "original_duration_s": round(original_duration, 1),
         "deduped_duration_s": round(deduped_duration, 1),
         "frames_removed_s": round(original_duration - deduped_duration, 1),
-        "click_animations": sum(
-            1 for a in action_log
-            if a.get("action_type") == "click" and a.get("x") is not None
-            and a["timestamp_ms"] / 1000.0 < deduped_duration
-        ),
-        "subtitle_segments": len([s for s in narration_segments if s.get("text")]),
+        "click_animations": click_animations,
+        "subtitle_segments": sum(1 for s in narration_segments if s.get("text")),
         "narration_segments": len(narration_segments),
         "click_source": "action_log" if original_action_log else "vision_estimate",
     }
@@ -1058,7 +1635,7 @@ async def generate_demo_video(
     Three-phase pipeline:
       1. Narration script generation (Claude API)
       2. TTS audio generation (edge-tts)
-      3. Video processing (moviepy: dedup + ripples + subtitles + audio)
+      3. Video processing (ffmpeg: dedup + ripples + subtitles + audio)
 
     Args:
         video_path: Path to raw .webm or .mov recording.
@@ -1081,47 +1658,63 @@ async def generate_demo_video(
 
     # Pre-scan: detect transitions and estimate deduped duration BEFORE narration
     # This gives Claude real visual-change timestamps to anchor narration to.
+    # One clip serves the pre-scan, the duration and Phase 3, so the source is
+    # probed (and its metadata fixed, if needed) only once
+    video_clip = _load_video_clip(video_path)
     pre_scan = None
     if not action_log:
         logger.info("Pre-scan: Analyzing video for transitions and dedup estimate")
-        pre_scan = _pre_scan_video(video_path)
+        pre_scan = _pre_scan_video(video_clip)
 
     # Get video duration for narration constraints
-    video_duration_s = pre_scan["original_duration_s"] if pre_scan else None
-    if video_duration_s is None:
-        probe_clip = _load_video_clip(video_path)
-        video_duration_s = probe_clip.duration
-        probe_clip.close()
+    video_duration_s = video_clip.duration
 
     # Work directory for temporary TTS files
     work_dir = tempfile.mkdtemp(prefix="demo_video_")
+    cancel_tts: Callable[[], Awaitable[None]] | None = None
 
     try:
         # Phase 1: Generate narration script
         logger.info("Phase 1: Generating narration script")
-        narration_segments, usage = _generate_narration_script(
+        # Each segment's TTS starts as soon as it streams in, overlapping
+        # Phase 2 with the rest of Claude's reply
+        synthesize, cancel_tts = _tts_synthesizer(work_dir)
+        streamed_count = 0
+
+        def _start_tts(seg: dict) -> None:
+            nonlocal streamed_count
+            synthesize(streamed_count, seg.get("text", ""))
+            streamed_count += 1
+
+        narration_segments, usage = await _generate_narration_script(
             action_log,
             screenshot_paths,
             feature_context,
             video_duration_s,
             transitions=pre_scan["transitions"] if pre_scan else None,
             deduped_duration_s=pre_scan["deduped_duration_s"] if pre_scan else None,
+            on_segment=_start_tts,
         )
 
         # Phase 2: Generate TTS audio
         logger.info("Phase 2: Generating TTS audio")
-        enriched_segments = await _generate_tts(narration_segments, work_dir)
+        enriched_segments = await _generate_tts(narration_segments, work_dir, synthesize)
 
         # Phase 3: Process video
         logger.info("Phase 3: Processing video")
         stats = _process_video(
             video_path, action_log, enriched_segments, output_path,
             pre_scan=pre_scan,
+            video_clip=video_clip,
         )
 
     finally:
+        # TTS tasks still writing into work_dir (Phase 1 failed, or a streamed
+        # segment was dropped) must stop before it is removed
+        if cancel_tts is not None:
+            await cancel_tts()
+        video_clip.close()
         # Cleanup temp files
-        import shutil
         try:
             shutil.rmtree(work_dir, ignore_errors=True)
         except Exception:
@@ -4,28 +4,26 @@ import base64
 import io
 import json
 import logging
+import mimetypes
 import os
 from typing import Any
 
 import anthropic
+import orjson
 from PIL import Image
 
-from agent_runner import calc_cost, run_agent_loop
+from agent_runner import calc_cost, run_agent_loop, stalled_after
+from agents.browser_agent import CollectedState
 from agents.navigation_planner_agent import plan_navigation
 from tools.browser_tools import (
-    click_by_text,
-    click_element,
-    get_page_content,
-    list_interactive_elements,
-    navigate_to_url,
-    press_key,
-    scroll_page,
+    flush_screenshots,
+    login_and_navigate,
+    run_session_tool,
     stop_recording,
     take_screenshot,
-    type_text,
-    wait_seconds,
 )
 from tools.kb_tools import get_knowledge
+from tools.registry import dispatch_tool, tool_schemas
 
 logger = logging.getLogger(__name__)
 
@@ -33,25 +31,6 @@ client = anthropic.Anthropic(max_retries=5)
 
 # ── Phase 1: Deterministic Login ──────────────────────────────
 
-def _is_logged_in(page_content: dict | str) -> bool:
-    """Check if page content indicates we're already logged in (not on a login page).
-
-    Returns False if:
-    - Page has login indicators (login form present)
-    - Page has very little content (still loading/splash screen)
-    """
-    text = page_content.get("text", "") if isinstance(page_content, dict) else str(page_content)
-    text_lower = text.lower().strip()
-
-    # If page has very little content, it's likely still loading — not logged in
-    if len(text_lower) < 50:
-        return False
-
-    login_indicators = ["log in", "login", "sign in", "get otp", "enter your phone",
-                        "enter your email", "phone number", "password", "forgot password"]
-    return not any(indicator in text_lower for indicator in login_indicators)
-
-
 async def _login_and_capture_home(
     job_id: str, url: str, creds: dict, output_dir: str | None = None
 ) -> dict[str, Any]:
@@ -62,43 +41,21 @@ async def _login_and_capture_home(
     Falls back to generic text-based selectors otherwise.
     """
     logger.info("Navigating to %s", url)
-    await navigate_to_url(url, job_id)
+    login = await login_and_navigate(url, job_id, creds)
+    login_verified = login["logged_in"]
 
     # Override session output_dir so screenshots land in the right place
     if output_dir:
         from tools.browser_tools import _sessions
         if job_id in _sessions:
             _sessions[job_id]["output_dir"] = output_dir
-    await wait_seconds(5, job_id)  # Wait for SPA/Flutter apps to fully load
-
-    # Check if already logged in
-    login_verified = True
-    page_content = await get_page_content(job_id)
-    if _is_logged_in(page_content):
-        logger.info("Already logged in, skipping login flow")
-    else:
-        phone = creds.get("phone")
-        email = creds.get("email")
-        # OTP/password — check both fields (KB may store as "otp" or "password")
-        otp_or_password = creds.get("otp") or creds.get("password", "")
-        # KB may provide app-specific selectors for login elements
-        selectors = creds.get("login_selectors", {})
-        app_type = creds.get("app_type", "html")
-
-        if phone:
-            login_verified = await _login_phone_otp(
-                job_id, phone, otp_or_password, selectors, app_type,
-            )
-        elif email:
-            login_verified = await _login_email_password(
-                job_id, email, otp_or_password, selectors,
-            )
 
     # Take home page screenshot (session stays alive for Phase 3)
     home_screenshot = None
-    screenshot_result = await take_screenshot(job_id)
+    screenshot_result = await take_screenshot(job_id, full_page=True)  # nav may sit below the fold
     if isinstance(screenshot_result, dict):
         home_screenshot = screenshot_result.get("path")
+        await flush_screenshots(job_id)  # the navigation planner reads it from disk
 
     return {
         "summary": f"Logged in to {url} — verified={login_verified}",
@@ -108,162 +65,6 @@ async def _login_and_capture_home(
     }
 
 
-async def _login_phone_otp(
-    job_id: str,
-    phone: str,
-    otp_or_password: str,
-    selectors: dict,
-    app_type: str,
-    max_attempts: int = 2,
-) -> bool:
-    """Phone + OTP/password login flow with retry support.
-
-    Uses KB login_selectors when provided, falls back to generic selectors.
-    """
-    phone_str = str(phone)
-    # Strip country code if the UI already shows it (e.g. +966)
-    local_phone = phone_str[3:] if phone_str.startswith("966") else phone_str
-
-    phone_selector = selectors.get("phone_input")
-    get_otp_text = selectors.get("get_otp_button", "Get OTP")
-    otp_selector = selectors.get("otp_input")
-    verify_text = selectors.get("verify_button", "Verify")
-
-    for attempt in range(1, max_attempts + 1):
-        logger.info("Login attempt %d/%d — phone=%s, app_type=%s",
-                     attempt, max_attempts, local_phone, app_type)
-
-        # ── Step 1: Enter phone number ──────────────────────────
-        if phone_selector:
-            # Use the specific KB selector (e.g. Flutter semantic node)
-            logger.info("Clicking phone input via KB selector: %s", phone_selector)
-            result = await type_text(phone_selector, local_phone, job_id)
-            if isinstance(result, dict) and result.get("status") == "error":
-                logger.warning("KB phone selector failed: %s — trying text fallback", result.get("message"))
-                await click_by_text("Phone Number", job_id)
-                await wait_seconds(1, job_id)
-                await type_text("input", local_phone, job_id)
-        else:
-            # Generic fallback: click label then type into first input
-            await click_by_text("Phone Number", job_id)
-            await wait_seconds(1, job_id)
-            await type_text("input", local_phone, job_id)
-
-        await wait_seconds(1, job_id)
-
-        # ── Step 2: Submit phone (click "Get OTP") ─────────────
-        logger.info("Submitting phone — clicking '%s'", get_otp_text)
-        await click_by_text(get_otp_text, job_id)
-        await wait_seconds(4, job_id)  # Wait for OTP screen to load
-
-        # ── Step 3: Enter OTP/password ──────────────────────────
-        if not otp_or_password:
-            logger.error("No OTP/password provided in credentials — cannot complete login")
-            return False
-
-        logger.info("Entering OTP (%d digits)", len(otp_or_password))
-        otp_typed = False
-
-        # Method A: Use KB-specific OTP selector
-        if otp_selector:
-            logger.info("Typing OTP via KB selector: %s", otp_selector)
-            result = await type_text(otp_selector, otp_or_password, job_id)
-            if isinstance(result, dict) and result.get("status") != "error":
-                otp_typed = True
-            else:
-                logger.warning("KB OTP selector failed: %s", result.get("message") if isinstance(result, dict) else result)
-
-        # Method B: Scan interactive elements for OTP-like inputs
-        if not otp_typed:
-            elements = await list_interactive_elements(job_id)
-            if isinstance(elements, list):
-                for el in elements:
-                    sel = el.get("selector", "") if isinstance(el, dict) else str(el)
-                    text = el.get("text", "") if isinstance(el, dict) else ""
-                    combined = (sel + " " + text).lower()
-                    if any(kw in combined for kw in ("one-time-code", "otp", "verification", "verify")):
-                        logger.info("Found OTP element via scan: %s", sel)
-                        result = await type_text(sel, otp_or_password, job_id)
-                        if isinstance(result, dict) and result.get("status") != "error":
-                            otp_typed = True
-                            break
-
-        # Method C: Type digits via keyboard (OTP field should have focus)
-        if not otp_typed:
-            logger.info("Typing OTP digits via keyboard as fallback")
-            for digit in otp_or_password:
-                await press_key(digit, job_id)
-            otp_typed = True
-
-        await wait_seconds(1, job_id)
-
-        # ── Step 4: Submit OTP (click "Verify") ────────────────
-        logger.info("Submitting OTP — clicking '%s'", verify_text)
-        try:
-            await click_by_text(verify_text, job_id)
-        except Exception:
-            logger.info("'%s' not found, trying 'Submit'", verify_text)
-            try:
-                await click_by_text("Submit", job_id)
-            except Exception:
-                logger.warning("Could not find verify/submit button")
-
-        # ── Step 5: Wait and verify login succeeded ─────────────
-        logger.info("Waiting for dashboard to load")
-        await wait_seconds(5, job_id)
-
-        page_content = await get_page_content(job_id)
-        if _is_logged_in(page_content):
-            logger.info("Login verified successfully on attempt %d", attempt)
-            return True
-
-        logger.warning("Login attempt %d failed — still on login page", attempt)
-
-        # On retry: check if login_success_indicator tells us what to look for
-        success_indicator = selectors.get("login_success_indicator")
-        if success_indicator:
-            text = page_content.get("text", "") if isinstance(page_content, dict) else str(page_content)
-            if success_indicator.lower() in text.lower():
-                logger.info("Login success indicator '%s' found", success_indicator)
-                return True
-
-    logger.error("Login failed after %d attempts", max_attempts)
-    return False
-
-
-async def _login_email_password(
-    job_id: str,
-    email: str,
-    password: str,
-    selectors: dict,
-) -> bool:
-    """Email + password login flow."""
-    logger.info("Entering email and password")
-    email_selector = selectors.get("email_input", "input[type='email']")
-    password_selector = selectors.get("password_input", "input[type='password']")
-
-    await type_text(email_selector, str(email), job_id)
-    await type_text(password_selector, password, job_id)
-
-    submit_text = selectors.get("submit_button", "Log in")
-    try:
-        await click_by_text(submit_text, job_id)
-    except Exception:
-        try:
-            await click_by_text("Sign in", job_id)
-        except Exception:
-            await click_by_text("Submit", job_id)
-
-    logger.info("Waiting for dashboard to load")
-    await wait_seconds(5, job_id)
-
-    page_content = await get_page_content(job_id)
-    verified = _is_logged_in(page_content)
-    if not verified:
-        logger.warning("Email login may have failed — still on login page")
-    return verified
-
-
 # ── Phase 2: Navigation Discovery ────────────────────────────
 
 def _resize_if_needed(path: str) -> bytes:
@@ -271,13 +72,17 @@ def _resize_if_needed(path: str) -> bytes:
     MAX_DIM = 8000
     with Image.open(path) as img:
         w, h = img.size
-        if w > MAX_DIM or h > MAX_DIM:
-            scale = min(MAX_DIM / w, MAX_DIM / h)
-            new_size = (int(w * scale), int(h * scale))
-            logger.info("Resizing %s from %dx%d to %dx%d", path, w, h, *new_size)
-            img = img.resize(new_size, Image.LANCZOS)
+        if w <= MAX_DIM and h <= MAX_DIM:
+            # Within limits: send the file as-is rather than re-encoding it
+            with open(path, "rb") as f:
+                return f.read()
+        fmt = img.format or "PNG"
+        scale = min(MAX_DIM / w, MAX_DIM / h)
+        new_size = (int(w * scale), int(h * scale))
+        logger.info("Resizing %s from %dx%d to %dx%d", path, w, h, *new_size)
+        img = img.resize(new_size, Image.LANCZOS)
         buf = io.BytesIO()
-        img.save(buf, format="PNG")
+        img.save(buf, format=fmt)  # keep the source format so media_type still matches
         return buf.getvalue()
 
 
@@ -371,7 +176,11 @@ def _discover_navigation(
     base_content: list[dict[str, Any]] = [
         {
             "type": "image",
-            "source": {"type": "base64", "media_type": "image/png", "data": screenshot_b64},
+            "source": {
+                "type": "base64",
+                "media_type": mimetypes.guess_type(home_screenshot_path)[0] or "image/png",
+                "data": screenshot_b64,
+            },
         },
         {"type": "text", "text": "[Home page screenshot]"},
     ]
@@ -454,16 +263,15 @@ Your job: visit ONLY the pages listed below, explore each page thoroughly, then
 
 ## Steps for EACH page in the list
 1. Click the nav element to reach the page (click_by_text with the nav_text)
-2. wait_seconds 2
-3. take_screenshot of the page
-4. list_interactive_elements to discover all UI elements on this page
-5. Explore sub-sections within this page:
+2. take_screenshot of the page (it waits for the page to settle — no wait_seconds needed)
+3. list_interactive_elements to discover all UI elements on this page
+   (steps 2 and 3 only read the page — call them together in ONE turn; they run in parallel)
+4. Explore sub-sections within this page:
    - Click tabs, sub-tabs, filters, or view toggles visible on the page
-   - wait_seconds 2 after each click
    - take_screenshot of each distinct sub-view
-   - Open ONE detail item (first card/row) if present, screenshot it, then go back
+   - Open ONE detail item (first card/row) if present, screenshot it, then go_back
    - Open ONE action button (Add/Create) if present, screenshot the form/modal, then dismiss (Escape/Cancel)
-6. Move to the next page in the list
+5. Move to the next page in the list
 
 ## Overall flow
 1. start_recording
@@ -477,7 +285,7 @@ Your job: visit ONLY the pages listed below, explore each page thoroughly, then
     {
       "name": "Page Name",
       "nav_text": "text clicked to reach this page",
-      "screenshots": ["screen_1.png", "screen_2.png"],
+      "screenshots": ["screen_1.jpg", "screen_2.jpg"],
       "interactive_elements_count": 15,
       "sub_sections": ["Tab 1", "Tab 2"],
       "detail_view_opened": true,
@@ -495,152 +303,25 @@ Your job: visit ONLY the pages listed below, explore each page thoroughly, then
 - Use click_by_text with nav_text — if it fails, try list_interactive_elements to find the selector
 - Always respond with the exact JSON format above — no other format"""
 
-CRAWL_TOOLS = [
-    {
-        "name": "take_screenshot",
-        "description": "Capture a screenshot of the current page.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "click_element",
-        "description": "Click an element by CSS selector.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "selector": {"type": "string", "description": "CSS selector for the element"},
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["selector", "job_id"],
-        },
-    },
-    {
-        "name": "click_by_text",
-        "description": "Click an element by its visible text.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "text": {"type": "string", "description": "The visible text of the element"},
-                "exact": {"type": "boolean", "description": "If true, match exactly. Default false."},
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["text", "job_id"],
-        },
-    },
-    {
-        "name": "list_interactive_elements",
-        "description": "List all clickable elements on the current page.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "get_page_content",
-        "description": "Get the visible text content of the current page.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "wait_seconds",
-        "description": "Wait for a few seconds to let the page load.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "seconds": {"type": "number", "description": "Seconds to wait (1-10)"},
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["seconds", "job_id"],
-        },
-    },
-    {
-        "name": "scroll_page",
-        "description": "Scroll the page up or down.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "direction": {"type": "string", "enum": ["up", "down"], "description": "Scroll direction"},
-                "amount": {"type": "integer", "description": "Pixels to scroll"},
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["direction", "amount", "job_id"],
-        },
-    },
-    {
-        "name": "press_key",
-        "description": "Press a keyboard key (Enter, Escape, Tab, etc.).",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "key": {"type": "string", "description": "The key to press"},
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["key", "job_id"],
-        },
-    },
-    {
-        "name": "start_recording",
-        "description": "Start video recording of the browser session.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-    {
-        "name": "stop_recording",
-        "description": "Stop recording and close the browser session. Returns the video file path.",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "job_id": {"type": "string", "description": "The job ID"},
-            },
-            "required": ["job_id"],
-        },
-    },
-]
+CRAWL_TOOLS = tool_schemas([
+    "take_screenshot",
+    "take_full_page_screenshot",
+    "click_element",
+    "click_by_text",
+    "go_back",
+    "list_interactive_elements",
+    "get_page_content",
+    "wait_seconds",
+    "scroll_page",
+    "press_key",
+    "start_recording",
+    "stop_recording",
+])
 
 
 async def _crawl_execute_tool(name: str, input: dict) -> str | dict | list:
-    """Execute browser tools for the crawl phase."""
-    if name == "take_screenshot":
-        return await take_screenshot(input["job_id"])
-    elif name == "click_element":
-        return await click_element(input["selector"], input["job_id"])
-    elif name == "click_by_text":
-        return await click_by_text(input["text"], input["job_id"], input.get("exact", False))
-    elif name == "list_interactive_elements":
-        return await list_interactive_elements(input["job_id"])
-    elif name == "get_page_content":
-        return await get_page_content(input["job_id"])
-    elif name == "wait_seconds":
-        return await wait_seconds(input["seconds"], input["job_id"])
-    elif name == "scroll_page":
-        return await scroll_page(input["direction"], input["amount"], input["job_id"])
-    elif name == "press_key":
-        return await press_key(input["key"], input["job_id"])
-    elif name == "start_recording":
-        from tools.browser_tools import start_recording
-        return await start_recording(input["job_id"])
-    elif name == "stop_recording":
-        return await stop_recording(input["job_id"])
-    else:
-        return {"error": f"Unknown tool: {name}"}
+    """Execute browser tools for the crawl phase under the shared session policy."""
+    return await run_session_tool(name, input, dispatch_tool)
 
 
 async def _crawl_with_flows(
@@ -654,22 +335,15 @@ async def _crawl_with_flows(
         _sessions[job_id]["output_dir"] = output_dir
         _sessions[job_id]["screenshot_count"] = 0
 
-    collected: dict[str, Any] = {
-        "screenshot_paths": [],
-        "video_path": None,
-        "interactive_elements": [],
-        "action_log": [],
-    }
+    collected = CollectedState()
+    recording_stopped = False
 
     async def _collecting_executor(name: str, input: dict) -> str | dict | list:
+        nonlocal recording_stopped
         result = await _crawl_execute_tool(name, input)
-        if name == "take_screenshot" and isinstance(result, dict):
-            collected["screenshot_paths"].append(result.get("path", ""))
-        elif name == "list_interactive_elements" and isinstance(result, list):
-            collected["interactive_elements"] = result
-        elif name == "stop_recording" and isinstance(result, dict):
-            collected["video_path"] = result.get("video_path")
-            collected["action_log"] = result.get("action_log", [])
+        collected.record(name, input, result)
+        if name == "stop_recording" and isinstance(result, dict):
+            recording_stopped = result.get("status") == "stopped"
         return result
 
     # Build page list with exploration instructions
@@ -690,6 +364,9 @@ async def _crawl_with_flows(
 
     # max_turns: start_recording(1) + home screenshot(1) + per flow ~8 turns (deep explore) + stop(1) + summary(1)
     max_turns = 4 + len(flows) * 8
+    # Exploring a page takes a few list/click turns between screenshots, so
+    # allow a longer gap than the browser agent before calling it stalled
+    stalled = stalled_after(lambda: len(collected.screenshot_paths), 5)
 
     result = await run_agent_loop(
         system_prompt=CRAWL_SYSTEM_PROMPT,
@@ -697,24 +374,36 @@ async def _crawl_with_flows(
         tool_executor=_collecting_executor,
         user_message=task,
         max_turns=max_turns,
+        stop_when=stalled,
+        token_budget=60_000 + len(flows) * 40_000,
     )
+    # Wrapped up (stalled, over budget or out of turns) before stop_recording:
+    # close the session so the video is finalized; stop_recording also flushes
+    # buffered screenshots
+    if not recording_stopped:
+        stopped = await stop_recording(job_id)
+        if stopped.get("status") == "stopped":
+            collected.video_path = stopped.get("video_path")
+            collected.action_log = stopped.get("action_log", [])
+        else:
+            await flush_screenshots(job_id)
 
     # Parse structured JSON from agent response, fallback to raw text
     response_text = result["text"]
     try:
         clean = response_text.replace("```json", "").replace("```", "").strip()
-        structured = json.loads(clean)
-    except (json.JSONDecodeError, ValueError):
+        structured = orjson.loads(clean)
+    except orjson.JSONDecodeError:
         structured = {
             "pages": [],
-            "total_screenshots": len(collected["screenshot_paths"]),
+            "total_screenshots": len(collected.screenshot_paths),
             "total_pages_visited": len(flows),
             "summary": response_text,
         }
 
     return {
         "summary": structured,
-        "data": collected,
+        "data": collected.to_dict(),
         "usage": result["usage"],
     }
 
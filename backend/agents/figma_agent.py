@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import Any
+from types import MappingProxyType
+from typing import Any, Final, Mapping
 
 from agent_runner import run_agent_loop
 from tools.figma_tools import (
@@ -11,7 +12,7 @@ from tools.figma_tools import (
     parse_figma_url,
 )
 
-SYSTEM_PROMPT = """You are a Figma agent. Given a Figma link, your job is to extract design screens as PNG images.
+SYSTEM_PROMPT: Final[str] = """You are a Figma agent. Given a Figma link, your job is to extract design screens as PNG images.
 
 Steps:
 1. Parse the Figma URL to extract the file key and node ID.
@@ -27,7 +28,7 @@ Error handling:
 - If a node has no exportable FRAME children, export the node itself as a single image.
 - Verify each export succeeded by checking the tool result for errors."""
 
-TOOLS = [
+TOOLS: Final[tuple[Mapping[str, Any], ...]] = tuple(MappingProxyType(tool) for tool in [
     {
         "name": "parse_figma_url",
         "description": "Parse a Figma URL to extract the file_key and node_id. Node IDs are converted from URL format (13-1134) to API format (13:1134).",
@@ -103,7 +104,7 @@ TOOLS = [
             "required": ["file_key", "node_id", "output_dir"],
         },
     },
-]
+])
 
 
 async def _execute_tool(name: str, input: dict) -> str | dict | list:
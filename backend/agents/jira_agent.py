@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import Any
+from types import MappingProxyType
+from typing import Any, Final, Mapping
 
 from agent_runner import run_agent_loop
 from tools.jira_tools import (
@@ -11,7 +12,7 @@ from tools.jira_tools import (
     get_jira_ticket,
 )
 
-SYSTEM_PROMPT = """You are a Jira agent. Given a task, decide what information to fetch from Jira — ticket details, subtasks, attachments, comments — and summarize what you find.
+SYSTEM_PROMPT: Final[str] = """You are a Jira agent. Given a task, decide what information to fetch from Jira — ticket details, subtasks, attachments, comments — and summarize what you find.
 
 When fetching attachments, use the output_dir provided in the task. Categorize what you download (PRD documents, design files, etc).
 
@@ -23,7 +24,7 @@ Error handling:
 - If subtasks, comments, or attachments fail, note the failure but continue with whatever data you have.
 - Never silently ignore errors — always include them in your response so the pipeline can decide what to do."""
 
-TOOLS = [
+TOOLS: Final[tuple[Mapping[str, Any], ...]] = tuple(MappingProxyType(tool) for tool in [
     {
         "name": "get_jira_ticket",
         "description": "Fetch ticket details from Jira. Returns title, description, staging_url, status, assignee.",
@@ -81,7 +82,7 @@ TOOLS = [
             "required": ["ticket_id", "text"],
         },
     },
-]
+])
 
 
 async def _execute_tool(name: str, input: dict) -> str | dict | list:
@@ -4,6 +4,7 @@ import base64
 import io
 import json
 import logging
+import mimetypes
 import os
 from typing import Any
 
@@ -105,13 +106,17 @@ def _resize_if_needed(path: str) -> bytes:
     MAX_DIM = 8000
     with Image.open(path) as img:
         w, h = img.size
-        if w > MAX_DIM or h > MAX_DIM:
-            scale = min(MAX_DIM / w, MAX_DIM / h)
-            new_size = (int(w * scale), int(h * scale))
-            logger.info("Resizing %s from %dx%d to %dx%d", path, w, h, *new_size)
-            img = img.resize(new_size, Image.LANCZOS)
+        if w <= MAX_DIM and h <= MAX_DIM:
+            # Within limits: send the file as-is rather than re-encoding it
+            with open(path, "rb") as f:
+                return f.read()
+        fmt = img.format or "PNG"
+        scale = min(MAX_DIM / w, MAX_DIM / h)
+        new_size = (int(w * scale), int(h * scale))
+        logger.info("Resizing %s from %dx%d to %dx%d", path, w, h, *new_size)
+        img = img.resize(new_size, Image.LANCZOS)
         buf = io.BytesIO()
-        img.save(buf, format="PNG")
+        img.save(buf, format=fmt)  # keep the source format so media_type still matches
         return buf.getvalue()
 
 
@@ -141,7 +146,7 @@ def plan_navigation(
             "type": "image",
             "source": {
                 "type": "base64",
-                "media_type": "image/png",
+                "media_type": mimetypes.guess_type(path)[0] or "image/png",
                 "data": b64,
             },
         })
@@ -11,6 +11,7 @@ import base64
 import io
 import json
 import logging
+import mimetypes
 import os
 import re
 import shutil
@@ -66,7 +67,7 @@ Return ONLY valid JSON — no markdown fences, no extra text:
   "screens": [
     {
       "id": "uat_1",
-      "filename": "screen_1.png",
+      "filename": "screen_1.jpg",
       "page_type": "list view",
       "state": "loaded with data",
       "description": "Semantic description of what this screenshot shows"
@@ -99,7 +100,7 @@ Return ONLY valid JSON — no markdown fences, no extra text:
       "figma_id": "figma_1",
       "figma_name": "Screen Name",
       "uat_id": "uat_3",
-      "uat_filename": "screen_3.png",
+      "uat_filename": "screen_3.jpg",
       "confidence": 85,
       "reasoning": "Both show the supplier list view with search and filter options"
     }
@@ -114,7 +115,7 @@ Return ONLY valid JSON — no markdown fences, no extra text:
   "unmatched_uat": [
     {
       "uat_id": "uat_12",
-      "uat_filename": "screen_12.png",
+      "uat_filename": "screen_12.jpg",
       "reason": "This screen is not represented in the Figma designs"
     }
   ]
@@ -224,18 +225,22 @@ def _resize_if_needed(path: str, max_dim: int = 4000) -> bytes:
     """Read an image and downscale if either dimension exceeds max_dim."""
     with Image.open(path) as img:
         w, h = img.size
-        if w > max_dim or h > max_dim:
-            scale = min(max_dim / w, max_dim / h)
-            new_size = (int(w * scale), int(h * scale))
-            logger.info("Resizing %s from %dx%d to %dx%d", path, w, h, *new_size)
-            img = img.resize(new_size, Image.LANCZOS)
+        if w <= max_dim and h <= max_dim:
+            # Within limits: send the file as-is rather than re-encoding it
+            with open(path, "rb") as f:
+                return f.read()
+        fmt = img.format or "PNG"
+        scale = min(max_dim / w, max_dim / h)
+        new_size = (int(w * scale), int(h * scale))
+        logger.info("Resizing %s from %dx%d to %dx%d", path, w, h, *new_size)
+        img = img.resize(new_size, Image.LANCZOS)
         buf = io.BytesIO()
-        img.save(buf, format="PNG")
+        img.save(buf, format=fmt)  # keep the source format so media_type still matches
         return buf.getvalue()
 
 
 def _b64_image(path: str) -> str:
-    """Resize if needed and return base64-encoded PNG."""
+    """Resize if needed and return the base64-encoded image (format unchanged)."""
     img_bytes = _resize_if_needed(path)
     return base64.b64encode(img_bytes).decode()
 
@@ -249,13 +254,13 @@ def _natural_sort_key(filename: str):
 
 
 def _load_image_set(directory: str) -> list[dict]:
-    """Load all PNGs from a directory, sorted naturally.
+    """Load all PNG/JPEG images from a directory, sorted naturally.
 
     Returns list of dicts with 'path' and 'filename' keys.
     """
     if not os.path.isdir(directory):
         return []
-    files = [f for f in os.listdir(directory) if f.lower().endswith(".png")]
+    files = [f for f in os.listdir(directory) if f.lower().endswith((".png", ".jpg", ".jpeg"))]
     files.sort(key=_natural_sort_key)
     return [
         {"path": os.path.join(directory, f), "filename": f}
@@ -275,7 +280,7 @@ def _build_image_content(images: list[dict], label_prefix: str) -> list[dict]:
             "type": "image",
             "source": {
                 "type": "base64",
-                "media_type": "image/png",
+                "media_type": mimetypes.guess_type(img["path"])[0] or "image/png",
                 "data": b64,
             },
         })
@@ -424,9 +429,10 @@ def _aggregate_usage(*usages: dict) -> dict:
 def _save_matched_pairs(pairs: list[dict], matches: list[dict]) -> None:
     """Copy matched Figma/UAT pairs into outputs/matched/ for easy review.
 
-    Creates one subdirectory per pair:
-        outputs/matched/01_Dashboard_Home/design.png
-        outputs/matched/01_Dashboard_Home/actual.png
+    Creates one subdirectory per pair, each image keeping its source extension:
+        outputs/matched/01_Dashboard_Home/design.<ext>
+        outputs/matched/01_Dashboard_Home/actual.<ext>
+    e.g. design.png for a Figma export and actual.jpg for a UAT screenshot.
     Also writes a matches.json manifest.
     """
     matched_dir = "outputs/matched"
@@ -441,8 +447,8 @@ def _save_matched_pairs(pairs: list[dict], matches: list[dict]) -> None:
         pair_dir = os.path.join(matched_dir, f"{i:02d}_{slug}")
         os.makedirs(pair_dir, exist_ok=True)
 
-        shutil.copy2(pair["figma_path"], os.path.join(pair_dir, "design.png"))
-        shutil.copy2(pair["uat_path"], os.path.join(pair_dir, "actual.png"))
+        shutil.copy2(pair["figma_path"], os.path.join(pair_dir, "design" + os.path.splitext(pair["figma_path"])[1]))
+        shutil.copy2(pair["uat_path"], os.path.join(pair_dir, "actual" + os.path.splitext(pair["uat_path"])[1]))
 
         # Find confidence from the match
         confidence = 0
@@ -641,7 +647,7 @@ def evaluate_scores(uat_dir: str, figma_dir: str) -> dict:
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
+                        "media_type": mimetypes.guess_type(pair["figma_path"])[0] or "image/png",
                         "data": _b64_image(pair["figma_path"]),
                     },
                 })
@@ -654,7 +660,7 @@ def evaluate_scores(uat_dir: str, figma_dir: str) -> dict:
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
+                        "media_type": mimetypes.guess_type(pair["uat_path"])[0] or "image/png",
                         "data": _b64_image(pair["uat_path"]),
                     },
                 })
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
 import os
+from types import MappingProxyType
+from typing import Any, Final, Mapping
 
 from agent_runner import run_agent_loop
 from tools.slack_tools import post_slack_message, read_slack_messages, upload_slack_file
 
 DEFAULT_CHANNEL = os.getenv("SLACK_CHANNEL", "#skip-the-demo")
 
-SYSTEM_PROMPT = f"""You are a Slack agent. You can read and post messages to Slack channels, and upload files.
+SYSTEM_PROMPT: Final[str] = f"""You are a Slack agent. You can read and post messages to Slack channels, and upload files.
 
 IMPORTANT: Always post to this exact channel: {DEFAULT_CHANNEL}
 Do NOT guess or invent channel names. Use "{DEFAULT_CHANNEL}" for every tool call.
@@ -24,7 +26,7 @@ Formatting guidelines:
 - Keep the message scannable — feature name, score, and key deviations up top
 - Put full release notes in a separate thread reply if they exceed 10 lines"""
 
-TOOLS = [
+TOOLS: Final[tuple[Mapping[str, Any], ...]] = tuple(MappingProxyType(tool) for tool in [
     {
         "name": "post_slack_message",
         "description": "Post a message to a Slack channel. Returns {ok, ts, channel}.",
@@ -63,7 +65,7 @@ TOOLS = [
             "required": ["channel", "file_path", "title"],
         },
     },
-]
+])
 
 
 async def _execute_tool(name: str, input: dict) -> str | dict | list:
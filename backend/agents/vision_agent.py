@@ -3,6 +3,7 @@ from __future__ import annotations
 import base64
 import json
 import logging
+import mimetypes
 import os
 from typing import Any
 
@@ -59,7 +60,7 @@ def compare_design_vs_reality(
                             "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "image/png",
+                                "media_type": mimetypes.guess_type(screenshots[0])[0] or "image/png",
                                 "data": actual_b64,
                             },
                         },
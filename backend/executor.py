@@ -31,6 +31,7 @@ from db.models import (
     update_run,
     update_step_ai_summary,
 )
+from tools.browser_tools import SCREENSHOT_EXTENSIONS
 from tools.kb_tools import get_knowledge
 from utils.adf_parser import adf_to_text
 from utils.pdf_parser import extract_text
@@ -498,7 +499,7 @@ async def _execute_discover_crawl(run_id: str, ticket_id: str, params: dict) ->
         screenshots = [
             f"{screenshots_dir}/{f}"
             for f in sorted(os.listdir(screenshots_dir))
-            if f.endswith(".png")
+            if f.endswith(SCREENSHOT_EXTENSIONS)
         ]
     if os.path.isdir(video_dir):
         video_files = [f for f in os.listdir(video_dir) if f.endswith((".webm", ".mov"))]
@@ -523,7 +524,7 @@ async def _execute_score_evaluator(run_id: str, ticket_id: str, params: dict) ->
         f.lower().endswith(".png") for f in os.listdir(figma_dir)
     )
     has_screenshots = os.path.isdir(screenshots_dir) and any(
-        f.lower().endswith(".png") for f in os.listdir(screenshots_dir)
+        f.lower().endswith(SCREENSHOT_EXTENSIONS) for f in os.listdir(screenshots_dir)
     )
 
     if not has_figma or not has_screenshots:
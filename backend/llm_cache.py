@@ -0,0 +1,166 @@
+"""Content-addressed cache for Claude responses.
+
+Keys are sha256 digests of the full request (model, system, tools, messages),
+so an identical request replays the stored response without an API call.
+Select a backend with LLM_CACHE_BACKEND (memory | file | redis); caching is
+disabled when it is unset. The cache is only an aid: backends never raise,
+a failed read is a miss and a failed write is logged and dropped.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import weakref
+from typing import Any, Protocol
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> str | None: ...
+
+    async def set(self, key: str, value: str, ttl: int | None = None) -> None: ...
+
+
+class MemoryCache:
+    """In-process cache. Entries live until TTL expiry or process exit."""
+
+    def __init__(self) -> None:
+        self._store: dict[str, tuple[str, float | None]] = {}
+
+    async def get(self, key: str) -> str | None:
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.time():
+            del self._store[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: str, ttl: int | None = None) -> None:
+        self._store[key] = (value, time.time() + ttl if ttl else None)
+
+
+class FileCache:
+    """One JSON file per key, shared across processes on the same host."""
+
+    def __init__(self, cache_dir: str = "outputs/.llm_cache") -> None:
+        self.cache_dir = cache_dir
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError as e:
+            logger.warning("LLM cache directory %s unavailable: %s", cache_dir, e)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    async def get(self, key: str) -> str | None:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value: str, ttl: int | None = None) -> None:
+        entry = {"expires_at": time.time() + ttl if ttl else None, "value": value}
+        await asyncio.to_thread(self._write, key, entry)
+
+    def _read(self, key: str) -> str | None:
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return entry.get("value")
+
+    def _write(self, key: str, entry: dict[str, Any]) -> None:
+        # A temp file per write, so workers storing the same key don't collide
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        except OSError as e:
+            logger.warning("LLM cache write failed for %s: %s", key, e)
+            return
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning("LLM cache write failed for %s: %s", key, e)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+class RedisCache:
+    """Redis-backed cache shared by every Celery worker."""
+
+    def __init__(self, url: str, prefix: str = "llm_cache:") -> None:
+        import redis.asyncio as redis
+        from redis.exceptions import RedisError
+
+        self._client = redis.from_url(url)
+        self._prefix = prefix
+        self._errors = (RedisError, OSError)
+
+    async def get(self, key: str) -> str | None:
+        try:
+            value = await self._client.get(self._prefix + key)
+        except self._errors as e:
+            logger.warning("LLM cache read failed, treating as a miss: %s", e)
+            return None
+        return value.decode() if value is not None else None
+
+    async def set(self, key: str, value: str, ttl: int | None = None) -> None:
+        try:
+            await self._client.set(self._prefix + key, value, ex=ttl)
+        except self._errors as e:
+            logger.warning("LLM cache write failed: %s", e)
+
+
+_memory_cache = MemoryCache()
+_redis_caches: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, RedisCache] = weakref.WeakKeyDictionary()
+
+
+def default_cache() -> CacheBackend | None:
+    """Return the cache selected by LLM_CACHE_BACKEND, or None when disabled.
+
+    Call from a coroutine. The Redis cache is created once per event loop, so
+    its connection pool is reused by every request in a Celery task and never
+    shared across the loops each task starts with asyncio.run().
+    """
+    backend = os.getenv("LLM_CACHE_BACKEND", "").lower()
+    if backend == "memory":
+        return _memory_cache
+    if backend == "file":
+        return FileCache(os.getenv("LLM_CACHE_DIR", "outputs/.llm_cache"))
+    if backend == "redis":
+        loop = asyncio.get_running_loop()
+        cache = _redis_caches.get(loop)
+        if cache is None:
+            cache = _redis_caches[loop] = RedisCache(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return cache
+    if backend:
+        logger.warning("Unknown LLM_CACHE_BACKEND=%s, caching disabled", backend)
+    return None
+
+
+def _jsonable(obj: Any) -> Any:
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return str(obj)
+
+
+def make_cache_key(request: dict[str, Any]) -> str:
+    """Return the sha256 hex digest of a messages.create request (or part of one)."""
+    payload = orjson.dumps(request, default=_jsonable, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
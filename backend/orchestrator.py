@@ -16,6 +16,7 @@ from db.models import (
     update_run,
 )
 from scheduler import PipelineScheduler
+from tools.browser_tools import SCREENSHOT_EXTENSIONS
 from tools.kb_tools import get_knowledge
 
 logger = logging.getLogger(__name__)
@@ -96,7 +97,7 @@ async def run_browser_pipeline(run_id: str, kb_key: str) -> None:
             collected["screenshots"] = [
                 f"{screenshots_dir}/{f}"
                 for f in sorted(os.listdir(screenshots_dir))
-                if f.endswith(".png")
+                if f.endswith(SCREENSHOT_EXTENSIONS)
             ]
         if os.path.isdir(video_dir):
             video_files = [f for f in os.listdir(video_dir) if f.endswith((".webm", ".mov"))]
@@ -172,7 +173,7 @@ async def run_discover_crawl_pipeline(
             collected["screenshots"] = [
                 f"{screenshots_dir}/{f}"
                 for f in sorted(os.listdir(screenshots_dir))
-                if f.endswith(".png")
+                if f.endswith(SCREENSHOT_EXTENSIONS)
             ]
         if os.path.isdir(video_dir):
             video_files = [f for f in os.listdir(video_dir) if f.endswith((".webm", ".mov"))]
@@ -1,14 +1,204 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import base64
+import hashlib
+import io
+import logging
 import os
+import re
 import time
-from typing import Any
-from playwright.async_api import Browser, Page, async_playwright, Playwright
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+import orjson
+from PIL import Image
+from playwright.async_api import Browser, BrowserContext, Page, Route, async_playwright, Playwright
+
+logger = logging.getLogger(__name__)
+
+# CDP endpoint of a long-lived Chrome (e.g. started with --remote-debugging-port=9222
+# --user-data-dir=...). When set, jobs attach to it instead of launching Chromium,
+# skipping the cold start and reusing its logged-in cookies.
+BROWSER_CDP_URL = os.getenv("BROWSER_CDP_URL", "")
+
+# One launched Chromium per event loop, shared by every job on it (each job
+# gets its own context). Playwright objects are bound to the loop that created
+# them, and each Celery task runs its own loop via asyncio.run().
+_browser_launches: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, asyncio.Task[tuple[Playwright, Browser]]
+] = weakref.WeakKeyDictionary()
+
+# Static assets (JS bundles, wasm, CSS, fonts) shared by every job in the
+# process. Each job's context starts with an empty HTTP cache, so without this
+# every run re-downloads the app's bundles — several MB for a Flutter build.
+ASSET_CACHE_BYTES = int(os.getenv("BROWSER_ASSET_CACHE_MB", "256")) * 1024 * 1024
+_ASSET_URL = re.compile(r"^https?://[^?#]+\.(?:js|mjs|css|wasm|woff2?|ttf|otf)(?:[?#]|$)")
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+# url -> (expires_at, status, headers, body), least recently used first
+_asset_cache: OrderedDict[str, tuple[float, int, dict[str, str], bytes]] = OrderedDict()
+_asset_cache_size = 0
 
 # Persistent browser sessions keyed by job_id
 _sessions: dict[str, dict[str, Any]] = {}
 
+# Per-job locks that serialize tools mutating the shared page
+_session_locks: dict[str, asyncio.Lock] = {}
+
+# Tools that only observe the current page and may run concurrently
+SCREENSHOT_TOOLS = frozenset({"take_screenshot", "take_full_page_screenshot"})
+READ_ONLY_TOOLS = frozenset({
+    "take_screenshot", "take_full_page_screenshot", "get_page_content", "list_interactive_elements",
+})
+
+
+# Page-inventory results per job, keyed by tool input plus the page's URL and
+# DOM fingerprint, so revisiting a page after a click still hits
+_read_cache: dict[str, OrderedDict[tuple, Any]] = {}
+READ_CACHE_SIZE = 32
+CACHEABLE_TOOLS = frozenset({"list_interactive_elements", "get_page_content"})
+
+# Bumped by every state-mutating tool; a read that overlaps one is not cached
+_page_generation: dict[str, int] = {}
+
+# Page actions whose failure on an unchanged page is deterministic, and the
+# job's last such failure as (call key, page fingerprint, result)
+REPEAT_GUARDED_TOOLS = frozenset({"click_element", "click_by_text", "type_text"})
+_last_failure: dict[str, tuple[tuple, str, dict[str, Any]]] = {}
+
+# FNV-1a over the serialized DOM, computed in the page so only a short
+# string crosses CDP instead of the whole document
+_FNV1A_JS = """const fnv1a = s => {
+        let h = 0x811c9dc5;
+        for (let i = 0; i < s.length; i++) {
+            h ^= s.charCodeAt(i);
+            h = Math.imul(h, 0x01000193);
+        }
+        return h >>> 0;
+    };"""
+_PAGE_FINGERPRINT_JS = """() => {
+    %s
+    const html = document.documentElement.outerHTML;
+    return [location.href, html.length, fnv1a(html)].join('|');
+}""" % _FNV1A_JS
+
+# The same fingerprint plus scroll position, for skipping a screenshot retake.
+# null when pixels can change without the DOM changing: canvas (Flutter,
+# charts) and video content, or images still decoding
+_SCREENSHOT_FINGERPRINT_JS = """() => {
+    if (document.querySelector('canvas, video') || Array.from(document.images).some(img => !img.complete)) {
+        return null;
+    }
+    %s
+    const html = document.documentElement.outerHTML;
+    return [location.href, window.scrollX, window.scrollY, html.length, fnv1a(html)].join('|');
+}""" % _FNV1A_JS
+
+# Per-job CDP session reused across consecutive screenshots
+_burst_state: dict[str, dict[str, Any]] = {}
+
+# Captured screenshot bytes per job, keyed by the path they are being written
+# to, and the in-flight background writes; stop_recording (or
+# flush_screenshots) waits for the writes to land
+_pending_screenshots: dict[str, dict[str, bytes]] = {}
+_screenshot_writes: dict[str, set[asyncio.Task[None]]] = {}
+
+# Digest of the DOM + scroll position at each job's last capture, with its path
+_last_dom_hash: dict[str, tuple[bytes, str]] = {}
+
+# Difference hash + path of every screenshot kept for a job; a capture within
+# SCREENSHOT_HASH_DISTANCE of any of them is a revisit and is not kept
+_screenshot_hashes: dict[str, list[tuple[int, str]]] = {}
+SCREENSHOT_HASH_DISTANCE = 4  # max differing bits (of 64) to count as the same view
+
+# Screenshots are JPEG: several times smaller than PNG for the same view
+SCREENSHOT_EXTENSIONS = (".jpg", ".png")  # .png for runs captured before the switch
+SCREENSHOT_JPEG_QUALITY = 80
+
+
+def session_lock(job_id: str) -> asyncio.Lock:
+    """Return the lock guarding state-mutating actions on a job's browser session."""
+    lock = _session_locks.get(job_id)
+    if lock is None:
+        lock = _session_locks[job_id] = asyncio.Lock()
+    return lock
+
+
+async def run_session_tool(
+    name: str,
+    input: dict,
+    dispatch: Callable[[str, dict], Awaitable[Any]],
+) -> Any:
+    """Run a browser tool through dispatch under the per-job session policy.
+
+    Read-only tools run concurrently, and inventory reads of a page whose URL
+    and DOM match an earlier read are served from _read_cache. Any other tool
+    runs under the job's session lock and marks the job's page as changed
+    before and after it runs. A page action that just failed is not re-run
+    while the page is unchanged; its error comes back marked "repeated".
+    """
+    job_id = input.get("job_id", "")
+    if name in READ_ONLY_TOOLS:
+        if name not in CACHEABLE_TOOLS or job_id not in _sessions:
+            return await dispatch(name, input)
+        generation = _page_generation.get(job_id, 0)
+        fingerprint = await _page_fingerprint(job_id)
+        if fingerprint is None:
+            return await dispatch(name, input)  # mid-navigation: read without caching
+        job_cache = _read_cache.setdefault(job_id, OrderedDict())
+        key = (name, tuple(sorted(input.items())), fingerprint)
+        if key in job_cache:
+            job_cache.move_to_end(key)
+            return job_cache[key]
+        result = await dispatch(name, input)
+        # A mutation that overlapped the read may have changed the page
+        # between the fingerprint and the result — don't cache that pairing
+        if generation != _page_generation.get(job_id, 0):
+            return result
+        if not (isinstance(result, dict) and result.get("status") == "error"):
+            job_cache[key] = result
+            if len(job_cache) > READ_CACHE_SIZE:
+                job_cache.popitem(last=False)
+        return result
+    key = (name, tuple(sorted(input.items())))
+    async with session_lock(job_id):
+        failed = _last_failure.get(job_id)
+        if failed is not None and failed[0] == key and failed[1] == await _page_fingerprint(job_id):
+            return {**failed[2], "repeated": True}
+        _invalidate_page_state(job_id)
+        try:
+            result = await dispatch(name, input)
+        finally:
+            _invalidate_page_state(job_id)
+        _last_failure.pop(job_id, None)
+        if name in REPEAT_GUARDED_TOOLS and isinstance(result, dict) and result.get("status") == "error":
+            fingerprint = await _page_fingerprint(job_id)
+            if fingerprint is not None:
+                _last_failure[job_id] = (key, fingerprint, result)
+        return result
+
+
+async def _page_fingerprint(job_id: str) -> str | None:
+    """URL + DOM fingerprint of a job's page, or None if it cannot be read right now."""
+    session = _sessions.get(job_id)
+    if session is None:
+        return None
+    try:
+        return await session["page"].evaluate(_PAGE_FINGERPRINT_JS)
+    except Exception:
+        return None
+
+
+def _invalidate_page_state(job_id: str) -> None:
+    """Mark a job's page as changed: in-flight reads go uncached.
+
+    A job without a session (never opened, or closed by stop_recording) has
+    nothing to invalidate, and must not leave an entry behind.
+    """
+    if job_id in _sessions:
+        _page_generation[job_id] = _page_generation.get(job_id, 0) + 1
+
 
 async def _get_session(job_id: str) -> dict[str, Any]:
     """Get or raise for an existing browser session."""
@@ -39,34 +229,162 @@ def _log_action(
     session["action_log"].append(entry)
 
 
-async def navigate_to_url(url: str, job_id: str) -> dict[str, str]:
-    """Open a URL in the browser WITHOUT video recording. Call start_recording later to begin recording."""
+# Playwright's 30s default lets one dead selector stall a turn; fail fast instead
+ACTION_TIMEOUT_MS = 5000
+NAVIGATION_TIMEOUT_MS = 15000
+
+
+def _bound_timeouts(page: Page) -> None:
+    """Cap per-action and navigation waits on a job's page (page-level, so a shared CDP context is untouched)."""
+    page.set_default_timeout(ACTION_TIMEOUT_MS)
+    page.set_default_navigation_timeout(NAVIGATION_TIMEOUT_MS)
+
+
+async def _wait_until_ready(page: Page) -> None:
+    """Wait for the load event (max 2s) plus a short settle, not for network idle.
+
+    SPAs with websockets, long-polling or analytics beacons may never reach
+    networkidle, which stalled goto() until its 30s timeout.
+    """
+    try:
+        await page.wait_for_function("document.readyState === 'complete'", timeout=2000)
+    except Exception:
+        pass  # slow subresources — the DOM is already usable
+    await page.wait_for_timeout(300)  # let app (e.g. Flutter) settle
+
+
+def _asset_lifetime(headers: dict[str, str]) -> int:
+    """Seconds a response may be reused per its Cache-Control (0 = not cacheable).
+
+    The cache is shared by every job (different apps and users), so anything
+    user-specific is excluded: private responses, responses setting cookies,
+    and responses that vary on anything but Accept-Encoding.
+    """
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control or "private" in cache_control:
+        return 0
+    if "set-cookie" in headers:
+        return 0
+    vary = {v.strip().lower() for v in headers.get("vary", "").split(",") if v.strip()}
+    if vary - {"accept-encoding"}:
+        return 0
+    match = _MAX_AGE.search(cache_control)
+    return int(match.group(1)) if match else 0
+
+
+def _store_asset(url: str, entry: tuple[float, int, dict[str, str], bytes]) -> None:
+    global _asset_cache_size
+    previous = _asset_cache.pop(url, None)
+    if previous is not None:
+        _asset_cache_size -= len(previous[3])
+    _asset_cache[url] = entry
+    _asset_cache_size += len(entry[3])
+    while _asset_cache_size > ASSET_CACHE_BYTES:
+        _, evicted = _asset_cache.popitem(last=False)
+        _asset_cache_size -= len(evicted[3])
+
+
+async def _serve_asset(route: Route) -> None:
+    """Answer a static-asset request from _asset_cache, filling it on a cacheable miss."""
+    request = route.request
+    if request.method != "GET":
+        await route.continue_()
+        return
+    entry = _asset_cache.get(request.url)
+    if entry is not None and entry[0] > time.time():
+        _asset_cache.move_to_end(request.url)
+        await route.fulfill(status=entry[1], headers=entry[2], body=entry[3])
+        return
+    try:
+        response = await route.fetch()
+        body = await response.body()
+    except Exception:
+        await route.continue_()  # let the browser's own request surface the failure
+        return
+    # body() is already decoded, so the encoding/length headers no longer apply
+    headers = {
+        k: v for k, v in response.headers.items() if k.lower() not in ("content-encoding", "content-length")
+    }
+    lifetime = _asset_lifetime(response.headers)
+    if response.status == 200 and lifetime > 0 and len(body) <= ASSET_CACHE_BYTES // 8:
+        # Never replay one job's cookies into another job's context
+        stored = {k: v for k, v in headers.items() if k.lower() != "set-cookie"}
+        _store_asset(request.url, (time.time() + lifetime, response.status, stored, body))
+    await route.fulfill(status=response.status, headers=headers, body=body)
+
+
+async def _new_job_context(browser: Browser, **kwargs: Any) -> BrowserContext:
+    """Create a job's 1280x720 context with static assets served from the shared cache."""
+    context = await browser.new_context(viewport={"width": 1280, "height": 720}, **kwargs)
+    if ASSET_CACHE_BYTES:
+        await context.route(_ASSET_URL, _serve_asset)
+    return context
+
+
+async def _launch_browser() -> tuple[Playwright, Browser]:
+    pw = await async_playwright().start()
+    browser = await pw.chromium.launch(headless=True, args=["--disable-dev-shm-usage"])
+    return pw, browser
+
+
+async def _get_browser() -> Browser:
+    """Return this event loop's shared Chromium, launching it on first use (or after a crash)."""
+    loop = asyncio.get_running_loop()
+    launch = _browser_launches.get(loop)
+    if launch is not None and launch.done() and (
+        launch.cancelled() or launch.exception() is not None or not launch.result()[1].is_connected()
+    ):
+        launch = None
+    if launch is None:
+        # A shared task, so concurrent first calls wait on one launch
+        launch = _browser_launches[loop] = loop.create_task(_launch_browser())
+    _, browser = await launch
+    return browser
+
+
+async def navigate_to_url(url: str, job_id: str, reload: bool = True) -> dict[str, str]:
+    """Open a URL in the browser WITHOUT video recording. Call start_recording later to begin recording.
+
+    With reload=False the goto is skipped when the page is already at url.
+    """
     output_dir = f"outputs/{job_id}"
     os.makedirs(output_dir, exist_ok=True)
 
     if job_id not in _sessions:
-        pw: Playwright = await async_playwright().start()
-        browser: Browser = await pw.chromium.launch(headless=True)
-        context = await browser.new_context(
-            viewport={"width": 1280, "height": 720},
-        )
-        page: Page = await context.new_page()
+        pw: Playwright | None = None
+        if BROWSER_CDP_URL:
+            pw = await async_playwright().start()
+            browser: Browser = await pw.chromium.connect_over_cdp(BROWSER_CDP_URL)
+            # The default context carries the profile's cookies — never close it
+            context = browser.contexts[0]
+            page: Page = await context.new_page()
+            await page.set_viewport_size({"width": 1280, "height": 720})
+        else:
+            browser = await _get_browser()
+            context = await _new_job_context(browser)
+            page = await context.new_page()
+        _bound_timeouts(page)
         _sessions[job_id] = {
-            "playwright": pw,
+            "playwright": pw,  # only set when this job owns a CDP connection
             "browser": browser,
             "context": context,
             "page": page,
             "output_dir": output_dir,
             "screenshot_count": 0,
+            "shared_context": bool(BROWSER_CDP_URL),
         }
     else:
         page = _sessions[job_id]["page"]
 
-    try:
-        await page.goto(url, wait_until="networkidle")
-        await page.wait_for_timeout(500)  # let app (e.g. Flutter) settle
-    except Exception as e:
-        return {"status": "error", "message": f"Failed to navigate to {url}: {e}"}
+    # Already there (e.g. "back to the list" after a detail view was dismissed
+    # in place): a goto would reload and re-hydrate the whole app for nothing.
+    # By default it still reloads — that is how a stuck page is recovered
+    if reload or page.url != url:
+        try:
+            await page.goto(url, wait_until="domcontentloaded")
+            await _wait_until_ready(page)
+        except Exception as e:
+            return {"status": "error", "message": f"Failed to navigate to {url}: {e}"}
     title = await page.title()
     meta_desc = await page.evaluate(
         "() => document.querySelector('meta[name=\"description\"]')?.content || ''"
@@ -74,36 +392,178 @@ async def navigate_to_url(url: str, job_id: str) -> dict[str, str]:
     return {"title": title, "description": meta_desc, "url": page.url}
 
 
-async def take_screenshot(job_id: str) -> dict[str, str]:
-    """Capture a screenshot of the current page. Returns the file path."""
+_ELEMENT_CLIP_JS = """el => {
+    const r = el.getBoundingClientRect();
+    return {x: r.x + window.scrollX, y: r.y + window.scrollY, width: r.width, height: r.height, scale: 1};
+}"""
+
+
+async def take_screenshot(job_id: str, full_page: bool = False, selector: str | None = None) -> dict[str, str]:
+    """Capture the viewport (or the whole page) once it settles (network idle, max 3s). Returns the file path.
+
+    With a selector, only that element's bounding box is captured (e.g. an
+    open [role=dialog]), which encodes a fraction of the viewport's pixels.
+
+    If the DOM and scroll position are unchanged since the job's last capture
+    of the same kind, returns that capture's path with "cached": True instead
+    of taking another — unless the page has canvas/video content or images
+    still loading, whose pixels change without the DOM changing.
+    """
     session = await _get_session(job_id)
+    page: Page = session["page"]
+    try:
+        await page.wait_for_load_state("networkidle", timeout=3000)
+    except Exception:
+        pass  # long-polling/websocket pages never go idle — capture anyway
+    element_clip = None
+    if selector:
+        try:
+            # Document coordinates: CDP clips are not relative to the viewport
+            element_clip = await page.locator(selector).first.evaluate(_ELEMENT_CLIP_JS)
+        except Exception as e:
+            return {"status": "error", "message": f"Element not found for screenshot: {selector} ({e})"}
+        if not element_clip["width"] or not element_clip["height"]:
+            return {"status": "error", "message": f"Element is not visible: {selector}"}
+    fingerprint = await page.evaluate(_SCREENSHOT_FINGERPRINT_JS)
+    dom_hash = None
+    if fingerprint is not None:
+        dom_hash = hashlib.blake2b(
+            f"{selector or ''}\0{fingerprint}".encode(), digest_size=16, person=b"full" if full_page else b"view",
+        ).digest()
+        last = _last_dom_hash.get(job_id)
+        if last is not None and last[0] == dom_hash:
+            return {"path": last[1], "cached": True}
+    # Burst mode: reuse the CDP session between captures instead of
+    # page.screenshot()'s per-call setup round-trips
+    burst = _burst_state.get(job_id)
+    if burst is None or burst["page"] is not page:  # start_recording swaps the page
+        cdp = await page.context.new_cdp_session(page)
+        burst = _burst_state[job_id] = {"page": page, "cdp": cdp}
+    params: dict[str, Any] = {"format": "jpeg", "quality": SCREENSHOT_JPEG_QUALITY}
+    if full_page:
+        # Full-page capture relayouts the whole document — only when asked.
+        # The size is re-read every time: lazy-loaded content grows the page
+        # without any tool call
+        metrics = await burst["cdp"].send("Page.getLayoutMetrics")
+        size = metrics["cssContentSize"]
+        clip = {"x": 0, "y": 0, "width": size["width"], "height": size["height"], "scale": 1}
+        params.update(clip=clip, captureBeyondViewport=True)
+    elif element_clip is not None:
+        params["clip"] = element_clip
+    shot = await burst["cdp"].send("Page.captureScreenshot", params)
+    data = base64.b64decode(shot["data"])
+    # The DOM check misses re-renders of a view already captured (e.g. back
+    # on a list after a detail page) — compare pixels against every kept shot
+    image_hash = await asyncio.to_thread(_difference_hash, data)
+    kept = _screenshot_hashes.setdefault(job_id, [])
+    for seen_hash, seen_path in kept:
+        if (seen_hash ^ image_hash).bit_count() <= SCREENSHOT_HASH_DISTANCE:
+            _remember_dom_hash(job_id, dom_hash, seen_path)
+            return {"path": seen_path, "cached": True}
     session["screenshot_count"] += 1
     screenshots_dir = f"{session['output_dir']}/screenshots"
     os.makedirs(screenshots_dir, exist_ok=True)
-    path = f"{screenshots_dir}/screen_{session['screenshot_count']}.png"
-    await session["page"].screenshot(path=path, full_page=True)
+    path = f"{screenshots_dir}/screen_{session['screenshot_count']}.jpg"
+    _pending_screenshots.setdefault(job_id, {})[path] = data
+    # Write behind: the disk I/O overlaps the agent's next turn instead of gating it
+    write = asyncio.get_running_loop().create_task(_write_screenshot(job_id, path, data))
+    _screenshot_writes.setdefault(job_id, set()).add(write)
+    _remember_dom_hash(job_id, dom_hash, path)
+    kept.append((image_hash, path))
     return {"path": path}
 
 
+def _remember_dom_hash(job_id: str, dom_hash: bytes | None, path: str) -> None:
+    """Record the fingerprint of the job's latest capture; None means it can't be reused."""
+    if dom_hash is None:
+        _last_dom_hash.pop(job_id, None)
+    else:
+        _last_dom_hash[job_id] = (dom_hash, path)
+
+
+def _difference_hash(data: bytes) -> int:
+    """Compute a 64-bit difference hash of an image (9x8 grayscale, bit = brighter than right neighbour)."""
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (144, 128))  # JPEG: let the decoder downscale instead of decoding full size
+        pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            i = row * 9 + col
+            bits = (bits << 1) | (pixels[i] > pixels[i + 1])
+    return bits
+
+
+def screenshot_bytes(job_id: str, path: str) -> bytes:
+    """Return a screenshot's image bytes, from memory if it has not been flushed yet."""
+    data = _pending_screenshots.get(job_id, {}).get(path)
+    if data is not None:
+        return data
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def _write_screenshot(job_id: str, path: str, data: bytes) -> None:
+    """Background write of one capture; its bytes stay readable from memory until it lands."""
+    await asyncio.to_thread(_write_file, path, data)
+    pending = _pending_screenshots.get(job_id)
+    if pending is not None:
+        pending.pop(path, None)
+
+
+async def flush_screenshots(job_id: str) -> None:
+    """Wait until a job's screenshots are on disk. Safe to call repeatedly."""
+    writes = _screenshot_writes.pop(job_id, None)
+    if writes:
+        await asyncio.gather(*writes)
+    _pending_screenshots.pop(job_id, None)
+
+
+# Resolve-and-measure helpers: evaluate_all runs on every match in one round
+# trip and, unlike count()/bounding_box(), never waits for a missing element
+_FIRST_BOX_JS = """els => {
+    if (!els.length) return null;
+    const r = els[0].getBoundingClientRect();
+    return {count: els.length, x: r.x, y: r.y, width: r.width, height: r.height};
+}"""
+_TYPE_TARGET_JS = """els => {
+    if (!els.length) return null;
+    const inner = els[0].querySelector('input, textarea');
+    const target = inner || els[0];
+    return {nested: !!inner, tag: (target.tagName || '').toLowerCase()};
+}"""
+
+
+def _box_center(box: dict[str, float]) -> tuple[float | None, float | None]:
+    """Center of a _FIRST_BOX_JS box, or (None, None) for an unrendered element."""
+    if not box["width"] and not box["height"]:
+        return None, None
+    return box["x"] + box["width"] / 2, box["y"] + box["height"] / 2
+
+
 async def type_text(selector: str, text: str, job_id: str) -> dict[str, str]:
     """Type text into an input field identified by CSS selector. For Flutter/OTP fields: focuses, waits, then types."""
     session = await _get_session(job_id)
     page: Page = session["page"]
-    el = await page.query_selector(selector)
-    if not el:
+    el = page.locator(selector)
+    # One round trip resolves the element, its nested input and the tag
+    info = await el.evaluate_all(_TYPE_TARGET_JS)
+    if info is None:
         return {"status": "error", "message": f"Element not found: {selector}"}
     # Flutter often wraps the real input: prefer nested input/textarea for fill()
-    input_el = await el.query_selector("input, textarea")
-    target = input_el if input_el else el
+    target = el.first.locator("input, textarea").first if info["nested"] else el.first
     try:
-        await target.scroll_into_view_if_needed()
-        await target.click()
+        await target.click()  # scrolls into view itself
         await page.wait_for_timeout(200)  # let Flutter assign focus before typing
         await target.focus()
         await page.wait_for_timeout(100)
         # Try fill() on real input/textarea; otherwise type via keyboard (Flutter canvas/custom)
-        tag = await target.evaluate("el => (el.tagName && el.tagName.toLowerCase()) || ''")
-        if tag in ("input", "textarea"):
+        if info["tag"] in ("input", "textarea"):
             await target.fill("")
             await target.fill(text)
         else:
@@ -129,24 +589,48 @@ async def press_key(key: str, job_id: str) -> dict[str, str]:
     return {"status": "ok", "message": f"Pressed {key}"}
 
 
+async def go_back(job_id: str) -> dict[str, str]:
+    """Go back one history entry. Returns the page state afterwards.
+
+    In an SPA the previous entry is a client-side route, so this is a
+    popstate handled in-page rather than the full reload navigate_to_url does.
+    """
+    session = await _get_session(job_id)
+    page: Page = session["page"]
+    previous_url = page.url
+    try:
+        # "commit" returns as soon as the history step lands; same-document
+        # entries never fire load, and cross-document ones get the usual wait
+        response = await page.go_back(wait_until="commit")
+        if response is not None:
+            await page.wait_for_load_state("domcontentloaded")
+        await _wait_until_ready(page)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    if page.url == previous_url:
+        return {"status": "error", "message": "No previous page in history"}
+    _log_action(session, "navigate", "Went back")
+    return {"status": "ok", "title": await page.title(), "url": page.url}
+
+
 async def click_element(selector: str, job_id: str) -> dict[str, str]:
     """Click an element by CSS selector. Returns new page state after click."""
     session = await _get_session(job_id)
     page: Page = session["page"]
-    el = await page.query_selector(selector)
-    if not el:
+    # A locator re-resolves on use, so a re-render between lookup and click
+    # cannot leave us holding a stale element handle
+    el = page.locator(selector)
+    # Existence check and bounding box (for the action journal) in one round trip
+    box = await el.evaluate_all(_FIRST_BOX_JS)
+    if box is None:
         return {"status": "error", "message": f"Element not found: {selector}"}
-    # Capture bounding box for action journal before click
-    box = await el.bounding_box()
     try:
-        await el.scroll_into_view_if_needed()
-        await el.click()
+        await el.first.click()  # scrolls into view itself
         await page.wait_for_timeout(400)  # allow navigation/UI update (e.g. Flutter)
         await page.wait_for_load_state("domcontentloaded")
     except Exception as e:
         return {"status": "error", "message": str(e)}
-    cx = box["x"] + box["width"] / 2 if box else None
-    cy = box["y"] + box["height"] / 2 if box else None
+    cx, cy = _box_center(box)
     _log_action(session, "click", f"Clicked {selector}", cx, cy)
     title = await page.title()
     return {"status": "ok", "title": title, "url": page.url}
@@ -162,32 +646,28 @@ async def click_by_text(text: str, job_id: str, exact: bool = False) -> dict[str
     page: Page = session["page"]
     try:
         locator = page.get_by_text(text, exact=exact)
-        count = await locator.count()
-        if count == 0:
+        box = await locator.evaluate_all(_FIRST_BOX_JS)
+        if box is None:
             # Fallback: try role-based locators
             for role in ("button", "tab", "link", "menuitem"):
                 role_loc = page.get_by_role(role, name=text)
-                if await role_loc.count() > 0:
+                box = await role_loc.evaluate_all(_FIRST_BOX_JS)
+                if box is not None:
                     locator = role_loc
-                    count = await locator.count()
                     break
-        if count == 0:
+        if box is None:
             return {"status": "error", "message": f"No element found with text: '{text}'"}
-        # Click the first visible match
-        target = locator.first
-        box = await target.bounding_box()
-        await target.scroll_into_view_if_needed()
-        await target.click()
+        # Click the first match (click scrolls it into view)
+        await locator.first.click()
         await page.wait_for_timeout(500)
         try:
             await page.wait_for_load_state("domcontentloaded", timeout=3000)
         except Exception:
             pass  # Flutter apps may not trigger network activity
-        cx = box["x"] + box["width"] / 2 if box else None
-        cy = box["y"] + box["height"] / 2 if box else None
+        cx, cy = _box_center(box)
         _log_action(session, "click", f"Clicked text '{text}'", cx, cy)
         title = await page.title()
-        return {"status": "ok", "title": title, "url": page.url, "matches": count}
+        return {"status": "ok", "title": title, "url": page.url, "matches": box["count"]}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -206,6 +686,78 @@ async def scroll_page(direction: str, amount: int, job_id: str) -> dict[str, str
     return {"status": "ok", "message": f"Scrolled {direction} by {amount}px"}
 
 
+# In-page inventory of clickable elements (first 60, in selector-priority order)
+_INTERACTIVE_ELEMENTS_JS = """() => {
+    const selectors = [
+        'button', 'a[href]', 'input', 'textarea', 'select',
+        'input[type=submit]',
+        '[role=button]', '[role=tab]', '[role=link]', '[role=textbox]',
+        '[role=menuitem]', '[role=option]', '[role=listitem]',
+        'flt-semantics', 'flt-semantics-container',
+        '[aria-roledescription]',
+        '[aria-label]', 'svg[role]', '[data-icon]'
+    ];
+    // Unique structural path for elements with no id/label/short text
+    const cssPath = (el) => {
+        const parts = [];
+        let node = el;
+        for (; node && node.nodeType === 1 && node !== document.body; node = node.parentElement) {
+            if (node.id) { parts.unshift('#' + CSS.escape(node.id)); break; }
+            let part = node.tagName.toLowerCase();
+            const siblings = node.parentElement
+                ? Array.from(node.parentElement.children).filter(c => c.tagName === node.tagName)
+                : [];
+            if (siblings.length > 1) part += `:nth-of-type(${siblings.indexOf(node) + 1})`;
+            parts.unshift(part);
+        }
+        if (node === document.body) parts.unshift('body');
+        return parts.join(' > ');
+    };
+    const seen = new Set();
+    const visited = new Set();  // elements matching several selectors are described once
+    const results = [];
+    for (const sel of selectors) {
+        for (const el of document.querySelectorAll(sel)) {
+            if (visited.has(el)) continue;
+            visited.add(el);
+            // Try multiple sources for descriptive text
+            let text = (el.innerText || '').trim();
+            if (!text) text = (el.value || '').trim();
+            if (!text) text = (el.getAttribute('aria-label') || '').trim();
+            if (!text) text = (el.getAttribute('aria-roledescription') || '').trim();
+            if (!text) text = (el.getAttribute('title') || '').trim();
+            // For icon-only elements, describe by class or tag
+            if (!text) {
+                const svg = el.querySelector('svg');
+                const img = el.querySelector('img');
+                const cls = el.className ? String(el.className).substring(0, 60) : '';
+                if (svg) text = '[icon-button]';
+                else if (img) text = '[image-button: ' + (img.alt || 'no-alt') + ']';
+                else if (cls) text = '[' + cls.split(' ')[0] + ']';
+            }
+            if (!text) text = '[unnamed-' + el.tagName.toLowerCase() + ']';
+            text = text.substring(0, 100);
+            if (seen.has(text)) continue;
+            seen.add(text);
+            const tag = el.tagName.toLowerCase();
+            const role = el.getAttribute('role') || '';
+            const href = el.getAttribute('href') || '';
+            const ariaLabel = el.getAttribute('aria-label') || '';
+            // Build a usable selector
+            let css;
+            if (el.id) css = '#' + el.id;
+            else if (ariaLabel) css = `[aria-label="${ariaLabel.replace(/"/g, '\\\\"')}"]`;
+            else if (text.length < 50 && !text.startsWith('[')) css = `${tag}:has-text("${text.replace(/"/g, '\\\\"')}")`;
+            else css = cssPath(el);  // walks to the root, so only when nothing shorter works
+            results.push({tag, text, role, href, selector: css, ariaLabel});
+            // Only the first 60 are returned: stop before measuring the rest
+            if (results.length === 60) return results;
+        }
+    }
+    return results;
+}"""
+
+
 async def list_interactive_elements(job_id: str) -> list[dict[str, str]] | dict[str, str]:
     """List clickable elements on the current page with their selectors and text.
 
@@ -214,53 +766,7 @@ async def list_interactive_elements(job_id: str) -> list[dict[str, str]] | dict[
     session = await _get_session(job_id)
     page: Page = session["page"]
     try:
-        elements = await page.evaluate("""() => {
-        const selectors = [
-            'button', 'a[href]', 'input', 'textarea', 'select',
-            'input[type=submit]',
-            '[role=button]', '[role=tab]', '[role=link]', '[role=textbox]',
-            '[role=menuitem]', '[role=option]', '[role=listitem]',
-            'flt-semantics', 'flt-semantics-container',
-            '[aria-roledescription]',
-            '[aria-label]', 'svg[role]', '[data-icon]'
-        ];
-        const seen = new Set();
-        const results = [];
-        for (const sel of selectors) {
-            for (const el of document.querySelectorAll(sel)) {
-                // Try multiple sources for descriptive text
-                let text = (el.innerText || '').trim();
-                if (!text) text = (el.value || '').trim();
-                if (!text) text = (el.getAttribute('aria-label') || '').trim();
-                if (!text) text = (el.getAttribute('aria-roledescription') || '').trim();
-                if (!text) text = (el.getAttribute('title') || '').trim();
-                // For icon-only elements, describe by class or tag
-                if (!text) {
-                    const svg = el.querySelector('svg');
-                    const img = el.querySelector('img');
-                    const cls = el.className ? String(el.className).substring(0, 60) : '';
-                    if (svg) text = '[icon-button]';
-                    else if (img) text = '[image-button: ' + (img.alt || 'no-alt') + ']';
-                    else if (cls) text = '[' + cls.split(' ')[0] + ']';
-                }
-                if (!text) text = '[unnamed-' + el.tagName.toLowerCase() + ']';
-                text = text.substring(0, 100);
-                if (seen.has(text)) continue;
-                seen.add(text);
-                const tag = el.tagName.toLowerCase();
-                const role = el.getAttribute('role') || '';
-                const href = el.getAttribute('href') || '';
-                const ariaLabel = el.getAttribute('aria-label') || '';
-                // Build a usable selector
-                let css = sel;
-                if (el.id) css = '#' + el.id;
-                else if (ariaLabel) css = `[aria-label="${ariaLabel.replace(/"/g, '\\\\"')}"]`;
-                else if (text.length < 50 && !text.startsWith('[')) css = `${tag}:has-text("${text.replace(/"/g, '\\\\"')}")`;
-                results.push({tag, text, role, href, selector: css, ariaLabel});
-            }
-        }
-        return results.slice(0, 60);
-    }""")
+        elements = await page.evaluate(_INTERACTIVE_ELEMENTS_JS)
     except Exception as e:
         return {"status": "error", "message": f"Failed to list interactive elements: {e}"}
     return elements
@@ -274,16 +780,296 @@ async def wait_seconds(seconds: float, job_id: str) -> dict[str, str]:
     return {"status": "ok", "message": f"Waited {sec}s"}
 
 
-async def get_page_content(job_id: str) -> dict[str, str]:
-    """Get the visible text content of the current page."""
+PAGE_TEXT_LIMIT = 6000
+_PAGE_TEXT_HEAD = 3000
+_PAGE_TEXT_TAIL = 1500
+_LABEL_LINE = re.compile(r"^\s*[A-Z]|:")  # headings, buttons, "Field: value" labels
+
+
+def _salient_text(text: str) -> str:
+    """Trim page text to PAGE_TEXT_LIMIT: head, tail, and short label-like lines in between."""
+    if len(text) <= PAGE_TEXT_LIMIT:
+        return text
+    head, middle, tail = text[:_PAGE_TEXT_HEAD], text[_PAGE_TEXT_HEAD:-_PAGE_TEXT_TAIL], text[-_PAGE_TEXT_TAIL:]
+    budget = PAGE_TEXT_LIMIT - _PAGE_TEXT_HEAD - _PAGE_TEXT_TAIL
+    kept: list[str] = []
+    seen: set[str] = set()
+    for line in middle.split("\n"):
+        line = line.strip()
+        if not line or len(line) >= 200 or line in seen or not _LABEL_LINE.search(line):
+            continue
+        if len(line) + 1 > budget:
+            break
+        seen.add(line)
+        kept.append(line)
+        budget -= len(line) + 1
+    return "\n".join([head, "[… truncated …]", *kept, "[…]", tail])
+
+
+# Page text plus its section headings, so a truncated page still shows its outline
+_PAGE_CONTENT_JS = """() => ({
+    text: document.body.innerText,
+    headings: [...document.querySelectorAll('h1, h2, h3, [role=heading]')]
+        .map(el => el.innerText.trim()).filter(Boolean).slice(0, 20),
+})"""
+
+
+async def get_page_content(job_id: str) -> dict[str, Any]:
+    """Get the visible text of the current page — salient text only, truncated to ~6 KB.
+
+    A truncated result is flagged and carries the page's headings (max 20).
+    """
     session = await _get_session(job_id)
     page: Page = session["page"]
     try:
-        text = await page.evaluate("() => document.body.innerText")
+        content = await page.evaluate(_PAGE_CONTENT_JS)
         title = await page.title()
     except Exception as e:
         return {"status": "error", "message": f"Failed to get page content: {e}"}
-    return {"title": title, "url": page.url, "text": text[:5000]}
+    text = content["text"]
+    if len(text) <= PAGE_TEXT_LIMIT:
+        return {"title": title, "url": page.url, "text": text}
+    return {
+        "title": title,
+        "url": page.url,
+        "text": _salient_text(text),
+        "truncated": True,
+        "headings": list(dict.fromkeys(content["headings"])),
+    }
+
+
+async def _await_dashboard(job_id: str, timeout_s: float = 5.0) -> dict[str, Any]:
+    """Poll until the page looks logged in or timeout_s passes. Returns the last page content."""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        await wait_seconds(0.5, job_id)
+        page_content = await get_page_content(job_id)
+        if _is_logged_in(page_content) or time.monotonic() >= deadline:
+            return page_content
+
+
+def _is_logged_in(page_content: dict | str) -> bool:
+    """Check if page content indicates we're already logged in (not on a login page).
+
+    Returns False if:
+    - Page has login indicators (login form present)
+    - Page has very little content (still loading/splash screen)
+    """
+    text = page_content.get("text", "") if isinstance(page_content, dict) else str(page_content)
+    text_lower = text.lower().strip()
+
+    # If page has very little content, it's likely still loading — not logged in
+    if len(text_lower) < 50:
+        return False
+
+    login_indicators = ["log in", "login", "sign in", "get otp", "enter your phone",
+                        "enter your email", "phone number", "password", "forgot password"]
+    return not any(indicator in text_lower for indicator in login_indicators)
+
+
+async def _login_phone_otp(
+    job_id: str,
+    phone: str,
+    otp_or_password: str,
+    selectors: dict,
+    app_type: str,
+    max_attempts: int = 2,
+) -> bool:
+    """Phone + OTP/password login flow with retry support.
+
+    Uses KB login_selectors when provided, falls back to generic selectors.
+    """
+    phone_str = str(phone)
+    # Strip country code if the UI already shows it (e.g. +966)
+    local_phone = phone_str[3:] if phone_str.startswith("966") else phone_str
+
+    phone_selector = selectors.get("phone_input")
+    get_otp_text = selectors.get("get_otp_button", "Get OTP")
+    otp_selector = selectors.get("otp_input")
+    verify_text = selectors.get("verify_button", "Verify")
+
+    for attempt in range(1, max_attempts + 1):
+        logger.info("Login attempt %d/%d — phone=%s, app_type=%s",
+                     attempt, max_attempts, local_phone, app_type)
+
+        # ── Step 1: Enter phone number ──────────────────────────
+        if phone_selector:
+            # Use the specific KB selector (e.g. Flutter semantic node)
+            logger.info("Clicking phone input via KB selector: %s", phone_selector)
+            result = await type_text(phone_selector, local_phone, job_id)
+            if isinstance(result, dict) and result.get("status") == "error":
+                logger.warning("KB phone selector failed: %s — trying text fallback", result.get("message"))
+                await click_by_text("Phone Number", job_id)
+                await wait_seconds(1, job_id)
+                await type_text("input", local_phone, job_id)
+        else:
+            # Generic fallback: click label then type into first input
+            await click_by_text("Phone Number", job_id)
+            await wait_seconds(1, job_id)
+            await type_text("input", local_phone, job_id)
+
+        await wait_seconds(1, job_id)
+
+        # ── Step 2: Submit phone (click "Get OTP") ─────────────
+        logger.info("Submitting phone — clicking '%s'", get_otp_text)
+        await click_by_text(get_otp_text, job_id)
+        # Wait for the OTP screen: for its input when the KB names one, else a fixed pause
+        if otp_selector:
+            try:
+                await _sessions[job_id]["page"].wait_for_selector(otp_selector, timeout=4000)
+            except Exception:
+                pass  # typing below falls back to scanning for the field
+        else:
+            await wait_seconds(4, job_id)
+
+        # ── Step 3: Enter OTP/password ──────────────────────────
+        if not otp_or_password:
+            logger.error("No OTP/password provided in credentials — cannot complete login")
+            return False
+
+        logger.info("Entering OTP (%d digits)", len(otp_or_password))
+        otp_typed = False
+
+        # Method A: Use KB-specific OTP selector
+        if otp_selector:
+            logger.info("Typing OTP via KB selector: %s", otp_selector)
+            result = await type_text(otp_selector, otp_or_password, job_id)
+            if isinstance(result, dict) and result.get("status") != "error":
+                otp_typed = True
+            else:
+                logger.warning("KB OTP selector failed: %s", result.get("message") if isinstance(result, dict) else result)
+
+        # Method B: Scan interactive elements for OTP-like inputs
+        if not otp_typed:
+            elements = await list_interactive_elements(job_id)
+            if isinstance(elements, list):
+                for el in elements:
+                    sel = el.get("selector", "") if isinstance(el, dict) else str(el)
+                    text = el.get("text", "") if isinstance(el, dict) else ""
+                    combined = (sel + " " + text).lower()
+                    if any(kw in combined for kw in ("one-time-code", "otp", "verification", "verify")):
+                        logger.info("Found OTP element via scan: %s", sel)
+                        result = await type_text(sel, otp_or_password, job_id)
+                        if isinstance(result, dict) and result.get("status") != "error":
+                            otp_typed = True
+                            break
+
+        # Method C: Type digits via keyboard (OTP field should have focus)
+        if not otp_typed:
+            logger.info("Typing OTP digits via keyboard as fallback")
+            for digit in otp_or_password:
+                await press_key(digit, job_id)
+            otp_typed = True
+
+        await wait_seconds(1, job_id)
+
+        # ── Step 4: Submit OTP (click "Verify") ────────────────
+        logger.info("Submitting OTP — clicking '%s'", verify_text)
+        try:
+            await click_by_text(verify_text, job_id)
+        except Exception:
+            logger.info("'%s' not found, trying 'Submit'", verify_text)
+            try:
+                await click_by_text("Submit", job_id)
+            except Exception:
+                logger.warning("Could not find verify/submit button")
+
+        # ── Step 5: Wait and verify login succeeded ─────────────
+        logger.info("Waiting for dashboard to load")
+        page_content = await _await_dashboard(job_id)
+        if _is_logged_in(page_content):
+            logger.info("Login verified successfully on attempt %d", attempt)
+            return True
+
+        logger.warning("Login attempt %d failed — still on login page", attempt)
+
+        # On retry: check if login_success_indicator tells us what to look for
+        success_indicator = selectors.get("login_success_indicator")
+        if success_indicator:
+            text = page_content.get("text", "") if isinstance(page_content, dict) else str(page_content)
+            if success_indicator.lower() in text.lower():
+                logger.info("Login success indicator '%s' found", success_indicator)
+                return True
+
+    logger.error("Login failed after %d attempts", max_attempts)
+    return False
+
+
+async def _login_email_password(
+    job_id: str,
+    email: str,
+    password: str,
+    selectors: dict,
+) -> bool:
+    """Email + password login flow."""
+    logger.info("Entering email and password")
+    email_selector = selectors.get("email_input", "input[type='email']")
+    password_selector = selectors.get("password_input", "input[type='password']")
+
+    await type_text(email_selector, str(email), job_id)
+    await type_text(password_selector, password, job_id)
+
+    submit_text = selectors.get("submit_button", "Log in")
+    try:
+        await click_by_text(submit_text, job_id)
+    except Exception:
+        try:
+            await click_by_text("Sign in", job_id)
+        except Exception:
+            await click_by_text("Submit", job_id)
+
+    logger.info("Waiting for dashboard to load")
+    page_content = await _await_dashboard(job_id)
+    verified = _is_logged_in(page_content)
+    if not verified:
+        logger.warning("Email login may have failed — still on login page")
+    return verified
+
+
+async def login_and_navigate(
+    url: str,
+    job_id: str,
+    credentials: dict | None = None,
+    target_section: str | None = None,
+) -> dict[str, Any]:
+    """Open a URL, log in with the given credentials and optionally open a section — in one call.
+
+    credentials uses the knowledge-base shape: phone or email, otp or password,
+    and optional login_selectors / app_type. Skips login when the page is
+    already past the login screen. Without a phone or email there is nothing
+    to try, so the page is taken as logged in (public apps, cookie sessions);
+    logged_in is False only when the page did not open or a login attempt failed.
+    """
+    result = await navigate_to_url(url, job_id)
+    if result.get("status") == "error":
+        return {**result, "logged_in": False}
+    # SPA/Flutter apps render after load — poll until the page looks logged in
+    # rather than a fixed 5s; a login screen (or a dashboard that never paints
+    # its text) still gets the full 5s before the login flow runs
+    logged_in = True
+    creds = credentials or {}
+    page_content = await _await_dashboard(job_id)
+    if _is_logged_in(page_content):
+        logger.info("Already logged in, skipping login flow")
+    elif creds.get("phone") or creds.get("email"):
+        # OTP/password — check both fields (KB may store as "otp" or "password")
+        otp_or_password = str(creds.get("otp") or creds.get("password", ""))
+        # KB may provide app-specific selectors for login elements
+        selectors = creds.get("login_selectors", {})
+        if creds.get("phone"):
+            logged_in = await _login_phone_otp(
+                job_id, creds["phone"], otp_or_password, selectors, creds.get("app_type", "html"),
+            )
+        else:
+            logged_in = await _login_email_password(
+                job_id, creds["email"], otp_or_password, selectors,
+            )
+
+    if target_section and logged_in:
+        await click_by_text(target_section, job_id)
+
+    page: Page = _sessions[job_id]["page"]
+    return {"status": "ok" if logged_in else "error", "logged_in": logged_in, "title": await page.title(), "url": page.url}
 
 
 async def start_recording(job_id: str) -> dict[str, str]:
@@ -303,21 +1089,25 @@ async def start_recording(job_id: str) -> dict[str, str]:
     storage_state = await session["context"].storage_state()
     current_url = page.url
 
-    # 2. Close old context (no video was recorded)
-    await session["context"].close()
+    # 2. Close old context (no video was recorded); a shared CDP context only loses this job's page
+    if session.pop("shared_context", False):
+        await page.close()
+    else:
+        await session["context"].close()
 
     # 3. Create new context WITH video recording, importing saved state
     video_dir = f"{output_dir}/video"
     os.makedirs(video_dir, exist_ok=True)
-    new_context = await session["browser"].new_context(
+    new_context = await _new_job_context(
+        session["browser"],
         record_video_dir=video_dir,
         record_video_size={"width": 1280, "height": 720},
-        viewport={"width": 1280, "height": 720},
         storage_state=storage_state,
     )
     new_page: Page = await new_context.new_page()
-    await new_page.goto(current_url, wait_until="networkidle")
-    await new_page.wait_for_timeout(500)
+    _bound_timeouts(new_page)
+    await new_page.goto(current_url, wait_until="domcontentloaded")
+    await _wait_until_ready(new_page)
 
     # 4. Update session references
     session["context"] = new_context
@@ -336,13 +1126,25 @@ async def stop_recording(job_id: str) -> dict[str, Any]:
         return {"status": "error", "video_path": None, "action_log": []}
 
     session = _sessions.pop(job_id)
+    _session_locks.pop(job_id, None)
+    _burst_state.pop(job_id, None)
+    _last_dom_hash.pop(job_id, None)
+    _screenshot_hashes.pop(job_id, None)
+    _read_cache.pop(job_id, None)
+    _page_generation.pop(job_id, None)
+    _last_failure.pop(job_id, None)
+    await flush_screenshots(job_id)
     page: Page = session["page"]
     video = page.video
     action_log = session.get("action_log", [])
     output_dir = session["output_dir"]
-    await session["context"].close()
-    await session["browser"].close()
-    await session["playwright"].stop()
+    if session.get("shared_context"):
+        await page.close()
+    else:
+        await session["context"].close()
+    if session["playwright"] is not None:
+        await session["browser"].close()  # for a CDP connection this only disconnects
+        await session["playwright"].stop()
 
     video_path = None
     if video:
@@ -360,7 +1162,7 @@ async def stop_recording(job_id: str) -> dict[str, Any]:
     # Save action log as JSON for standalone use
     if action_log:
         log_path = f"{output_dir}/action_log.json"
-        with open(log_path, "w") as f:
-            json.dump(action_log, f, indent=2)
+        with open(log_path, "wb") as f:
+            f.write(orjson.dumps(action_log, option=orjson.OPT_INDENT_2))
 
     return {"status": "stopped", "video_path": video_path, "action_log": action_log}
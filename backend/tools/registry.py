@@ -0,0 +1,272 @@
+"""Browser tool definitions shared by every agent that drives a Playwright session.
+
+TOOL_SCHEMAS holds one frozen Anthropic tool definition per browser tool and
+TOOL_HANDLERS maps each name to its browser_tools call; agents pick the subset
+they expose with tool_schemas().
+"""
+from __future__ import annotations
+
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Final, Iterable, Mapping
+
+from tools.browser_tools import (
+    click_by_text,
+    click_element,
+    get_page_content,
+    go_back,
+    list_interactive_elements,
+    login_and_navigate,
+    navigate_to_url,
+    press_key,
+    scroll_page,
+    start_recording,
+    stop_recording,
+    take_screenshot,
+    type_text,
+    wait_seconds,
+)
+
+TOOL_SCHEMAS: Final[Mapping[str, Mapping[str, Any]]] = MappingProxyType({
+    tool["name"]: MappingProxyType(tool) for tool in [
+        {
+            "name": "login_and_navigate",
+            "description": "Open a URL, log in and optionally open a target section in ONE call (no screenshots, no recording). Returns logged_in, page title and URL. Use this for Phase 0 instead of separate navigate/type/click steps.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "url": {"type": "string", "description": "The URL to open"},
+                    "job_id": {"type": "string", "description": "The job ID for session management"},
+                    "credentials": {
+                        "type": "object",
+                        "description": "Login credentials from the task: phone or email, otp or password, and optional login_selectors / app_type. Omit if no login is needed.",
+                        "properties": {
+                            "phone": {"type": "string"},
+                            "email": {"type": "string"},
+                            "otp": {"type": "string"},
+                            "password": {"type": "string"},
+                            "login_selectors": {"type": "object"},
+                            "app_type": {"type": "string"},
+                        },
+                    },
+                    "target_section": {"type": "string", "description": "Visible text of the nav item to open after login (optional)"},
+                },
+                "required": ["url", "job_id"],
+            },
+        },
+        {
+            "name": "navigate_to_url",
+            "description": "Open a URL in the browser. Creates a new session if needed. Returns page title and description.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "url": {"type": "string", "description": "The URL to navigate to"},
+                    "job_id": {"type": "string", "description": "The job ID for session management"},
+                    "reload": {"type": "boolean", "description": "Default true. Set false when returning to a list the page may already show, to skip reloading if it is already at this URL."},
+                },
+                "required": ["url", "job_id"],
+            },
+        },
+        {
+            "name": "take_screenshot",
+            "description": "Capture a JPEG screenshot of the visible viewport. Only call after navigating to a new, distinct screen (e.g. new tab, detail page, or open popup). Do not call again until the view has changed — one screenshot per distinct view. Use take_full_page_screenshot only when content below the fold matters.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job ID"},
+                    "selector": {"type": "string", "description": "Optional CSS selector (e.g. '[role=dialog]'): capture only that element, such as a small popup or filter panel. Omit for the full viewport."},
+                },
+                "required": ["job_id"],
+            },
+        },
+        {
+            "name": "take_full_page_screenshot",
+            "description": "Capture a JPEG screenshot of the ENTIRE scrollable page, including content below the fold. Slower than take_screenshot — use only for long pages whose lower content must be documented.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["job_id"],
+            },
+        },
+        {
+            "name": "go_back",
+            "description": "Go back to the previous page, like the browser back button. Prefer this over navigate_to_url to return to a list after a detail view — single-page apps switch routes without reloading.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["job_id"],
+            },
+        },
+        {
+            "name": "type_text",
+            "description": "Type text into an input field identified by CSS selector. Use this to fill in forms, search boxes, login fields, etc.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "selector": {"type": "string", "description": "CSS selector for the input field"},
+                    "text": {"type": "string", "description": "The text to type into the field"},
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["selector", "text", "job_id"],
+            },
+        },
+        {
+            "name": "click_element",
+            "description": "Click an element by CSS selector. Returns new page state after click.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "selector": {"type": "string", "description": "CSS selector or Playwright selector for the element to click"},
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["selector", "job_id"],
+            },
+        },
+        {
+            "name": "list_interactive_elements",
+            "description": "List all clickable elements on the current page with their selectors and text.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["job_id"],
+            },
+        },
+        {
+            "name": "wait_seconds",
+            "description": "Wait for a few seconds (e.g. 2–3) to let the page load. Use after clicking Continue/Next so the OTP screen appears before typing the code.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "seconds": {"type": "number", "description": "Seconds to wait (1–10)"},
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["seconds", "job_id"],
+            },
+        },
+        {
+            "name": "get_page_content",
+            "description": "Get the salient visible text of the current page (headings, labels, start and end of the page), truncated to ~6 KB.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["job_id"],
+            },
+        },
+        {
+            "name": "start_recording",
+            "description": "Start video recording. Call this AFTER login and navigation to the target page. Creates a clean recording context — login screens are excluded from the video.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["job_id"],
+            },
+        },
+        {
+            "name": "stop_recording",
+            "description": "Stop recording and close the browser session. Returns the video file path.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["job_id"],
+            },
+        },
+        {
+            "name": "scroll_page",
+            "description": "Scroll the page up or down by a specified number of pixels. Use to reveal content below the fold or return to the top.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "direction": {
+                        "type": "string",
+                        "enum": ["up", "down"],
+                        "description": "Scroll direction: 'up' or 'down'",
+                    },
+                    "amount": {
+                        "type": "integer",
+                        "description": "Number of pixels to scroll (e.g. 500 for half a screen, 1000 for a full screen)",
+                    },
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["direction", "amount", "job_id"],
+            },
+        },
+        {
+            "name": "press_key",
+            "description": "Press a keyboard key. Common keys: Enter, Escape, Tab, Backspace, ArrowDown, ArrowUp. Use Escape to dismiss modals/popups, Enter to submit search queries.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "key": {
+                        "type": "string",
+                        "description": "The key to press (e.g. 'Enter', 'Escape', 'Tab', 'ArrowDown')",
+                    },
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["key", "job_id"],
+            },
+        },
+        {
+            "name": "click_by_text",
+            "description": "Click an element by its visible text. More reliable than CSS selectors for dynamic apps (especially Flutter). Falls back to role-based matching if text match fails.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "text": {
+                        "type": "string",
+                        "description": "The visible text of the element to click",
+                    },
+                    "exact": {
+                        "type": "boolean",
+                        "description": "If true, match the text exactly. If false (default), match substring.",
+                    },
+                    "job_id": {"type": "string", "description": "The job ID"},
+                },
+                "required": ["text", "job_id"],
+            },
+        },
+    ]
+})
+
+TOOL_HANDLERS: Final[Mapping[str, Callable[[dict], Awaitable[Any]]]] = MappingProxyType({
+    "login_and_navigate": lambda i: login_and_navigate(
+        i["url"], i["job_id"], i.get("credentials"), i.get("target_section"),
+    ),
+    "navigate_to_url": lambda i: navigate_to_url(i["url"], i["job_id"], i.get("reload", True)),
+    "take_screenshot": lambda i: take_screenshot(i["job_id"], selector=i.get("selector")),
+    "take_full_page_screenshot": lambda i: take_screenshot(i["job_id"], full_page=True),
+    "go_back": lambda i: go_back(i["job_id"]),
+    "type_text": lambda i: type_text(i["selector"], i["text"], i["job_id"]),
+    "click_element": lambda i: click_element(i["selector"], i["job_id"]),
+    "list_interactive_elements": lambda i: list_interactive_elements(i["job_id"]),
+    "wait_seconds": lambda i: wait_seconds(i["seconds"], i["job_id"]),
+    "get_page_content": lambda i: get_page_content(i["job_id"]),
+    "start_recording": lambda i: start_recording(i["job_id"]),
+    "stop_recording": lambda i: stop_recording(i["job_id"]),
+    "scroll_page": lambda i: scroll_page(i["direction"], i["amount"], i["job_id"]),
+    "press_key": lambda i: press_key(i["key"], i["job_id"]),
+    "click_by_text": lambda i: click_by_text(i["text"], i["job_id"], i.get("exact", False)),
+})
+
+
+def tool_schemas(names: Iterable[str]) -> tuple[Mapping[str, Any], ...]:
+    """Return the frozen definitions for names, in the given order."""
+    return tuple(TOOL_SCHEMAS[name] for name in names)
+
+
+async def dispatch_tool(name: str, input: dict) -> str | dict | list:
+    """Call the browser tool registered under name."""
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
+        return {"error": f"Unknown tool: {name}"}
+    return await handler(input)